@@ -49,8 +49,53 @@ class Settings(BaseSettings):
     )
     AZURE_ITERATION_NAME: str = os.getenv("AZURE_ITERATION_NAME", "Iteration2")
     
+    # Predictor backend: "azure" (Custom Vision), "local" (CPU model file) or
+    # "cascade" (local model first, Azure only when the local answer is unsure) or
+    # "router" (latency-aware routing with hedging across ROUTER_BACKENDS)
+    PREDICTOR_BACKEND: str = os.getenv("PREDICTOR_BACKEND", "azure")
+    CASCADE_MIN_CONFIDENCE: float = float(os.getenv("CASCADE_MIN_CONFIDENCE", 0.85))
+    CASCADE_MIN_MARGIN: float = float(os.getenv("CASCADE_MIN_MARGIN", 0.3))
+
+    # Predictor router: backends to route across ("azure", "azure_secondary", "local"),
+    # hedge delay bounds, latency window and circuit breaker
+    # Comma-separated; kept a plain str because pydantic-settings JSON-decodes list fields from the env
+    ROUTER_BACKENDS: str = os.getenv("ROUTER_BACKENDS", "azure,azure_secondary,local")
+    ROUTER_HEDGE_MIN_MS: float = float(os.getenv("ROUTER_HEDGE_MIN_MS", 300))
+    ROUTER_HEDGE_MAX_MS: float = float(os.getenv("ROUTER_HEDGE_MAX_MS", 3000))
+    ROUTER_LATENCY_WINDOW: int = int(os.getenv("ROUTER_LATENCY_WINDOW", 200))
+    ROUTER_BREAKER_FAILURES: int = int(os.getenv("ROUTER_BREAKER_FAILURES", 5))
+    ROUTER_BREAKER_RESET_SECONDS: float = float(os.getenv("ROUTER_BREAKER_RESET_SECONDS", 30))
+
+    # Optional second Azure deployment (another region or iteration) for the router
+    AZURE_SECONDARY_PREDICTION_KEY: str = os.getenv("AZURE_SECONDARY_PREDICTION_KEY", "")
+    AZURE_SECONDARY_ENDPOINT: str = os.getenv("AZURE_SECONDARY_ENDPOINT", "")
+    AZURE_SECONDARY_PROJECT_ID: str = os.getenv("AZURE_SECONDARY_PROJECT_ID", "")
+    AZURE_SECONDARY_ITERATION_NAME: str = os.getenv("AZURE_SECONDARY_ITERATION_NAME", "")
+
+    # Local CPU model settings (.h5/.keras, .tflite or .onnx)
+    LOCAL_MODEL_PATH: str = os.getenv("LOCAL_MODEL_PATH", os.getenv("MODEL_PATH", "./models/maize_disease_cnn.h5"))
+    LOCAL_MODEL_INPUT_SIZE: int = int(os.getenv("LOCAL_MODEL_INPUT_SIZE", 224))
+    LOCAL_MODEL_RESCALE: bool = os.getenv("LOCAL_MODEL_RESCALE", "True").lower() == "true"
+    LOCAL_INTRA_OP_THREADS: int = int(os.getenv("LOCAL_INTRA_OP_THREADS", 0))  # 0 = runtime default
+    LOCAL_INTER_OP_THREADS: int = int(os.getenv("LOCAL_INTER_OP_THREADS", 0))
+
+    # Micro-batching of concurrent requests for the local model
+    MICROBATCH_ENABLED: bool = os.getenv("MICROBATCH_ENABLED", "True").lower() == "true"
+    MICROBATCH_MAX_SIZE: int = int(os.getenv("MICROBATCH_MAX_SIZE", 16))
+    MICROBATCH_MAX_WAIT_MS: float = float(os.getenv("MICROBATCH_MAX_WAIT_MS", 10))
+
     # NASA Satellite API settings
     NASA_API_KEY: str = os.getenv("NASA_API_KEY", "")
+    NASA_TIMEOUT_SECONDS: float = float(os.getenv("NASA_TIMEOUT_SECONDS", 10))
+    NASA_MAX_CONNECTIONS: int = int(os.getenv("NASA_MAX_CONNECTIONS", 20))
+    # Requests are made for the centre of a NASA_TILE_RESOLUTION-degree tile, so nearby points share them
+    NASA_TILE_RESOLUTION: float = float(os.getenv("NASA_TILE_RESOLUTION", 0.05))
+    NASA_ASSETS_CACHE_MAX_ENTRIES: int = int(os.getenv("NASA_ASSETS_CACHE_MAX_ENTRIES", 4096))
+    NASA_ASSETS_CACHE_TTL_SECONDS: int = int(os.getenv("NASA_ASSETS_CACHE_TTL_SECONDS", 6 * 3600))
+    # Proxied satellite images are kept on disk, least recently used evicted first
+    SATELLITE_IMAGE_CACHE_DIR: str = os.getenv("SATELLITE_IMAGE_CACHE_DIR", "satellite_cache")
+    SATELLITE_IMAGE_CACHE_MAX_BYTES: int = int(os.getenv("SATELLITE_IMAGE_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+    SATELLITE_IMAGE_MAX_AGE_SECONDS: int = int(os.getenv("SATELLITE_IMAGE_MAX_AGE_SECONDS", 24 * 3600))
 
     # Known class names (for reference / fallback display)
     CLASS_NAMES: List[str] = [
@@ -72,7 +117,90 @@ class Settings(BaseSettings):
     # Weather API settings
     WEATHER_API_KEY: str = os.getenv("WEATHER_API_KEY", "")
     WEATHER_API_URL: str = "https://api.open-meteo.com/v1/forecast"
-    
+
+    # In-process weather cache keyed on a snapped grid cell (degrees)
+    WEATHER_GRID_RESOLUTION: float = float(os.getenv("WEATHER_GRID_RESOLUTION", 0.05))
+    WEATHER_CACHE_MAX_ENTRIES: int = int(os.getenv("WEATHER_CACHE_MAX_ENTRIES", 10000))
+    WEATHER_CACHE_TTL_SECONDS: int = int(os.getenv("WEATHER_CACHE_TTL_SECONDS", 1800))
+
+    # Background weather refresh for registered farms (batched multi-location calls)
+    WEATHER_PREFETCH_ENABLED: bool = os.getenv("WEATHER_PREFETCH_ENABLED", "True").lower() == "true"
+    WEATHER_PREFETCH_INTERVAL_SECONDS: int = int(os.getenv("WEATHER_PREFETCH_INTERVAL_SECONDS", 900))
+    WEATHER_PREFETCH_BATCH_SIZE: int = int(os.getenv("WEATHER_PREFETCH_BATCH_SIZE", 50))
+
+    # /api/weather/bulk: locations accepted per request, and grid cells per Open-Meteo call
+    WEATHER_BULK_MAX_LOCATIONS: int = int(os.getenv("WEATHER_BULK_MAX_LOCATIONS", 5000))
+    WEATHER_BULK_CHUNK_SIZE: int = int(os.getenv("WEATHER_BULK_CHUNK_SIZE", 100))
+
+    # Offline reverse geocoding (GeoNames citiesNNN.txt); Nominatim is only a fallback
+    GEONAMES_PATH: str = os.getenv("GEONAMES_PATH", "./data/cities500.txt")
+    GEOCODER_MAX_DISTANCE_KM: float = float(os.getenv("GEOCODER_MAX_DISTANCE_KM", 50))
+    NOMINATIM_FALLBACK: bool = os.getenv("NOMINATIM_FALLBACK", "True").lower() == "true"
+
+    # SQLite storage (WAL mode; pooled read connections plus one writer)
+    DATABASE_PATH: str = os.getenv("DATABASE_PATH", "maize_health.db")
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", 8))
+    DB_SYNCHRONOUS: str = os.getenv("DB_SYNCHRONOUS", "NORMAL")
+    DB_MMAP_SIZE: int = int(os.getenv("DB_MMAP_SIZE", 256 * 1024 * 1024))
+    DB_CACHE_SIZE_KB: int = int(os.getenv("DB_CACHE_SIZE_KB", 16 * 1024))
+
+    # Write-behind scan persistence: flush every N rows or T ms, with a bounded queue
+    SCAN_WRITE_BEHIND_ENABLED: bool = os.getenv("SCAN_WRITE_BEHIND_ENABLED", "True").lower() == "true"
+    SCAN_FLUSH_MAX_ROWS: int = int(os.getenv("SCAN_FLUSH_MAX_ROWS", 100))
+    SCAN_FLUSH_MAX_DELAY_MS: int = int(os.getenv("SCAN_FLUSH_MAX_DELAY_MS", 250))
+    SCAN_QUEUE_MAX_PENDING: int = int(os.getenv("SCAN_QUEUE_MAX_PENDING", 10000))
+    SCAN_ENQUEUE_TIMEOUT_SECONDS: float = float(os.getenv("SCAN_ENQUEUE_TIMEOUT_SECONDS", 5))
+
+    # Map viewport queries: zoom levels up to MAP_CLUSTER_MAX_ZOOM get server-side clusters
+    MAP_CLUSTER_MAX_ZOOM: int = int(os.getenv("MAP_CLUSTER_MAX_ZOOM", 10))
+    MAP_CLUSTER_CELLS_PER_TILE: int = int(os.getenv("MAP_CLUSTER_CELLS_PER_TILE", 4))
+    MAP_MAX_POINTS: int = int(os.getenv("MAP_MAX_POINTS", 2000))
+
+    # Hot/cold partitioning: scans older than ARCHIVE_HOT_MONTHS months move to monthly SQLite files
+    ARCHIVE_DIR: str = os.getenv("ARCHIVE_DIR", "scans_archive")
+    ARCHIVE_ENABLED: bool = os.getenv("ARCHIVE_ENABLED", "False").lower() == "true"
+    ARCHIVE_HOT_MONTHS: int = int(os.getenv("ARCHIVE_HOT_MONTHS", 12))
+    ARCHIVE_INTERVAL_SECONDS: int = int(os.getenv("ARCHIVE_INTERVAL_SECONDS", 86400))
+
+    # Scans read per keyset page while streaming /api/history/export
+    EXPORT_PAGE_SIZE: int = int(os.getenv("EXPORT_PAGE_SIZE", 1000))
+
+    # Incidence rollups: geohash precision of stored cells (5 ~ 4.9 km x 4.9 km)
+    ROLLUP_GEOHASH_PRECISION: int = int(os.getenv("ROLLUP_GEOHASH_PRECISION", 5))
+
+    # Grid cell size (degrees) of the in-memory farm boundary index used to tag scans
+    FARM_INDEX_CELL_SIZE: float = float(os.getenv("FARM_INDEX_CELL_SIZE", 0.05))
+    # Largest accepted farm boundary, in degrees of latitude or longitude
+    FARM_MAX_SPAN_DEGREES: float = float(os.getenv("FARM_MAX_SPAN_DEGREES", 1.0))
+
+    # Blocking-call executor (Azure SDK, weather HTTP, SQLite) settings
+    BLOCKING_MAX_WORKERS: int = int(os.getenv("BLOCKING_MAX_WORKERS", 32))
+    BLOCKING_MAX_QUEUE: int = int(os.getenv("BLOCKING_MAX_QUEUE", 256))
+
+    # Per-branch deadlines inside /api/disease/predict (seconds)
+    PREDICTION_DEADLINE_SECONDS: float = float(os.getenv("PREDICTION_DEADLINE_SECONDS", 30))
+    WEATHER_DEADLINE_SECONDS: float = float(os.getenv("WEATHER_DEADLINE_SECONDS", 3))
+
+    # Content-addressed prediction cache (in-memory LRU + SQLite tier)
+    PREDICTION_CACHE_ENABLED: bool = os.getenv("PREDICTION_CACHE_ENABLED", "True").lower() == "true"
+    PREDICTION_CACHE_MAX_ENTRIES: int = int(os.getenv("PREDICTION_CACHE_MAX_ENTRIES", 2048))
+    PREDICTION_CACHE_MAX_ROWS: int = int(os.getenv("PREDICTION_CACHE_MAX_ROWS", 100000))
+    PREDICTION_CACHE_TTL_SECONDS: int = int(os.getenv("PREDICTION_CACHE_TTL_SECONDS", 30 * 24 * 3600))
+
+    # Image normalisation before classification (longest side in px, JPEG quality)
+    PREPROCESS_ENABLED: bool = os.getenv("PREPROCESS_ENABLED", "True").lower() == "true"
+    PREPROCESS_MAX_SIDE: int = int(os.getenv("PREPROCESS_MAX_SIDE", 512))
+    PREPROCESS_JPEG_QUALITY: int = int(os.getenv("PREPROCESS_JPEG_QUALITY", 90))
+
+    # Perceptual-hash near-duplicate lookup (max Hamming distance out of 64 bits)
+    PHASH_DEDUP_ENABLED: bool = os.getenv("PHASH_DEDUP_ENABLED", "True").lower() == "true"
+    PHASH_MAX_DISTANCE: int = int(os.getenv("PHASH_MAX_DISTANCE", 6))
+    PHASH_MAX_ROWS: int = int(os.getenv("PHASH_MAX_ROWS", 100000))
+    PHASH_TTL_SECONDS: int = int(os.getenv("PHASH_TTL_SECONDS", 30 * 24 * 3600))
+
+    # Max images classified at once by /api/disease/batch-predict
+    BATCH_CONCURRENCY: int = int(os.getenv("BATCH_CONCURRENCY", 8))
+
     class Config:
         env_file = ".env"
         case_sensitive = True
@@ -0,0 +1,76 @@
+"""Disease-incidence analytics served from the rollup tables"""
+
+from fastapi import APIRouter, HTTPException, Query
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional, Tuple
+import logging
+
+from app.config import settings
+from app.utils.database import db
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+
+def _day_range(since: Optional[date], until: Optional[date], days: int) -> Tuple[str, str]:
+    """Inclusive (since, until) days; defaults to the last `days` days up to today (UTC)."""
+    until = until or datetime.now(timezone.utc).date()
+    since = since or until - timedelta(days=days - 1)
+    if since > until:
+        raise HTTPException(status_code=400, detail="since must not be after until")
+    return since.isoformat(), until.isoformat()
+
+
+@router.get("/trend")
+async def get_incidence_trend(
+    since: Optional[date] = None,
+    until: Optional[date] = None,
+    days: int = Query(30, ge=1, le=366),
+    farmer_id: Optional[str] = None,
+    geohash: Optional[str] = Query(None, min_length=1, max_length=12),
+    prediction: Optional[str] = None
+):
+    """Daily scan counts per disease, globally, for one farmer or for one geohash area"""
+    if farmer_id and geohash:
+        raise HTTPException(status_code=400, detail="Filter by farmer_id or geohash, not both")
+    since_day, until_day = _day_range(since, until, days)
+    try:
+        trend = await db.aio.get_incidence_trend(
+            since_day, until_day, farmer_id=farmer_id, geohash=geohash, prediction=prediction
+        )
+        return {"status": "ok", "since": since_day, "until": until_day, "data": trend}
+    except Exception as e:
+        logger.error(f"Error fetching incidence trend: {e}")
+        raise HTTPException(status_code=500, detail="Failed to fetch incidence trend")
+
+
+@router.get("/heatmap")
+async def get_incidence_heatmap(
+    since: Optional[date] = None,
+    until: Optional[date] = None,
+    days: int = Query(30, ge=1, le=366),
+    precision: int = Query(4, ge=1, le=settings.ROLLUP_GEOHASH_PRECISION),
+    prediction: Optional[str] = None,
+    min_lat: Optional[float] = Query(None, ge=-90, le=90),
+    min_lon: Optional[float] = Query(None, ge=-180, le=180),
+    max_lat: Optional[float] = Query(None, ge=-90, le=90),
+    max_lon: Optional[float] = Query(None, ge=-180, le=180)
+):
+    """Scan counts per geohash cell (with per-disease breakdown), optionally within a bbox"""
+    corners = (min_lat, min_lon, max_lat, max_lon)
+    bbox = None
+    if any(value is not None for value in corners):
+        if any(value is None for value in corners):
+            raise HTTPException(status_code=400, detail="min_lat, min_lon, max_lat and max_lon must be given together")
+        if min_lat > max_lat or min_lon > max_lon:
+            raise HTTPException(status_code=400, detail="min_lat/min_lon must not exceed max_lat/max_lon")
+        bbox = corners
+
+    since_day, until_day = _day_range(since, until, days)
+    try:
+        cells = await db.aio.get_incidence_heatmap(since_day, until_day, precision, prediction=prediction, bbox=bbox)
+    except Exception as e:
+        logger.error(f"Error fetching incidence heatmap: {e}")
+        raise HTTPException(status_code=500, detail="Failed to fetch incidence heatmap")
+
+    return {"status": "ok", "since": since_day, "until": until_day, "precision": precision, "count": len(cells), "data": cells}
@@ -1,14 +1,18 @@
 """Disease detection router endpoints – powered by Azure Custom Vision"""
 
 from fastapi import APIRouter, File, UploadFile, HTTPException, Form, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, Dict
+import asyncio
+import json
 import logging
 
 from app.config import settings
-from app.utils.model_loader import validate_image
+from app.utils.model_loader import inspect_image
 from app.utils.weather_helper import fetch_current_weather
 from app.utils.database import db
+from app.utils.executor import blocking_executor, ExecutorSaturatedError
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -20,7 +24,86 @@ class PredictionResponse(BaseModel):
     confidence: float
     all_predictions: Dict[str, float]
     message: str = "Prediction successful"
+    stage: Optional[str] = None
+    backend: Optional[str] = None
+    hedged: Optional[bool] = None
+    cached: bool = False
+    near_duplicate: bool = False
+    near_duplicate_distance: Optional[int] = None
+    preprocessing: Optional[Dict] = None
     weather: Optional[Dict] = None
+    weather_skipped: bool = False
+
+
+def _check_file_size(file_bytes: bytes):
+    """Reject uploads over MAX_FILE_SIZE before they are decoded."""
+    if len(file_bytes) > settings.MAX_FILE_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"File too large. Max size: {settings.MAX_FILE_SIZE / 1024 / 1024:.0f}MB"
+        )
+
+
+def _inspect_upload(file_bytes: bytes) -> Optional[Dict]:
+    """Validate, hash and (if enabled) normalise an upload in a single decode."""
+    return inspect_image(
+        file_bytes,
+        normalize_max_side=settings.PREPROCESS_MAX_SIDE if settings.PREPROCESS_ENABLED else None,
+        jpeg_quality=settings.PREPROCESS_JPEG_QUALITY,
+    )
+
+
+async def _fetch_weather_with_deadline(latitude: float, longitude: float) -> Optional[Dict]:
+    """Weather/geocode branch of predict, bounded by WEATHER_DEADLINE_SECONDS."""
+    return await asyncio.wait_for(
+        blocking_executor.run(fetch_current_weather, latitude, longitude),
+        timeout=settings.WEATHER_DEADLINE_SECONDS
+    )
+
+
+def _classify_or_reuse(predictor, phash_index, file_bytes: bytes, phash: Optional[int]) -> Dict:
+    """
+    Return the cached prediction for byte-identical bytes, else the earlier
+    prediction of a near-duplicate upload if the perceptual hash index has
+    one; otherwise classify the image and index its hash.
+    """
+    # Exact-bytes cache first (CachedPredictor), so identical re-uploads report cached=True
+    lookup = getattr(predictor, "lookup", None)
+    if lookup is not None:
+        result = lookup(file_bytes)
+        if result is not None:
+            return result
+
+    if phash_index is not None and phash is not None:
+        result = phash_index.find(phash)
+        if result is not None:
+            return result
+
+    classify = getattr(predictor, "classify_and_cache", predictor.classify_image_bytes)
+    result = classify(file_bytes)
+
+    if phash_index is not None and phash is not None and not result.get("cached"):
+        phash_index.add(phash, result)
+    return result
+
+
+async def _classify_with_deadline(request: Request, predictor, file_bytes: bytes, phash: Optional[int]) -> Dict:
+    """Azure branch of predict, bounded by PREDICTION_DEADLINE_SECONDS."""
+    phash_index = getattr(request.app, "phash_index", None)
+    try:
+        return await asyncio.wait_for(
+            blocking_executor.run(_classify_or_reuse, predictor, phash_index, file_bytes, phash),
+            timeout=settings.PREDICTION_DEADLINE_SECONDS
+        )
+    except ExecutorSaturatedError as e:
+        logger.warning(f"Rejecting prediction, executor saturated: {e}")
+        raise HTTPException(status_code=503, detail="Server is busy. Please retry shortly.")
+    except asyncio.TimeoutError:
+        logger.error(f"Azure prediction timed out after {settings.PREDICTION_DEADLINE_SECONDS}s")
+        raise HTTPException(status_code=504, detail="Azure prediction timed out")
+    except Exception as e:
+        logger.error(f"Azure prediction error: {e}")
+        raise HTTPException(status_code=502, detail=f"Azure prediction failed: {e}")
 
 
 @router.post("/predict", response_model=PredictionResponse)
@@ -55,21 +138,21 @@ async def predict(
     file_bytes = await file.read()
 
     # --- Validate file size ---
-    if len(file_bytes) > settings.MAX_FILE_SIZE:
-        raise HTTPException(
-            status_code=400,
-            detail=f"File too large. Max size: {settings.MAX_FILE_SIZE / 1024 / 1024:.0f}MB"
-        )
+    _check_file_size(file_bytes)
 
-    # --- Validate image integrity ---
+    # --- Validate image integrity (and compute its perceptual hash) ---
     try:
-        if not validate_image(file_bytes):
+        image_info = await blocking_executor.run(_inspect_upload, file_bytes)
+        if image_info is None:
             raise HTTPException(
                 status_code=400,
                 detail="The uploaded file is not a valid or supported image (JPEG, PNG, etc.)."
             )
     except HTTPException:
         raise
+    except ExecutorSaturatedError as e:
+        logger.warning(f"Rejecting upload, executor saturated: {e}")
+        raise HTTPException(status_code=503, detail="Server is busy. Please retry shortly.")
     except Exception as e:
         logger.error(f"Image validation error: {e}")
         raise HTTPException(
@@ -87,26 +170,44 @@ async def predict(
 
     logger.info(f"Processing image via Azure Custom Vision: {file.filename}")
 
-    # --- Optional weather fetch ---
-    weather_info = None
+    # --- Start the optional weather branch alongside the Azure call ---
+    weather_task = None
     if latitude is not None and longitude is not None:
-        try:
-            weather_info = fetch_current_weather(latitude, longitude)
-        except Exception as e:
-            logger.error(f"Weather fetch error: {e}")
+        weather_task = asyncio.create_task(_fetch_weather_with_deadline(latitude, longitude))
 
     # --- Azure prediction ---
     try:
-        result = predictor.classify_image_bytes(file_bytes)
-    except Exception as e:
-        logger.error(f"Azure prediction error: {e}")
-        raise HTTPException(status_code=502, detail=f"Azure prediction failed: {e}")
+        result = await _classify_with_deadline(
+            request, predictor, image_info["image_bytes"], image_info["phash"]
+        )
+    except BaseException:
+        # Don't leave the weather branch running for a request that already failed
+        if weather_task is not None:
+            weather_task.cancel()
+        raise
+
+    # --- Collect weather (never holds the prediction past its deadline) ---
+    weather_info = None
+    weather_skipped = False
+    if weather_task is not None:
+        try:
+            weather_info = await weather_task
+        except asyncio.TimeoutError:
+            weather_skipped = True
+            logger.warning(f"Weather fetch skipped: exceeded {settings.WEATHER_DEADLINE_SECONDS}s deadline")
+        except ExecutorSaturatedError as e:
+            weather_skipped = True
+            logger.warning(f"Weather fetch skipped, executor saturated: {e}")
+        except Exception as e:
+            logger.error(f"Weather fetch error: {e}")
 
     # --- Success - Persist and Respond ---
-    # Save to scan history (if coordinates provided)
+    # Save to scan history (if coordinates provided); queued for a grouped commit when write-behind is on
     if latitude is not None and longitude is not None:
+        scan_writer = getattr(request.app, "scan_writer", None)
+        save_scan = scan_writer.enqueue if scan_writer is not None else db.aio.save_scan
         try:
-            db.save_scan(
+            await save_scan(
                 farmer_id=farmer_id,
                 latitude=latitude,
                 longitude=longitude,
@@ -115,14 +216,16 @@ async def predict(
                 all_predictions=result["all_predictions"],
                 weather_data=weather_info
             )
-            logger.info(f"Scan persisted for farmer: {farmer_id}")
+            logger.info(f"Scan {'queued' if scan_writer is not None else 'persisted'} for farmer: {farmer_id}")
         except Exception as e:
             logger.error(f"Failed to persist scan history: {e}")
 
     return {
         **result,
         "message": "Prediction successful",
-        "weather": weather_info
+        "preprocessing": image_info["preprocessing"],
+        "weather": weather_info,
+        "weather_skipped": weather_skipped
     }
 
 
@@ -131,11 +234,15 @@ async def batch_predict(request: Request, files: list[UploadFile] = File(...)):
     """
     Predict multiple leaf images at once using Azure Custom Vision.
 
+    Images are classified concurrently (up to BATCH_CONCURRENCY at a time) and
+    each result is streamed back as one NDJSON line as soon as it finishes, so
+    lines arrive in completion order; use "index" to map them to the uploads.
+
     Args:
         files: List of image files to analyse
 
     Returns:
-        List of prediction results
+        NDJSON stream of per-file prediction results or errors
     """
     predictor = getattr(request.app, "predictor", None)
     if predictor is None:
@@ -144,23 +251,47 @@ async def batch_predict(request: Request, files: list[UploadFile] = File(...)):
             detail="Azure Custom Vision predictor is not available."
         )
 
-    results = []
-    for file in files:
-        try:
-            file_bytes = await file.read()
+    # Read the uploads up front: the multipart form is closed once the handler returns
+    uploads = [(file.filename, await file.read()) for file in files]
+    semaphore = asyncio.Semaphore(settings.BATCH_CONCURRENCY)
 
-            if not validate_image(file_bytes):
-                results.append({"filename": file.filename, "error": "Invalid image"})
-                continue
+    async def _process(index: int, filename: str, file_bytes: bytes) -> Dict:
+        async with semaphore:
+            try:
+                _check_file_size(file_bytes)
+                image_info = await blocking_executor.run(_inspect_upload, file_bytes)
+                if image_info is None:
+                    return {"index": index, "filename": filename, "error": "Invalid image", "status_code": 400}
 
-            result = predictor.classify_image_bytes(file_bytes)
-            results.append({"filename": file.filename, **result})
+                # Same deadline and 503/504/502 mapping as /predict, reported per file
+                result = await _classify_with_deadline(
+                    request, predictor, image_info["image_bytes"], image_info["phash"]
+                )
+                return {"index": index, "filename": filename, **result}
 
-        except Exception as e:
-            logger.error(f"Error processing {file.filename}: {e}")
-            results.append({"filename": file.filename, "error": str(e)})
+            except HTTPException as e:
+                return {"index": index, "filename": filename, "error": e.detail, "status_code": e.status_code}
+            except ExecutorSaturatedError as e:
+                logger.warning(f"Rejecting {filename}, executor saturated: {e}")
+                return {"index": index, "filename": filename, "error": "Server is busy. Please retry shortly.", "status_code": 503}
+            except Exception as e:
+                logger.error(f"Error processing {filename}: {e}")
+                return {"index": index, "filename": filename, "error": str(e), "status_code": 500}
+
+    async def _stream():
+        tasks = [
+            asyncio.create_task(_process(index, filename, file_bytes))
+            for index, (filename, file_bytes) in enumerate(uploads)
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield json.dumps(await next_done) + "\n"
+        finally:
+            # Client went away mid-stream: stop the remaining work
+            for task in tasks:
+                task.cancel()
 
-    return {"results": results}
+    return StreamingResponse(_stream(), media_type="application/x-ndjson")
 
 
 @router.get("/classes")
@@ -1,35 +1,225 @@
 from fastapi import APIRouter, Request, HTTPException, Query
+from fastapi.responses import Response, StreamingResponse
+from datetime import datetime, timezone
 from typing import List, Optional, Dict
+from app.config import settings
 from app.utils.database import db
-from app.utils.satellite import nasa_client
+from app.utils.executor import blocking_executor
+from app.utils.export import ENCODERS
+from app.utils.serialization import PreEncodedJSONResponse, dumps, dumps_with_raw, json_array
+from app.utils.satellite import image_etag, nasa_client
 import logging
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+def _db_timestamp(value: Optional[datetime]) -> Optional[str]:
+    """Format a query datetime like scans.timestamp (UTC, 'YYYY-MM-DD HH:MM:SS')."""
+    if value is None:
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.strftime("%Y-%m-%d %H:%M:%S")
+
 @router.get("/scans")
-async def get_scan_history(farmer_id: Optional[str] = None, limit: int = 50):
-    """Fetch scan history for a specific farmer or global results."""
+async def get_scan_history(
+    farmer_id: Optional[str] = None,
+    farm_id: Optional[int] = None,
+    prediction: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    top_k: Optional[int] = Query(None, ge=1)
+):
+    """
+    Fetch scan history (newest first) for a specific farmer or global results.
+    Pass the returned next_cursor as `cursor` to get the following page, and
+    top_k to return only the k most likely classes per scan.
+    """
     try:
-        history = db.get_history(farmer_id=farmer_id, limit=limit)
-        return {"status": "ok", "count": len(history), "data": history}
+        history, next_cursor = await db.aio.get_history_page(
+            farmer_id=farmer_id,
+            farm_id=farm_id,
+            prediction=prediction,
+            since=_db_timestamp(since),
+            until=_db_timestamp(until),
+            cursor=cursor,
+            limit=limit,
+            top_k=top_k,
+            raw_weather=True,
+        )
+        # weather_data is spliced in as stored, so it is never parsed and re-encoded
+        rows = json_array(dumps_with_raw(row, {"weather_data": row.pop("weather_data")}) for row in history)
+        body = (
+            b'{"status":"ok","count":' + dumps(len(history))
+            + b',"next_cursor":' + dumps(next_cursor)
+            + b',"data":' + rows + b"}"
+        )
+        return PreEncodedJSONResponse(content=body)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error fetching history: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch scan history")
 
+@router.get("/export")
+async def export_scan_history(
+    format: str = Query("ndjson", pattern="^(ndjson|csv|parquet)$"),
+    farmer_id: Optional[str] = None,
+    farm_id: Optional[int] = None,
+    prediction: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    min_lat: Optional[float] = Query(None, ge=-90, le=90),
+    min_lon: Optional[float] = Query(None, ge=-180, le=180),
+    max_lat: Optional[float] = Query(None, ge=-90, le=90),
+    max_lon: Optional[float] = Query(None, ge=-180, le=180)
+):
+    """
+    Stream the full (filtered) scan history, newest first, as NDJSON, CSV or
+    Parquet. Rows are read EXPORT_PAGE_SIZE at a time with the history keyset
+    cursor and encoded as they arrive, so memory use does not grow with the export.
+    """
+    corners = (min_lat, min_lon, max_lat, max_lon)
+    bbox = None
+    if any(value is not None for value in corners):
+        if any(value is None for value in corners):
+            raise HTTPException(status_code=400, detail="min_lat, min_lon, max_lat and max_lon must be given together")
+        if min_lat > max_lat or min_lon > max_lon:
+            raise HTTPException(status_code=400, detail="min_lat/min_lon must not exceed max_lat/max_lon")
+        bbox = corners
+
+    try:
+        encoder = ENCODERS[format]()
+    except RuntimeError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+
+    filters = dict(
+        farmer_id=farmer_id,
+        farm_id=farm_id,
+        prediction=prediction,
+        since=_db_timestamp(since),
+        until=_db_timestamp(until),
+        bbox=bbox,
+    )
+
+    async def _stream():
+        yield encoder.header()
+        cursor = None
+        while True:
+            rows, cursor = await db.aio.get_history_page(
+                cursor=cursor, limit=settings.EXPORT_PAGE_SIZE, raw_weather=True, **filters
+            )
+            if rows:
+                yield await blocking_executor.run(encoder.encode, rows)
+            if cursor is None:
+                break
+        yield encoder.close()
+
+    filename = f"scans-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}.{encoder.extension}"
+    return StreamingResponse(
+        _stream(),
+        media_type=encoder.media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@router.get("/scans/bbox")
+async def get_scans_in_bbox(
+    min_lat: float = Query(..., ge=-90, le=90),
+    min_lon: float = Query(..., ge=-180, le=180),
+    max_lat: float = Query(..., ge=-90, le=90),
+    max_lon: float = Query(..., ge=-180, le=180),
+    zoom: int = Query(12, ge=0, le=22),
+    farmer_id: Optional[str] = None,
+    prediction: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = Query(settings.MAP_MAX_POINTS, ge=1, le=settings.MAP_MAX_POINTS)
+):
+    """
+    Scans inside a map viewport. At zoom levels up to MAP_CLUSTER_MAX_ZOOM the
+    scans are aggregated server-side into clusters with per-disease counts;
+    closer in, individual points are returned (newest first, up to `limit`).
+    """
+    if min_lat > max_lat or min_lon > max_lon:
+        raise HTTPException(status_code=400, detail="min_lat/min_lon must not exceed max_lat/max_lon")
+
+    filters = dict(
+        farmer_id=farmer_id,
+        prediction=prediction,
+        since=_db_timestamp(since),
+        until=_db_timestamp(until),
+    )
+    try:
+        if zoom <= settings.MAP_CLUSTER_MAX_ZOOM:
+            # A 256px web-mercator tile spans 360 / 2^zoom degrees of longitude
+            cell_size = 360.0 / (2 ** zoom) / settings.MAP_CLUSTER_CELLS_PER_TILE
+            clusters = await db.aio.get_scan_clusters(min_lat, min_lon, max_lat, max_lon, cell_size, **filters)
+            return {"status": "ok", "mode": "clusters", "cell_size": cell_size, "count": len(clusters), "data": clusters}
+
+        points, truncated = await db.aio.get_scans_in_bbox(min_lat, min_lon, max_lat, max_lon, limit=limit, **filters)
+        return {"status": "ok", "mode": "points", "count": len(points), "truncated": truncated, "data": points}
+    except Exception as e:
+        logger.error(f"Error fetching scans in bbox: {e}")
+        raise HTTPException(status_code=500, detail="Failed to fetch scans for map")
+
+_DATE_PATTERN = r"^\d{4}-\d{2}-\d{2}$"
+
 @router.get("/satellite/assets")
-async def get_satellite_info(lat: float, lon: float, date: Optional[str] = None):
+async def get_satellite_info(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    date: Optional[str] = Query(None, pattern=_DATE_PATTERN)
+):
     """Get metadata about NASA satellite imagery available for a location."""
-    info = nasa_client.get_asset_info(lat, lon, date)
+    info = await nasa_client.get_asset_info(lat, lon, date)
     if not info:
         raise HTTPException(status_code=404, detail="No satellite assets found for this location/date")
     return {"status": "ok", "data": info}
 
 @router.get("/satellite/image-url")
-async def get_satellite_image_url(lat: float, lon: float, date: Optional[str] = None):
-    """Retrieve the URL for a NASA Earth Observatory satellite image."""
-    url = nasa_client.get_imagery_url(lat, lon, date)
-    return {"status": "ok", "url": url}
+async def get_satellite_image_url(
+    request: Request,
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    date: Optional[str] = Query(None, pattern=_DATE_PATTERN)
+):
+    """URL of the cached satellite image proxy for a location (no API key in it)."""
+    params = {"lat": lat, "lon": lon}
+    if date:
+        params["date"] = date
+    url = request.url_for("get_satellite_image").include_query_params(**params)
+    return {"status": "ok", "url": str(url)}
+
+@router.get("/satellite/image")
+async def get_satellite_image(
+    request: Request,
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    date: Optional[str] = Query(None, pattern=_DATE_PATTERN)
+):
+    """
+    NASA satellite image for a location, served from the on-disk image cache
+    (downloaded once per tile and capture date). Dated images are immutable;
+    without a date the latest capture is returned and may change.
+    """
+    captured = await nasa_client.image_date(lat, lon, date)
+    if captured is None:
+        raise HTTPException(status_code=404, detail="No satellite image found for this location/date")
+
+    max_age = settings.SATELLITE_IMAGE_MAX_AGE_SECONDS
+    cache_control = f"public, max-age={max_age}, immutable" if date else \
+        f"public, max-age={min(max_age, settings.NASA_ASSETS_CACHE_TTL_SECONDS)}"
+    # The ETag depends only on the file name, so revalidations never read the image
+    headers = {"Cache-Control": cache_control, "ETag": image_etag(nasa_client.image_name(lat, lon, captured))}
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+
+    image = await nasa_client.get_image(lat, lon, captured)
+    if image is None:
+        raise HTTPException(status_code=404, detail="No satellite image found for this location/date")
+    return Response(content=image[0], media_type="image/png", headers=headers)
 
 @router.post("/farms")
 async def save_farm_boundary(request: Request):
@@ -43,11 +233,15 @@ async def save_farm_boundary(request: Request):
         if not farmer_id or not boundary:
             raise HTTPException(status_code=400, detail="farmer_id and boundary are required")
             
-        success = db.save_farm(farmer_id, farm_name, boundary)
+        success = await db.aio.save_farm(farmer_id, farm_name, boundary)
         if success:
             return {"status": "ok", "message": "Farm boundary saved"}
         else:
             raise HTTPException(status_code=500, detail="Failed to save farm boundary")
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error saving farm: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -55,5 +249,17 @@ async def save_farm_boundary(request: Request):
 @router.get("/farms/{farmer_id}")
 async def get_farms(farmer_id: str):
     """Retrieve all farm boundaries for a farmer."""
-    farms = db.get_farms(farmer_id)
+    farms = await db.aio.get_farms(farmer_id)
     return {"status": "ok", "data": farms}
+
+@router.get("/farms/{farm_id}/summary")
+async def get_farm_summary(
+    farm_id: int,
+    since: Optional[datetime] = None,
+    latest: int = Query(10, ge=0, le=100)
+):
+    """Disease distribution and latest scans for one farm (id as returned by GET /farms/{farmer_id})."""
+    summary = await db.aio.get_farm_summary(farm_id, since=_db_timestamp(since), latest=latest)
+    if summary is None:
+        raise HTTPException(status_code=404, detail="Farm not found")
+    return {"status": "ok", "data": summary}
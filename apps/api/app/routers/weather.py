@@ -1,19 +1,38 @@
 """Weather router endpoints"""
 
 from fastapi import APIRouter, HTTPException, Query
-from typing import Optional, Dict, Any
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from typing import Optional, Dict, Any, List, Tuple
+import asyncio
+import json
 import logging
 
-from app.utils.weather_helper import fetch_current_weather
+from app.config import settings
+from app.utils.geo import snap_to_grid
+from app.utils.weather_helper import (
+    fetch_current_weather, fetch_current_weather_batch, fetch_weather_forecast, weather_cache,
+)
+from app.utils.executor import blocking_executor, ExecutorSaturatedError
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+
+class Location(BaseModel):
+    latitude: float
+    longitude: float
+
+
+class BulkWeatherRequest(BaseModel):
+    locations: List[Location]
+
+
 @router.get("/current")
 async def get_current_weather(latitude: float, longitude: float):
     """Get current weather and disease risk for a location"""
     try:
-        weather_data = fetch_current_weather(latitude, longitude)
+        weather_data = await blocking_executor.run(fetch_current_weather, latitude, longitude)
         if weather_data:
             return {
                 "status": "success",
@@ -21,27 +40,109 @@ async def get_current_weather(latitude: float, longitude: float):
             }
         else:
             raise HTTPException(status_code=500, detail="Failed to fetch weather data")
+    except HTTPException:
+        raise
+    except ExecutorSaturatedError as e:
+        logger.warning(f"Rejecting weather request, executor saturated: {e}")
+        raise HTTPException(status_code=503, detail="Server is busy. Please retry shortly.")
     except Exception as e:
         logger.error(f"Weather endpoint error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/bulk")
+async def get_bulk_weather(body: BulkWeatherRequest):
+    """
+    Current weather and disease risk for many locations at once.
+
+    Locations are deduplicated by weather grid cell; cells already in the
+    weather cache are answered first, the rest are fetched in multi-location
+    Open-Meteo calls of WEATHER_BULK_CHUNK_SIZE cells. Results stream back as
+    NDJSON lines ({"index", "latitude", "longitude", "weather"}) as each chunk
+    arrives; use "index" to map them to the request's locations.
+    """
+    if len(body.locations) > settings.WEATHER_BULK_MAX_LOCATIONS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {settings.WEATHER_BULK_MAX_LOCATIONS} locations per request"
+        )
+
+    # Group request indexes by grid cell so each cell is fetched once
+    cell_indexes: Dict[Tuple[float, float], List[int]] = {}
+    for index, location in enumerate(body.locations):
+        cell = snap_to_grid(location.latitude, location.longitude, settings.WEATHER_GRID_RESOLUTION)
+        cell_indexes.setdefault(cell, []).append(index)
+
+    cached: Dict[Tuple[float, float], Dict] = {}
+    missing: List[Tuple[float, float]] = []
+    for cell in cell_indexes:
+        weather = weather_cache.get(("current", cell))
+        if weather is None:
+            missing.append(cell)
+        else:
+            cached[cell] = weather
+
+    def _lines(cells_weather) -> str:
+        lines = []
+        for cell, weather in cells_weather:
+            for index in cell_indexes[cell]:
+                location = body.locations[index]
+                lines.append(json.dumps({
+                    "index": index,
+                    "latitude": location.latitude,
+                    "longitude": location.longitude,
+                    "weather": {**weather, "latitude": location.latitude, "longitude": location.longitude} if weather else None,
+                }) + "\n")
+        return "".join(lines)
+
+    async def _fetch_chunk(cells: List[Tuple[float, float]]):
+        try:
+            return zip(cells, await blocking_executor.run(fetch_current_weather_batch, cells))
+        except Exception as e:
+            logger.error(f"Bulk weather fetch failed for {len(cells)} cells: {e}")
+            return ((cell, None) for cell in cells)
+
+    async def _stream():
+        if cached:
+            yield _lines(cached.items())
+        chunk_size = settings.WEATHER_BULK_CHUNK_SIZE
+        tasks = [
+            asyncio.create_task(_fetch_chunk(missing[start:start + chunk_size]))
+            for start in range(0, len(missing), chunk_size)
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield _lines(await next_done)
+        finally:
+            # Client went away mid-stream: stop the remaining work
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(_stream(), media_type="application/x-ndjson")
+
 @router.get("/forecast")
 async def get_weather_forecast(
     latitude: float, 
     longitude: float, 
     days: int = Query(7, ge=1, le=14)
 ):
-    """Get weather forecast (Placeholder)"""
-    # For now, we'll return a message as the helper doesn't fully implement forecast yet
-    return {
-        "status": "success",
-        "message": f"Forecast for {days} days at {latitude}, {longitude} is currently in development",
-        "data": {
-            "latitude": latitude,
-            "longitude": longitude,
-            "days": days
-        }
-    }
+    """Get hourly forecast with per-hour and per-day disease risk for a location"""
+    try:
+        forecast = await blocking_executor.run(fetch_weather_forecast, latitude, longitude, days)
+        if forecast:
+            return {
+                "status": "success",
+                "data": forecast
+            }
+        else:
+            raise HTTPException(status_code=500, detail="Failed to fetch weather forecast")
+    except HTTPException:
+        raise
+    except ExecutorSaturatedError as e:
+        logger.warning(f"Rejecting weather request, executor saturated: {e}")
+        raise HTTPException(status_code=503, detail="Server is busy. Please retry shortly.")
+    except Exception as e:
+        logger.error(f"Forecast endpoint error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/disease-risk-conditions")
 async def get_disease_risk_conditions():
@@ -0,0 +1,108 @@
+"""
+Scheduled hot/cold archival of the scans table: months older than the hot
+window move to monthly archive files, then the hot database is vacuumed and
+re-analysed so it stays small enough to live in the page cache
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from app.config import settings
+from app.utils.database import db
+from app.utils.executor import blocking_executor
+
+logger = logging.getLogger(__name__)
+
+
+def archive_cutoff(hot_months: int) -> str:
+    """Start of the oldest month kept in the hot database (the current month counts as one)."""
+    now = datetime.now(timezone.utc)
+    months = now.year * 12 + now.month - 1 - (hot_months - 1)
+    return f"{months // 12:04d}-{months % 12 + 1:02d}-01 00:00:00"
+
+
+class ScanArchiver:
+    """
+    Periodically moves scans older than hot_months whole months into
+    db.archive_dir (see DatabaseManager.archive_scans). The hot database is
+    VACUUMed only when rows were moved; ANALYZE and a WAL truncate run every time.
+    """
+
+    def __init__(self, hot_months: int, interval_seconds: float):
+        self.hot_months = hot_months
+        self.interval_seconds = interval_seconds
+        self._task: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.errors = 0
+        self.last_run_at: Optional[float] = None
+        self.last_duration_ms: Optional[float] = None
+        self.last_moved = 0
+        self.hot_size_bytes: Optional[int] = None
+
+    def run(self) -> Dict:
+        """Archive and optimise once (blocking; runs on the executor)."""
+        started = time.perf_counter()
+        cutoff = archive_cutoff(self.hot_months)
+        moved = db.archive_scans(cutoff)
+        sizes = db.optimize(vacuum=bool(moved))
+
+        self.runs += 1
+        self.last_run_at = time.time()
+        self.last_duration_ms = round((time.perf_counter() - started) * 1000, 1)
+        self.last_moved = sum(moved.values())
+        self.hot_size_bytes = sizes["size_bytes"]
+        logger.info(
+            f"Archived {self.last_moved} scans older than {cutoff} in {self.last_duration_ms}ms; "
+            f"hot database is {self.hot_size_bytes} bytes"
+        )
+        return {"cutoff": cutoff, "moved": moved, **sizes}
+
+    async def _loop(self):
+        while True:
+            try:
+                await blocking_executor.run(self.run)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Scan archival run failed: {e}")
+            await asyncio.sleep(self.interval_seconds)
+
+    def start(self):
+        """Start the archival loop on the running event loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+            logger.info(f"Scan archival scheduled every {self.interval_seconds}s (hot window {self.hot_months} months)")
+
+    async def stop(self):
+        """Cancel the archival loop and wait for it to exit."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict:
+        return {
+            "hot_months": self.hot_months,
+            "interval_seconds": self.interval_seconds,
+            "runs": self.runs,
+            "errors": self.errors,
+            "last_run_at": self.last_run_at,
+            "last_duration_ms": self.last_duration_ms,
+            "last_moved": self.last_moved,
+            "hot_size_bytes": self.hot_size_bytes,
+            "archive_months": len(db.archive_months),
+        }
+
+
+# Singleton instance
+scan_archiver = ScanArchiver(
+    hot_months=settings.ARCHIVE_HOT_MONTHS,
+    interval_seconds=settings.ARCHIVE_INTERVAL_SECONDS,
+)
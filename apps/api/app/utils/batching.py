@@ -0,0 +1,124 @@
+"""
+Dynamic micro-batching in front of a local model's classify_arrays()
+"""
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Tuple
+
+from app.utils.metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class MicroBatcher:
+    """
+    Collects concurrent classify_image_bytes() calls and runs them through the
+    wrapped predictor's classify_arrays() as one stacked tensor.
+
+    Each caller (an executor thread) decodes its own image, so decoding stays
+    parallel and a corrupt upload fails only its own request. A batch is
+    dispatched once it holds max_batch_size images or the oldest image has
+    waited max_wait_ms, whichever comes first.
+    """
+
+    def __init__(self, predictor, max_batch_size: int, max_wait_ms: float):
+        self.predictor = predictor
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_ms / 1000.0
+        self._queue: "queue.Queue" = queue.Queue()
+        self.batch_sizes = Histogram([1, 2, 4, 8, 16, 32, 64])
+        self.wait_ms = Histogram([1, 2, 5, 10, 20, 50, 100, 250])
+        self.inference_ms = Histogram([5, 10, 25, 50, 100, 250, 500, 1000])
+        # Guards _closed so nothing is queued behind _STOP, where no one would serve it
+        self._lock = threading.Lock()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._worker.start()
+        logger.info(f"Micro-batcher started (max_batch_size={max_batch_size}, max_wait_ms={max_wait_ms})")
+
+    def __getattr__(self, name):
+        # Expose the wrapped predictor's attributes (cache_namespace, class_names, ...)
+        return getattr(self.predictor, name)
+
+    def classify_image_bytes(self, image_bytes: bytes) -> dict:
+        """Queue one image for the next batch and wait for its result."""
+        array = self.predictor.to_array(image_bytes)
+        future: Future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Micro-batcher is closed")
+            self._queue.put((array, future, time.perf_counter()))
+        return future.result()
+
+    def _collect(self, first) -> Tuple[List, bool]:
+        """Gather a batch starting with `first`; returns (batch, stop requested)."""
+        batch = [first]
+        deadline = first[2] + self.max_wait_seconds
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        stop = False
+        while not stop:
+            first = self._queue.get()
+            if first is _STOP:
+                break
+            batch, stop = self._collect(first)
+
+            dispatched = time.perf_counter()
+            self.batch_sizes.observe(len(batch))
+            for _, _, enqueued in batch:
+                self.wait_ms.observe((dispatched - enqueued) * 1000)
+
+            try:
+                results = self.predictor.classify_arrays([array for array, _, _ in batch])
+                self.inference_ms.observe((time.perf_counter() - dispatched) * 1000)
+                for (_, future, _), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                logger.error(f"Batch of {len(batch)} failed: {e}")
+                for _, future, _ in batch:
+                    future.set_exception(e)
+
+    def close(self):
+        """Finish queued work, stop the batching thread and fail anything it could not serve."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(_STOP)
+        self._worker.join(timeout=5)
+        if self._worker.is_alive():
+            logger.error(f"Micro-batcher did not stop within 5s; {self._queue.qsize()} images still queued")
+            return
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                item[1].set_exception(RuntimeError("Micro-batcher is closed"))
+
+    def stats(self) -> Dict:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_seconds * 1000,
+            "queued": self._queue.qsize(),
+            "batch_size": self.batch_sizes.stats(),
+            "wait_ms": self.wait_ms.stats(),
+            "inference_ms": self.inference_ms.stats(),
+        }
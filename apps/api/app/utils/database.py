@@ -1,26 +1,191 @@
+import base64
 import sqlite3
 import os
 import json
 import logging
-from datetime import datetime
-from typing import List, Dict, Optional, Any
+import queue
+import threading
+import time
+from contextlib import closing, contextmanager
+from datetime import datetime, timezone
+from typing import List, Dict, Optional, Any, Iterator, Tuple
+
+import numpy as np
+
+from app.config import settings
+from app.utils.executor import blocking_executor
+from app.utils.farm_index import FarmIndex, PreparedBoundary
+from app.utils.geo import geohash_centre, geohash_cover, geohash_encode, geohash_intersects
 
 logger = logging.getLogger(__name__)
 
+
+class _ConnectionPool:
+    """
+    Fixed-size pool of read connections. Connections are reused across calls,
+    so each one keeps its page cache and compiled statement cache warm.
+    """
+
+    def __init__(self, connect, size: int):
+        self._connect = connect
+        self.size = size
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self.waits = 0
+
+    def acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                create = True
+            else:
+                self.waits += 1
+                create = False
+        if create:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        return self._idle.get()
+
+    def release(self, conn: sqlite3.Connection):
+        self._idle.put(conn)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def stats(self) -> Dict:
+        return {"size": self.size, "open": self._created, "idle": self._idle.qsize(), "waits": self.waits}
+
+
+class AsyncDatabase:
+    """
+    Awaitable view of a DatabaseManager: `await db.aio.get_history(...)` runs
+    db.get_history on the blocking executor instead of the event loop thread.
+    Generator methods (iter_image_hashes) should be consumed synchronously.
+    """
+
+    def __init__(self, manager: "DatabaseManager"):
+        self._manager = manager
+
+    def __getattr__(self, name: str):
+        method = getattr(self._manager, name)
+        if not callable(method):
+            return method
+
+        async def _call(*args, **kwargs):
+            return await blocking_executor.run(method, *args, **kwargs)
+
+        _call.__name__ = name
+        return _call
+
+
 class DatabaseManager:
-    """Manages SQLite database for scan history and farm layouts."""
+    """
+    Manages SQLite database for scan history and farm layouts.
+
+    The database runs in WAL mode so readers never block the writer. Reads use
+    a pool of long-lived connections; writes go through one dedicated writer
+    connection serialised by a lock, which avoids SQLITE_BUSY retries between
+    our own threads. Use `db.aio` from async code.
+    """
     
-    def __init__(self, db_path: str = "maize_health.db"):
+    def __init__(self, db_path: str = "maize_health.db", pool_size: int = 8,
+                 synchronous: str = "NORMAL", mmap_size: int = 0, cache_size_kb: int = 0,
+                 rollup_precision: int = 5, farm_index_cell_size: float = 0.05,
+                 farm_max_span_degrees: float = 1.0, archive_dir: str = "scans_archive"):
         self.db_path = db_path
+        self.archive_dir = archive_dir
+        self.rollup_precision = rollup_precision
+        self.synchronous = synchronous
+        self.mmap_size = mmap_size
+        self.cache_size_kb = cache_size_kb
+        self._writer = self._connect()
+        self._writer.execute('PRAGMA journal_mode=WAL')
+        self._write_lock = threading.Lock()
+        self._pool = _ConnectionPool(self._connect, pool_size)
+        self.aio = AsyncDatabase(self)
+        self.rtree_enabled = False
+        self._class_set_ids: Dict[Tuple[str, ...], int] = {}
+        self._class_names: Dict[int, List[str]] = {}
+        # Bumped by save_farm; the farm index reloads when it changes
+        self.farms_version = 0
+        self.farm_index = FarmIndex(self, cell_size=farm_index_cell_size, max_span_degrees=farm_max_span_degrees)
+        # 'YYYY-MM' of each monthly archive file, newest first
+        self.archive_months: List[str] = []
+        self._load_archive_months()
         self._init_db()
-        
-    def _get_connection(self):
-        return sqlite3.connect(self.db_path)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=30,
+            check_same_thread=False,  # connections move between executor threads via the pool
+            cached_statements=256,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute(f'PRAGMA synchronous={self.synchronous}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        if self.mmap_size:
+            conn.execute(f'PRAGMA mmap_size={int(self.mmap_size)}')
+        if self.cache_size_kb:
+            # Negative cache_size is in KiB rather than pages
+            conn.execute(f'PRAGMA cache_size=-{int(self.cache_size_kb)}')
+        return conn
+
+    @contextmanager
+    def _get_connection(self, write: bool = False):
+        """
+        Borrow a connection for one transaction (committed on success, rolled
+        back on error). Pass write=True for statements that modify the database.
+        """
+        if write:
+            with self._write_lock:
+                try:
+                    with self._writer:
+                        yield self._writer
+                except Exception:
+                    # A rolled-back transaction may have inserted class sets we cached
+                    self._class_set_ids.clear()
+                    raise
+            return
+
+        conn = self._pool.acquire()
+        try:
+            with conn:
+                yield conn
+        finally:
+            self._pool.release(conn)
+
+    def close(self):
+        """Close every pooled connection (on shutdown)."""
+        self._pool.close()
+        with self._write_lock:
+            self._writer.close()
+
+    def stats(self) -> Dict:
+        return {
+            "path": self.db_path,
+            "read_pool": self._pool.stats(),
+            "farm_index": self.farm_index.stats(),
+            "archive_months": len(self.archive_months),
+        }
         
     def _init_db(self):
         """Initialize the database tables if they don't exist."""
         try:
-            with self._get_connection() as conn:
+            with self._get_connection(write=True) as conn:
                 cursor = conn.cursor()
                 
                 # Table for disease detection scans
@@ -35,10 +200,85 @@ class DatabaseManager:
                         confidence REAL,
                         all_predictions TEXT,  -- JSON string
                         weather_data TEXT,     -- JSON string
-                        image_url TEXT         -- Optional, local path or URL
+                        image_url TEXT,        -- Optional, local path or URL
+                        class_set_id INTEGER,  -- class_sets.id naming the entries of scores
+                        scores BLOB,           -- float32 probabilities in class-set order
+                        farm_id INTEGER        -- farms.id whose boundary contains the scan
+                    )
+                ''')
+                # all_predictions is kept for rows written before the compact format
+                self._ensure_columns(cursor, 'scans', {'class_set_id': 'INTEGER', 'scores': 'BLOB', 'farm_id': 'INTEGER'})
+
+                # Per-farm summaries: latest scans and (covered) prediction counts
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_scans_farm_time
+                    ON scans (farm_id, timestamp DESC, id DESC, prediction)
+                ''')
+
+                # Fixed-order class-name lists referenced by scans.class_set_id
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS class_sets (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        names TEXT NOT NULL UNIQUE  -- JSON list of class names
                     )
                 ''')
+
+                # Spatial index over scan locations for map viewport queries
+                self.rtree_enabled = self._init_scan_rtree(cursor)
+
+                # History is read newest-first and paged on (timestamp, id); one index per filter shape
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_scans_time
+                    ON scans (timestamp DESC, id DESC)
+                ''')
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_scans_farmer_time
+                    ON scans (farmer_id, timestamp DESC, id DESC)
+                ''')
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_scans_prediction_time
+                    ON scans (prediction, timestamp DESC, id DESC)
+                ''')
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_scans_farmer_prediction_time
+                    ON scans (farmer_id, prediction, timestamp DESC, id DESC)
+                ''')
                 
+                # Daily incidence rollups, maintained by the scan write path (see _update_rollups)
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS scan_rollup_cells (
+                        geohash TEXT NOT NULL,     -- cell at ROLLUP_GEOHASH_PRECISION
+                        day TEXT NOT NULL,         -- YYYY-MM-DD (UTC)
+                        prediction TEXT NOT NULL,
+                        scans INTEGER NOT NULL,
+                        confidence_sum REAL NOT NULL,
+                        PRIMARY KEY (geohash, day, prediction)
+                    ) WITHOUT ROWID
+                ''')
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_scan_rollup_cells_day
+                    ON scan_rollup_cells (day)
+                ''')
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS scan_rollup_days (
+                        day TEXT NOT NULL,
+                        prediction TEXT NOT NULL,
+                        scans INTEGER NOT NULL,
+                        confidence_sum REAL NOT NULL,
+                        PRIMARY KEY (day, prediction)
+                    ) WITHOUT ROWID
+                ''')
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS scan_rollup_farmers (
+                        farmer_id TEXT NOT NULL,
+                        day TEXT NOT NULL,
+                        prediction TEXT NOT NULL,
+                        scans INTEGER NOT NULL,
+                        confidence_sum REAL NOT NULL,
+                        PRIMARY KEY (farmer_id, day, prediction)
+                    ) WITHOUT ROWID
+                ''')
+
                 # Table for farm boundaries (polygons)
                 cursor.execute('''
                     CREATE TABLE IF NOT EXISTS farms (
@@ -50,81 +290,787 @@ class DatabaseManager:
                         UNIQUE(farmer_id, farm_name)
                     )
                 ''')
+
+                # Persistent tier of the content-addressed prediction cache
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS prediction_cache (
+                        cache_key TEXT PRIMARY KEY,  -- "<namespace>:<sha256 of image bytes>"
+                        namespace TEXT,              -- predictor project/iteration
+                        result TEXT,                 -- JSON string
+                        created_at REAL              -- unix time
+                    )
+                ''')
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_prediction_cache_created
+                    ON prediction_cache (created_at)
+                ''')
+
+                # Perceptual hashes of classified uploads, for near-duplicate lookup
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS image_hashes (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        namespace TEXT,   -- predictor project/iteration
+                        phash INTEGER,    -- 64-bit pHash stored as signed int
+                        result TEXT,      -- JSON string
+                        created_at REAL   -- unix time
+                    )
+                ''')
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_image_hashes_namespace
+                    ON image_hashes (namespace)
+                ''')
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_image_hashes_created
+                    ON image_hashes (created_at)
+                ''')
                 
                 conn.commit()
                 logger.info(f"Database initialized at {self.db_path}")
         except Exception as e:
             logger.error(f"Failed to initialize database: {e}")
             
+    def _ensure_columns(self, cursor, table: str, columns: Dict[str, str]):
+        """Add columns missing from a table created by an older version."""
+        existing = {row[1] for row in cursor.execute(f'PRAGMA table_info({table})')}
+        for name, column_type in columns.items():
+            if name not in existing:
+                cursor.execute(f'ALTER TABLE {table} ADD COLUMN {name} {column_type}')
+                logger.info(f"Added column {table}.{name}")
+
+    def _class_set_id(self, conn: sqlite3.Connection, names: Tuple[str, ...]) -> int:
+        """Id of a class-name list, inserting it on first use (inside a write transaction)."""
+        class_set_id = self._class_set_ids.get(names)
+        if class_set_id is None:
+            encoded = json.dumps(list(names))
+            conn.execute('INSERT OR IGNORE INTO class_sets (names) VALUES (?)', (encoded,))
+            class_set_id = conn.execute('SELECT id FROM class_sets WHERE names = ?', (encoded,)).fetchone()[0]
+            self._class_set_ids[names] = class_set_id
+            self._class_names[class_set_id] = list(names)
+        return class_set_id
+
+    def _encode_scores(self, conn: sqlite3.Connection, all_predictions: Dict) -> Tuple[int, bytes]:
+        """(class_set_id, float32 blob) for a {class name: probability} dict."""
+        names = tuple(sorted(all_predictions))
+        scores = np.array([all_predictions[name] for name in names], dtype='<f4')
+        return self._class_set_id(conn, names), scores.tobytes()
+
+    def _decode_scores(self, conn: sqlite3.Connection, class_set_id: int, blob: bytes,
+                       top_k: Optional[int] = None) -> Dict[str, float]:
+        """{class name: probability}, highest first, from a stored float32 blob."""
+        names = self._class_names.get(class_set_id)
+        if names is None:
+            row = conn.execute('SELECT names FROM class_sets WHERE id = ?', (class_set_id,)).fetchone()
+            names = json.loads(row[0]) if row else []
+            self._class_names[class_set_id] = names
+        scores = np.frombuffer(blob, dtype='<f4')
+        # Top-k is ranked here rather than stored: with a handful of classes an argsort
+        # per row is cheaper than keeping a second ranking column in step with scores
+        order = np.argsort(-scores, kind='stable')[:top_k]
+        # 6 decimals recovers the predictors' 4-decimal probabilities exactly from float32
+        return dict(zip([names[i] for i in order], np.round(scores[order].astype(np.float64), 6).tolist()))
+
+    def _scan_dict(self, conn: sqlite3.Connection, row: sqlite3.Row, top_k: Optional[int] = None,
+                   raw_weather: bool = False) -> Dict:
+        """API shape of a scans row; weather_data stays a JSON string if raw_weather."""
+        d = dict(row)
+        class_set_id, scores = d.pop('class_set_id'), d.pop('scores')
+        if scores is not None:
+            d['all_predictions'] = self._decode_scores(conn, class_set_id, scores, top_k)
+        else:
+            legacy = json.loads(d['all_predictions']) if d['all_predictions'] else {}
+            ranked = sorted(legacy.items(), key=lambda item: item[1], reverse=True)
+            d['all_predictions'] = dict(ranked[:top_k])
+        if not raw_weather:
+            d['weather_data'] = json.loads(d['weather_data']) if d['weather_data'] else None
+        return d
+
+    def compact_scan_predictions(self, batch_size: int = 5000) -> int:
+        """Re-encode legacy JSON all_predictions rows as class-set ids + float32 blobs."""
+        converted = 0
+        while True:
+            with self._get_connection(write=True) as conn:
+                rows = conn.execute(
+                    'SELECT id, all_predictions FROM scans WHERE scores IS NULL LIMIT ?', (batch_size,)
+                ).fetchall()
+                if not rows:
+                    break
+                updates = []
+                for row_id, text in rows:
+                    class_set_id, blob = self._encode_scores(conn, json.loads(text) if text else {})
+                    updates.append((class_set_id, blob, row_id))
+                conn.executemany(
+                    'UPDATE scans SET class_set_id = ?, scores = ?, all_predictions = NULL WHERE id = ?', updates
+                )
+            converted += len(rows)
+        logger.info(f"Compacted predictions of {converted} scans")
+        return converted
+
+    def _init_scan_rtree(self, cursor) -> bool:
+        """
+        Create the scans_rtree spatial index, kept in sync with scans by
+        triggers and backfilled when first created. Returns False (and adds a
+        plain lat/lon index instead) if SQLite was built without rtree.
+        """
+        exists = cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'scans_rtree'").fetchone()
+        try:
+            cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS scans_rtree
+                USING rtree(id, min_lat, max_lat, min_lon, max_lon)
+            ''')
+        except sqlite3.OperationalError as e:
+            logger.warning(f"SQLite rtree module unavailable ({e}); map queries use a lat/lon index")
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_scans_lat_lon ON scans (latitude, longitude)')
+            return False
+
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS scans_rtree_insert AFTER INSERT ON scans
+            WHEN NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL
+            BEGIN
+                INSERT INTO scans_rtree VALUES (NEW.id, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS scans_rtree_delete AFTER DELETE ON scans
+            BEGIN
+                DELETE FROM scans_rtree WHERE id = OLD.id;
+            END
+        ''')
+        if not exists:
+            cursor.execute('''
+                INSERT INTO scans_rtree
+                SELECT id, latitude, latitude, longitude, longitude FROM scans
+                WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+            ''')
+        return True
+
     def save_scan(self, farmer_id: str, latitude: float, longitude: float, 
                   prediction: str, confidence: float, all_predictions: Dict,
                   weather_data: Optional[Dict] = None) -> int:
         """Save a new disease scan to history."""
         try:
-            with self._get_connection() as conn:
+            with self._get_connection(write=True) as conn:
                 cursor = conn.cursor()
+                timestamp = _utc_timestamp()
+                class_set_id, scores = self._encode_scores(conn, all_predictions)
                 cursor.execute('''
-                    INSERT INTO scans (farmer_id, latitude, longitude, prediction, confidence, all_predictions, weather_data)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    INSERT INTO scans (timestamp, farmer_id, latitude, longitude, prediction, confidence, class_set_id, scores, weather_data, farm_id)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                 ''', (
+                    timestamp,
                     farmer_id, 
                     latitude, 
                     longitude, 
                     prediction, 
                     confidence, 
-                    json.dumps(all_predictions),
-                    json.dumps(weather_data) if weather_data else None
+                    class_set_id,
+                    scores,
+                    json.dumps(weather_data) if weather_data else None,
+                    self.farm_index.locate(latitude, longitude)
                 ))
+                self._update_rollups(conn, [{
+                    'timestamp': timestamp, 'farmer_id': farmer_id, 'latitude': latitude,
+                    'longitude': longitude, 'prediction': prediction, 'confidence': confidence,
+                }])
                 conn.commit()
                 return cursor.lastrowid
         except Exception as e:
             logger.error(f"Error saving scan: {e}")
             return -1
-            
+
+    def save_scans(self, scans: List[Dict]) -> int:
+        """
+        Save several scans in one transaction. Each dict has the save_scan
+        arguments plus an optional 'timestamp' ('YYYY-MM-DD HH:MM:SS', UTC).
+        Returns the number of rows inserted (0 on failure).
+        """
+        if not scans:
+            return 0
+        now = _utc_timestamp()
+        scans = [scan if scan.get('timestamp') else {**scan, 'timestamp': now} for scan in scans]
+        try:
+            with self._get_connection(write=True) as conn:
+                conn.executemany('''
+                    INSERT INTO scans (timestamp, farmer_id, latitude, longitude, prediction, confidence, class_set_id, scores, weather_data, farm_id)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', [
+                    (
+                        scan['timestamp'],
+                        scan['farmer_id'],
+                        scan['latitude'],
+                        scan['longitude'],
+                        scan['prediction'],
+                        scan['confidence'],
+                        *self._encode_scores(conn, scan['all_predictions']),
+                        json.dumps(scan['weather_data']) if scan.get('weather_data') else None,
+                        self.farm_index.locate(scan['latitude'], scan['longitude'])
+                    )
+                    for scan in scans
+                ])
+                self._update_rollups(conn, scans)
+                return len(scans)
+        except Exception as e:
+            logger.error(f"Error saving {len(scans)} scans: {e}")
+            return 0
+
     def get_history(self, farmer_id: Optional[str] = None, limit: int = 50) -> List[Dict]:
         """Retrieve scan history, optionally filtered by farmer_id."""
+        return self.get_history_page(farmer_id=farmer_id, limit=limit)[0]
+
+    def get_history_page(self, farmer_id: Optional[str] = None, prediction: Optional[str] = None,
+                         since: Optional[str] = None, until: Optional[str] = None, farm_id: Optional[int] = None,
+                         bbox: Optional[Tuple[float, float, float, float]] = None,
+                         cursor: Optional[str] = None, limit: int = 50, top_k: Optional[int] = None,
+                         raw_weather: bool = False) -> Tuple[List[Dict], Optional[str]]:
+        """
+        One page of scan history, newest first, with optional farmer, farm,
+        prediction class, [since, until) timestamp and (min_lat, min_lon,
+        max_lat, max_lon) bbox filters. Pages are keyed on
+        (timestamp, id) rather than an offset, so every page costs one index
+        range scan. Returns (rows, next_cursor); next_cursor is None on the last page.
+
+        top_k keeps only the k most likely classes in all_predictions; with
+        raw_weather, weather_data is returned as its stored JSON text.
+        """
+        clauses, params = _scan_filters(farmer_id, prediction, since, until, farm_id)
+        if bbox is not None:
+            # Not via scans_rtree: the page order has to come from the timestamp indexes
+            min_lat, min_lon, max_lat, max_lon = bbox
+            clauses.append('latitude BETWEEN ? AND ? AND longitude BETWEEN ? AND ?')
+            params.extend((min_lat, max_lat, min_lon, max_lon))
+        before = None
+        if cursor:
+            before = _decode_cursor(cursor)
+            clauses.append('(timestamp, id) < (?, ?)')
+            params.extend(before)
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
         try:
             with self._get_connection() as conn:
-                conn.row_factory = sqlite3.Row
-                cursor = conn.cursor()
-                
-                if farmer_id:
-                    cursor.execute('SELECT * FROM scans WHERE farmer_id = ? ORDER BY timestamp DESC LIMIT ?', (farmer_id, limit))
-                else:
-                    cursor.execute('SELECT * FROM scans ORDER BY timestamp DESC LIMIT ?', (limit,))
-                
-                rows = cursor.fetchall()
-                results = []
-                for row in rows:
-                    d = dict(row)
-                    d['all_predictions'] = json.loads(d['all_predictions']) if d['all_predictions'] else {}
-                    d['weather_data'] = json.loads(d['weather_data']) if d['weather_data'] else None
-                    results.append(d)
-                return results
+                page: Dict[int, sqlite3.Row] = {}
+                rows: List[sqlite3.Row] = []
+                with closing(self._scan_partitions(conn, since, until, before[0] if before else None)) as partitions:
+                    for schema, upper in partitions:
+                        # Archives come newest first: stop once a month can only hold rows past this page
+                        if upper is not None and len(rows) > limit and rows[limit]['timestamp'] >= upper:
+                            break
+                        # Keyed by id: a scan mid-archival may briefly be in both files
+                        page.update((row['id'], row) for row in conn.execute(
+                            f'SELECT {_SCAN_COLUMNS} FROM {schema}.scans {where} ORDER BY timestamp DESC, id DESC LIMIT ?',
+                            (*params, limit + 1)
+                        ))
+                        rows = sorted(page.values(), key=lambda row: (row['timestamp'], row['id']), reverse=True)[:limit + 1]
+                results = [self._scan_dict(conn, row, top_k, raw_weather) for row in rows[:limit]]
         except Exception as e:
             logger.error(f"Error fetching history: {e}")
+            return [], None
+
+        next_cursor = _encode_cursor(rows[limit - 1]['timestamp'], rows[limit - 1]['id']) if len(rows) > limit else None
+        return results, next_cursor
+
+    def _bbox_query(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float,
+                    farmer_id: Optional[str], prediction: Optional[str],
+                    since: Optional[str], until: Optional[str],
+                    schema: str = 'main') -> Tuple[str, List[str], List[Any]]:
+        """FROM clause, WHERE clauses and parameters selecting scans of one partition inside a bbox."""
+        clauses, params = _scan_filters(farmer_id, prediction, since, until)
+        # rtree stores float32 bounds, so the exact coordinates are re-checked as well
+        clauses.append('scans.latitude BETWEEN ? AND ? AND scans.longitude BETWEEN ? AND ?')
+        params.extend((min_lat, max_lat, min_lon, max_lon))
+        if schema != 'main':
+            # Archives have no rtree; a scan mid-archival is counted from the hot copy only
+            clauses.append('scans.id NOT IN (SELECT id FROM main.scans)')
+            return f'{schema}.scans', clauses, params
+        if not self.rtree_enabled:
+            return 'main.scans', clauses, params
+
+        # CROSS JOIN keeps the rtree as the outer loop, so only scans in the viewport are visited
+        # Overlap, not containment: float32 bounds are rounded outward, so a point on the
+        # viewport edge has an rtree box that pokes outside it
+        clauses.append('r.max_lat >= ? AND r.min_lat <= ? AND r.max_lon >= ? AND r.min_lon <= ?')
+        params.extend((min_lat, max_lat, min_lon, max_lon))
+        return 'main.scans_rtree r CROSS JOIN main.scans ON scans.id = r.id', clauses, params
+
+    def get_scans_in_bbox(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float,
+                          farmer_id: Optional[str] = None, prediction: Optional[str] = None,
+                          since: Optional[str] = None, until: Optional[str] = None,
+                          limit: int = 2000) -> Tuple[List[Dict], bool]:
+        """
+        Newest scans inside a lat/lon bounding box as lightweight map points,
+        hot and archived. Returns (points, truncated); truncated is True if
+        more than `limit` matched.
+        """
+        try:
+            with self._get_connection() as conn:
+                rows: List[sqlite3.Row] = []
+                with closing(self._scan_partitions(conn, since, until)) as partitions:
+                    for schema, upper in partitions:
+                        # Archives come newest first: stop once a month can only hold rows past the limit
+                        if upper is not None and len(rows) > limit and rows[limit]['timestamp'] >= upper:
+                            break
+                        source, clauses, params = self._bbox_query(min_lat, min_lon, max_lat, max_lon,
+                                                                   farmer_id, prediction, since, until, schema)
+                        rows.extend(conn.execute(f'''
+                            SELECT scans.id, timestamp, farmer_id, latitude, longitude, prediction, confidence
+                            FROM {source} WHERE {' AND '.join(clauses)}
+                            ORDER BY timestamp DESC, scans.id DESC LIMIT ?
+                        ''', (*params, limit + 1)))
+                        rows = sorted(rows, key=lambda row: (row['timestamp'], row['id']), reverse=True)[:limit + 1]
+                return [dict(row) for row in rows[:limit]], len(rows) > limit
+        except Exception as e:
+            logger.error(f"Error fetching scans in bbox: {e}")
+            return [], False
+
+    def get_scan_clusters(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float,
+                          cell_size: float, farmer_id: Optional[str] = None,
+                          prediction: Optional[str] = None, since: Optional[str] = None,
+                          until: Optional[str] = None) -> List[Dict]:
+        """
+        Aggregate scans inside a bounding box into square cells of `cell_size`
+        degrees. Each cluster has the mean position of its scans (hot and
+        archived), a total count and per-prediction counts.
+        """
+        rows = []
+        try:
+            with self._get_connection() as conn:
+                with closing(self._scan_partitions(conn, since, until)) as partitions:
+                    for schema, _ in partitions:
+                        source, clauses, params = self._bbox_query(min_lat, min_lon, max_lat, max_lon,
+                                                                   farmer_id, prediction, since, until, schema)
+                        rows.extend(conn.execute(f'''
+                            SELECT CAST((latitude - ?) / ? AS INTEGER) AS cell_y,
+                                   CAST((longitude - ?) / ? AS INTEGER) AS cell_x,
+                                   prediction, COUNT(*), SUM(latitude), SUM(longitude)
+                            FROM {source} WHERE {' AND '.join(clauses)}
+                            GROUP BY cell_y, cell_x, prediction
+                        ''', (min_lat, cell_size, min_lon, cell_size, *params)).fetchall())
+        except Exception as e:
+            logger.error(f"Error clustering scans in bbox: {e}")
             return []
 
-    def save_farm(self, farmer_id: str, farm_name: str, boundary_geojson: Dict) -> bool:
-        """Save or update a farm boundary layout."""
+        clusters: Dict[Tuple[int, int], Dict] = {}
+        for cell_y, cell_x, label, count, lat_sum, lon_sum in rows:
+            cluster = clusters.setdefault((cell_y, cell_x), {"count": 0, "lat_sum": 0.0, "lon_sum": 0.0, "predictions": {}})
+            cluster["count"] += count
+            cluster["lat_sum"] += lat_sum
+            cluster["lon_sum"] += lon_sum
+            cluster["predictions"][label] = cluster["predictions"].get(label, 0) + count
+
+        return [
+            {
+                "latitude": round(c["lat_sum"] / c["count"], 6),
+                "longitude": round(c["lon_sum"] / c["count"], 6),
+                "count": c["count"],
+                "predictions": c["predictions"],
+            }
+            for c in clusters.values()
+        ]
+
+    def _update_rollups(self, conn: sqlite3.Connection, scans: List[Dict]):
+        """Add scans to the incidence rollups inside the caller's write transaction."""
+        days: Dict[Tuple[str, str], List[float]] = {}
+        cells: Dict[Tuple[str, str, str], List[float]] = {}
+        farmers: Dict[Tuple[str, str, str], List[float]] = {}
+        for scan in scans:
+            day = scan['timestamp'][:10]
+            confidence = scan.get('confidence') or 0.0
+            totals = days.setdefault((day, scan['prediction']), [0, 0.0])
+            totals[0] += 1
+            totals[1] += confidence
+            if scan.get('latitude') is not None and scan.get('longitude') is not None:
+                key = (geohash_encode(scan['latitude'], scan['longitude'], self.rollup_precision), day, scan['prediction'])
+                totals = cells.setdefault(key, [0, 0.0])
+                totals[0] += 1
+                totals[1] += confidence
+            if scan.get('farmer_id'):
+                totals = farmers.setdefault((scan['farmer_id'], day, scan['prediction']), [0, 0.0])
+                totals[0] += 1
+                totals[1] += confidence
+
+        conn.executemany('''
+            INSERT INTO scan_rollup_days (day, prediction, scans, confidence_sum)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (day, prediction) DO UPDATE SET
+                scans = scans + excluded.scans,
+                confidence_sum = confidence_sum + excluded.confidence_sum
+        ''', [(*key, count, total) for key, (count, total) in days.items()])
+        conn.executemany('''
+            INSERT INTO scan_rollup_cells (geohash, day, prediction, scans, confidence_sum)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (geohash, day, prediction) DO UPDATE SET
+                scans = scans + excluded.scans,
+                confidence_sum = confidence_sum + excluded.confidence_sum
+        ''', [(*key, count, total) for key, (count, total) in cells.items()])
+        conn.executemany('''
+            INSERT INTO scan_rollup_farmers (farmer_id, day, prediction, scans, confidence_sum)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (farmer_id, day, prediction) DO UPDATE SET
+                scans = scans + excluded.scans,
+                confidence_sum = confidence_sum + excluded.confidence_sum
+        ''', [(*key, count, total) for key, (count, total) in farmers.items()])
+
+    def rebuild_rollups(self) -> Dict[str, int]:
+        """
+        Recompute the incidence rollups from every scan, hot and archived
+        (backfill / repair), holding the writer lock throughout. Archive
+        aggregates are staged in temp tables first (an archive read inside a
+        transaction cannot be detached until it ends); the rollups are then
+        replaced from the hot scans plus the staged totals in one transaction.
+        """
+        params = {'precision': self.rollup_precision}
+        with self._get_connection(write=True) as conn:
+            conn.create_function('geohash', 3, geohash_encode, deterministic=True)
+            for table in _ROLLUP_REBUILD_QUERIES:
+                conn.execute(f'DROP TABLE IF EXISTS temp.{table}_rebuild')
+                conn.execute(f'CREATE TEMP TABLE {table}_rebuild AS SELECT * FROM main.{table} WHERE 0')
+            with closing(self._scan_partitions(conn)) as partitions:
+                for schema, _ in partitions:
+                    if schema == 'main':
+                        continue
+                    for table, query in _ROLLUP_REBUILD_QUERIES.items():
+                        conn.execute(f'INSERT INTO temp.{table}_rebuild {query.format(schema=schema)}', params)
+                    # Only temp tables were written; committing releases the archive so it can detach
+                    conn.commit()
+
+            for table, query in _ROLLUP_REBUILD_QUERIES.items():
+                key = _ROLLUP_KEYS[table]
+                conn.execute(f'DELETE FROM main.{table}')
+                conn.execute(f'INSERT INTO main.{table} {query.format(schema="main")}', params)
+                conn.execute(f'''
+                    INSERT INTO main.{table}
+                    SELECT {key}, SUM(scans), SUM(confidence_sum) FROM temp.{table}_rebuild WHERE true GROUP BY {key}
+                    ON CONFLICT ({key}) DO UPDATE SET
+                        scans = scans + excluded.scans,
+                        confidence_sum = confidence_sum + excluded.confidence_sum
+                ''')
+                conn.execute(f'DROP TABLE temp.{table}_rebuild')
+            cells = conn.execute('SELECT COUNT(*) FROM main.scan_rollup_cells').fetchone()[0]
+            farmers = conn.execute('SELECT COUNT(*) FROM main.scan_rollup_farmers').fetchone()[0]
+        logger.info(f"Rebuilt scan rollups: {cells} cell rows, {farmers} farmer rows")
+        return {"cell_rows": cells, "farmer_rows": farmers}
+
+    def get_incidence_trend(self, since_day: str, until_day: str, farmer_id: Optional[str] = None,
+                            geohash: Optional[str] = None, prediction: Optional[str] = None) -> List[Dict]:
+        """
+        Daily scan counts per prediction for [since_day, until_day] from the
+        rollups, optionally for one farmer or one geohash cell (any prefix).
+        """
+        day_clause = 'day BETWEEN ? AND ?'
+        if farmer_id:
+            table, clauses, params = 'scan_rollup_farmers', ['farmer_id = ?'], [farmer_id]
+        elif geohash:
+            # Every cell under a prefix sorts between the prefix and prefix + '~'.
+            # The unary + keeps SQLite on the primary key range instead of the day index.
+            table, clauses, params = 'scan_rollup_cells', ['geohash >= ? AND geohash < ?'], [geohash, geohash + '~']
+            day_clause = '+day BETWEEN ? AND ?'
+        else:
+            table, clauses, params = 'scan_rollup_days', [], []
+        clauses.append(day_clause)
+        params.extend((since_day, until_day))
+        if prediction:
+            clauses.append('prediction = ?')
+            params.append(prediction)
+
+        try:
+            with self._get_connection() as conn:
+                rows = conn.execute(f'''
+                    SELECT day, prediction, SUM(scans) FROM {table}
+                    WHERE {' AND '.join(clauses)}
+                    GROUP BY day, prediction ORDER BY day
+                ''', params).fetchall()
+        except Exception as e:
+            logger.error(f"Error reading incidence trend: {e}")
+            return []
+
+        days: Dict[str, Dict] = {}
+        for day, label, count in rows:
+            entry = days.setdefault(day, {"day": day, "total": 0, "predictions": {}})
+            entry["total"] += count
+            entry["predictions"][label] = count
+        return list(days.values())
+
+    def get_incidence_heatmap(self, since_day: str, until_day: str, precision: int,
+                              prediction: Optional[str] = None,
+                              bbox: Optional[Tuple[float, float, float, float]] = None) -> List[Dict]:
+        """
+        Scan counts per geohash cell (truncated to `precision` characters) and
+        prediction for [since_day, until_day], from the rollups. With a
+        (min_lat, min_lon, max_lat, max_lon) bbox only cells overlapping it
+        are returned: covering geohash ranges narrow the rows through the
+        primary key, then each cell is checked exactly.
+        """
+        precision = min(precision, self.rollup_precision)
+        clauses, params = ['day BETWEEN ? AND ?'], [since_day, until_day]
+        if prediction:
+            clauses.append('prediction = ?')
+            params.append(prediction)
+        if bbox is not None:
+            prefixes = geohash_cover(*bbox, precision)
+            clauses.append('(' + ' OR '.join(['(geohash >= ? AND geohash < ?)'] * len(prefixes)) + ')')
+            for prefix in prefixes:
+                params.extend((prefix, prefix + '~'))
+            clauses.append('geohash_intersects(substr(geohash, 1, ?), ?, ?, ?, ?)')
+            params.extend((precision, *bbox))
+
         try:
             with self._get_connection() as conn:
+                conn.create_function('geohash_intersects', 5, geohash_intersects, deterministic=True)
+                rows = conn.execute(f'''
+                    SELECT substr(geohash, 1, ?) AS cell, prediction, SUM(scans), SUM(confidence_sum)
+                    FROM scan_rollup_cells WHERE {' AND '.join(clauses)}
+                    GROUP BY cell, prediction
+                ''', (precision, *params)).fetchall()
+        except Exception as e:
+            logger.error(f"Error reading incidence heatmap: {e}")
+            return []
+
+        cells: Dict[str, Dict] = {}
+        for cell, label, count, confidence_sum in rows:
+            entry = cells.setdefault(cell, {"geohash": cell, "count": 0, "confidence_sum": 0.0, "predictions": {}})
+            entry["count"] += count
+            entry["confidence_sum"] += confidence_sum
+            entry["predictions"][label] = count
+
+        results = []
+        for entry in cells.values():
+            latitude, longitude = geohash_centre(entry["geohash"])
+            results.append({
+                "geohash": entry["geohash"],
+                "latitude": latitude,
+                "longitude": longitude,
+                "count": entry["count"],
+                "mean_confidence": round(entry.pop("confidence_sum") / entry["count"], 4),
+                "predictions": entry["predictions"],
+            })
+        return results
+
+    def _archive_path(self, month: str) -> str:
+        return os.path.join(self.archive_dir, f'scans-{month}.db')
+
+    def _load_archive_months(self):
+        try:
+            names = os.listdir(self.archive_dir)
+        except FileNotFoundError:
+            names = []
+        months = [name[6:13] for name in names if len(name) == 16 and name.startswith('scans-') and name.endswith('.db')]
+        self.archive_months = sorted(months, reverse=True)
+
+    def _scan_partitions(self, conn: sqlite3.Connection, since: Optional[str] = None, until: Optional[str] = None,
+                         before: Optional[str] = None) -> Iterator[Tuple[str, Optional[str]]]:
+        """
+        Schemas holding scans that may fall in [since, until) and not after
+        `before`: the hot database, then each overlapping monthly archive
+        (newest first), attached to conn as 'archive' while the caller reads it.
+        Yields (schema, exclusive timestamp upper bound; None for the hot
+        database). Wrap in contextlib.closing so breaking out early detaches.
+        """
+        yield 'main', None
+        for month in self.archive_months:
+            start, end = _month_bounds(month)
+            if (since and end <= since) or (until and start >= until) or (before and start > before):
+                continue
+            conn.execute('ATTACH DATABASE ? AS archive', (self._archive_path(month),))
+            try:
+                yield 'archive', end
+            finally:
+                conn.execute('DETACH DATABASE archive')
+
+    def archive_scans(self, before: str) -> Dict[str, int]:
+        """
+        Move scans older than `before` (a month start) out of the hot database
+        into one SQLite file per month under archive_dir, where history queries
+        still find them. Rollups are left alone, so trends keep covering
+        archived months. Safe to re-run after an interruption.
+        """
+        with self._get_connection() as conn:
+            months = [row[0] for row in conn.execute(
+                'SELECT DISTINCT substr(timestamp, 1, 7) FROM scans WHERE timestamp < ?', (before,)
+            )]
+            columns = [(row['name'], row['type']) for row in conn.execute('PRAGMA main.table_info(scans)')]
+        if not months:
+            return {}
+
+        os.makedirs(self.archive_dir, exist_ok=True)
+        names = ', '.join(name for name, _ in columns)
+        definition = ', '.join('id INTEGER PRIMARY KEY' if name == 'id' else f'{name} {type_}' for name, type_ in columns)
+        moved = {}
+        for month in months:
+            start, end = _month_bounds(month)
+            end = min(end, before)
+            with self._get_connection(write=True) as conn:
+                conn.execute('ATTACH DATABASE ? AS archive', (self._archive_path(month),))
+                try:
+                    conn.execute(f'CREATE TABLE IF NOT EXISTS archive.scans ({definition})')
+                    for index, index_columns in _ARCHIVE_INDEXES.items():
+                        conn.execute(f'CREATE INDEX IF NOT EXISTS archive.{index} ON scans ({index_columns})')
+                    conn.execute(
+                        f'INSERT OR IGNORE INTO archive.scans ({names}) '
+                        f'SELECT {names} FROM main.scans WHERE timestamp >= ? AND timestamp < ?',
+                        (start, end)
+                    )
+                    conn.commit()
+                    # Visible to readers before the hot copy goes, so no scan is ever missing
+                    self._load_archive_months()
+                    moved[month] = conn.execute(
+                        'DELETE FROM main.scans WHERE timestamp >= ? AND timestamp < ?', (start, end)
+                    ).rowcount
+                    conn.commit()
+                    conn.execute('ANALYZE archive')
+                finally:
+                    conn.execute('DETACH DATABASE archive')
+            logger.info(f"Archived {moved[month]} scans of {month} to {self._archive_path(month)}")
+        return moved
+
+    def optimize(self, vacuum: bool = False) -> Dict[str, int]:
+        """Refresh planner statistics, optionally VACUUM, and truncate the WAL of the hot database."""
+        with self._write_lock:
+            if vacuum:
+                self._writer.execute('VACUUM')
+            self._writer.execute('ANALYZE')
+            self._writer.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            pages = self._writer.execute('PRAGMA page_count').fetchone()[0]
+            page_size = self._writer.execute('PRAGMA page_size').fetchone()[0]
+        return {"size_bytes": pages * page_size}
+
+    def save_farm(self, farmer_id: str, farm_name: str, boundary_geojson: Dict) -> bool:
+        """
+        Save or update a farm boundary layout, and (re)assign the scans inside it.
+
+        Raises ValueError, before anything is stored, if the boundary is not
+        a valid GeoJSON polygon the farm index can use.
+        """
+        boundary = self.farm_index.prepare(boundary_geojson)
+        try:
+            with self._get_connection(write=True) as conn:
                 cursor = conn.cursor()
+                # Upsert rather than REPLACE so the farm keeps its id (scans reference it)
                 cursor.execute('''
-                    INSERT OR REPLACE INTO farms (farmer_id, farm_name, boundary_geojson)
+                    INSERT INTO farms (farmer_id, farm_name, boundary_geojson)
                     VALUES (?, ?, ?)
+                    ON CONFLICT (farmer_id, farm_name) DO UPDATE SET boundary_geojson = excluded.boundary_geojson
                 ''', (farmer_id, farm_name, json.dumps(boundary_geojson)))
+                farm_id = cursor.execute(
+                    'SELECT id FROM farms WHERE farmer_id = ? AND farm_name = ?', (farmer_id, farm_name)
+                ).fetchone()[0]
                 conn.commit()
-                return True
+                # Bumped under the write lock, so no scan is written against the old index
+                self.farms_version += 1
+                retagged = self._retag_farm_scans(conn, farm_id, boundary)
+            logger.info(f"Saved farm {farm_id} ({farmer_id}/{farm_name}); {retagged} scans reassigned")
+            return True
         except Exception as e:
             logger.error(f"Error saving farm: {e}")
             return False
 
+    def _retag_farm_scans(self, conn: sqlite3.Connection, farm_id: int, boundary: PreparedBoundary) -> int:
+        """
+        Re-locate the scans a saved boundary can affect, hot and archived:
+        those inside its bbox and those previously tagged with it. Going
+        through farm_index keeps the write-time rule that the smallest
+        containing farm wins. Each partition is committed before the next, so
+        its archive can be detached.
+        """
+        retagged = 0
+        with closing(self._scan_partitions(conn)) as partitions:
+            for schema, _ in partitions:
+                candidates = {
+                    row[0]: row for row in conn.execute(
+                        f'SELECT id, latitude, longitude, farm_id FROM {schema}.scans WHERE farm_id = ?', (farm_id,)
+                    )
+                }
+                if boundary.bbox is not None:
+                    source, clauses, params = self._bbox_query(*boundary.bbox, None, None, None, None, schema)
+                    for row in conn.execute(
+                        f"SELECT scans.id, latitude, longitude, farm_id FROM {source} WHERE {' AND '.join(clauses)}",
+                        params
+                    ):
+                        candidates[row[0]] = row
+                changed = []
+                for row_id, lat, lon, current in candidates.values():
+                    located = self.farm_index.locate(lat, lon)
+                    if located != current:
+                        changed.append((located, row_id))
+                conn.executemany(f'UPDATE {schema}.scans SET farm_id = ? WHERE id = ?', changed)
+                conn.commit()
+                retagged += len(changed)
+        return retagged
+
+    def assign_all_scan_farms(self, batch_size: int = 5000) -> int:
+        """Backfill: tag every untagged scan, hot or archived, that lies inside a registered farm."""
+        tagged = self._assign_scan_farms(None, batch_size)
+        for month in list(self.archive_months):
+            tagged += self._assign_scan_farms(self._archive_path(month), batch_size)
+        logger.info(f"Assigned {tagged} scans to farms")
+        return tagged
+
+    def _assign_scan_farms(self, archive_path: Optional[str], batch_size: int) -> int:
+        """Tag untagged scans of the hot database (archive_path None) or of one archive file."""
+        schema = 'main' if archive_path is None else 'archive'
+        tagged, last_id = 0, 0
+        while True:
+            # One batch per write transaction, so scan uploads are not held up for the whole backfill
+            with self._get_connection(write=True) as conn:
+                if archive_path is not None:
+                    conn.execute('ATTACH DATABASE ? AS archive', (archive_path,))
+                try:
+                    rows = conn.execute(
+                        f'SELECT id, latitude, longitude FROM {schema}.scans WHERE id > ? AND farm_id IS NULL '
+                        'AND latitude IS NOT NULL ORDER BY id LIMIT ?',
+                        (last_id, batch_size)
+                    ).fetchall()
+                    if not rows:
+                        break
+                    located = [(self.farm_index.locate(lat, lon), row_id) for row_id, lat, lon in rows]
+                    inside = [(farm, row_id) for farm, row_id in located if farm is not None]
+                    conn.executemany(f'UPDATE {schema}.scans SET farm_id = ? WHERE id = ?', inside)
+                    conn.commit()
+                finally:
+                    if archive_path is not None:
+                        conn.execute('DETACH DATABASE archive')
+            tagged += len(inside)
+            last_id = rows[-1][0]
+        return tagged
+
+    def get_farm_summary(self, farm_id: int, since: Optional[str] = None, latest: int = 10) -> Optional[Dict]:
+        """Disease distribution and latest scans of one farm, served from idx_scans_farm_time."""
+        try:
+            with self._get_connection() as conn:
+                farm = conn.execute(
+                    'SELECT id, farmer_id, farm_name, created_at FROM farms WHERE id = ?', (farm_id,)
+                ).fetchone()
+                if farm is None:
+                    return None
+                clauses, params = _scan_filters(None, None, since, None, farm_id)
+                merged: Dict[str, List] = {}
+                with closing(self._scan_partitions(conn, since)) as partitions:
+                    for schema, _ in partitions:
+                        for label, count, last in conn.execute(
+                            f"SELECT prediction, COUNT(*), MAX(timestamp) FROM {schema}.scans "
+                            f"WHERE {' AND '.join(clauses)} GROUP BY prediction",
+                            params
+                        ):
+                            entry = merged.setdefault(label, [label, 0, last])
+                            entry[1] += count
+                            entry[2] = max(entry[2], last)
+                counts = list(merged.values())
+        except Exception as e:
+            logger.error(f"Error reading farm summary: {e}")
+            return None
+
+        latest_scans, _ = self.get_history_page(farm_id=farm_id, since=since, limit=latest)
+        total = sum(count for _, count, _ in counts)
+        return {
+            "farm": dict(farm),
+            "total_scans": total,
+            "predictions": {label: count for label, count, _ in sorted(counts, key=lambda row: -row[1])},
+            "distribution": {label: round(count / total, 4) for label, count, _ in counts} if total else {},
+            "last_scan_at": max((last for _, _, last in counts), default=None),
+            "latest_scans": latest_scans,
+        }
+
     def get_farms(self, farmer_id: str) -> List[Dict]:
         """Get all farms for a specific farmer."""
         try:
             with self._get_connection() as conn:
-                conn.row_factory = sqlite3.Row
                 cursor = conn.cursor()
                 cursor.execute('SELECT * FROM farms WHERE farmer_id = ?', (farmer_id,))
                 rows = cursor.fetchall()
@@ -138,5 +1084,247 @@ class DatabaseManager:
             logger.error(f"Error fetching farms: {e}")
             return []
 
+    def get_all_farms(self) -> List[Dict]:
+        """Get every registered farm (id, farmer_id, farm_name, boundary_geojson)."""
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT id, farmer_id, farm_name, boundary_geojson FROM farms')
+                results = []
+                for row in cursor.fetchall():
+                    d = dict(row)
+                    d['boundary_geojson'] = json.loads(d['boundary_geojson']) if d['boundary_geojson'] else {}
+                    results.append(d)
+                return results
+        except Exception as e:
+            logger.error(f"Error fetching all farms: {e}")
+            return []
+
+    def get_cached_prediction(self, cache_key: str, max_age_seconds: float) -> Optional[Dict]:
+        """Look up a cached prediction result that is younger than max_age_seconds."""
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    'SELECT result FROM prediction_cache WHERE cache_key = ? AND created_at >= ?',
+                    (cache_key, time.time() - max_age_seconds)
+                )
+                row = cursor.fetchone()
+                return json.loads(row[0]) if row else None
+        except Exception as e:
+            logger.error(f"Error reading prediction cache: {e}")
+            return None
+
+    def save_cached_prediction(self, cache_key: str, namespace: str, result: Dict) -> bool:
+        """Store a prediction result in the persistent cache."""
+        try:
+            with self._get_connection(write=True) as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT OR REPLACE INTO prediction_cache (cache_key, namespace, result, created_at)
+                    VALUES (?, ?, ?, ?)
+                ''', (cache_key, namespace, json.dumps(result), time.time()))
+                conn.commit()
+                return True
+        except Exception as e:
+            logger.error(f"Error writing prediction cache: {e}")
+            return False
+
+    def prune_prediction_cache(self, namespace: str, max_age_seconds: float, max_rows: int) -> int:
+        """
+        Evict cached predictions from other namespaces (e.g. an old Azure iteration),
+        entries older than max_age_seconds, and the oldest rows beyond max_rows.
+        Returns the number of rows deleted.
+        """
+        try:
+            with self._get_connection(write=True) as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    'DELETE FROM prediction_cache WHERE namespace != ? OR created_at < ?',
+                    (namespace, time.time() - max_age_seconds)
+                )
+                deleted = cursor.rowcount
+                cursor.execute('''
+                    DELETE FROM prediction_cache WHERE cache_key IN (
+                        SELECT cache_key FROM prediction_cache
+                        ORDER BY created_at DESC LIMIT -1 OFFSET ?
+                    )
+                ''', (max_rows,))
+                deleted += cursor.rowcount
+                conn.commit()
+                return deleted
+        except Exception as e:
+            logger.error(f"Error pruning prediction cache: {e}")
+            return 0
+
+    def save_image_hash(self, namespace: str, phash: int, result: Dict) -> int:
+        """Store the perceptual hash of a classified image with its prediction."""
+        try:
+            with self._get_connection(write=True) as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT INTO image_hashes (namespace, phash, result, created_at)
+                    VALUES (?, ?, ?, ?)
+                ''', (namespace, _to_signed64(phash), json.dumps(result), time.time()))
+                conn.commit()
+                return cursor.lastrowid
+        except Exception as e:
+            logger.error(f"Error saving image hash: {e}")
+            return -1
+
+    def iter_image_hashes(self, namespace: str) -> Iterator[Tuple[int, int]]:
+        """Yield (row id, phash) for every stored hash in a namespace, oldest first."""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT id, phash FROM image_hashes WHERE namespace = ? ORDER BY id', (namespace,))
+            for row_id, phash in cursor:
+                yield row_id, phash & _UINT64_MASK
+
+    def get_image_hash_result(self, row_id: int, max_age_seconds: float) -> Optional[Dict]:
+        """Return the prediction stored alongside an image hash, if younger than max_age_seconds."""
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    'SELECT result FROM image_hashes WHERE id = ? AND created_at >= ?',
+                    (row_id, time.time() - max_age_seconds)
+                )
+                row = cursor.fetchone()
+                return json.loads(row[0]) if row else None
+        except Exception as e:
+            logger.error(f"Error reading image hash: {e}")
+            return None
+
+    def prune_image_hashes(self, namespace: str, max_age_seconds: float, max_rows: int) -> int:
+        """
+        Drop hashes recorded against any other predictor namespace, hashes older
+        than max_age_seconds, and the oldest rows beyond max_rows.
+        Returns the number of rows deleted.
+        """
+        try:
+            with self._get_connection(write=True) as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    'DELETE FROM image_hashes WHERE namespace != ? OR created_at < ?',
+                    (namespace, time.time() - max_age_seconds)
+                )
+                deleted = cursor.rowcount
+                cursor.execute('''
+                    DELETE FROM image_hashes WHERE id IN (
+                        SELECT id FROM image_hashes ORDER BY id DESC LIMIT -1 OFFSET ?
+                    )
+                ''', (max_rows,))
+                deleted += cursor.rowcount
+                conn.commit()
+                return deleted
+        except Exception as e:
+            logger.error(f"Error pruning image hashes: {e}")
+            return 0
+
+
+_UINT64_MASK = (1 << 64) - 1
+
+# scans columns returned by history queries (all_predictions is only set on legacy rows)
+_SCAN_COLUMNS = (
+    'id, timestamp, farmer_id, farm_id, latitude, longitude, prediction, confidence, '
+    'all_predictions, weather_data, image_url, class_set_id, scores'
+)
+
+
+# Indexes of archive files: history paging by time, farmer and farm
+_ARCHIVE_INDEXES = {
+    'idx_scans_time': 'timestamp DESC, id DESC',
+    'idx_scans_farmer_time': 'farmer_id, timestamp DESC, id DESC',
+    'idx_scans_farm_time': 'farm_id, timestamp DESC, id DESC, prediction',
+}
+
+# Primary key of each rollup table
+_ROLLUP_KEYS = {
+    'scan_rollup_days': 'day, prediction',
+    'scan_rollup_cells': 'geohash, day, prediction',
+    'scan_rollup_farmers': 'farmer_id, day, prediction',
+}
+
+# Per-partition aggregates summed by rebuild_rollups, keyed by rollup table
+_ROLLUP_REBUILD_QUERIES = {
+    'scan_rollup_days': (
+        'SELECT date(timestamp), prediction, COUNT(*), COALESCE(SUM(confidence), 0) '
+        'FROM {schema}.scans GROUP BY 1, 2'
+    ),
+    'scan_rollup_cells': (
+        'SELECT geohash(latitude, longitude, :precision), date(timestamp), prediction, COUNT(*), '
+        'COALESCE(SUM(confidence), 0) FROM {schema}.scans '
+        'WHERE latitude IS NOT NULL AND longitude IS NOT NULL GROUP BY 1, 2, 3'
+    ),
+    'scan_rollup_farmers': (
+        'SELECT farmer_id, date(timestamp), prediction, COUNT(*), COALESCE(SUM(confidence), 0) '
+        "FROM {schema}.scans WHERE farmer_id IS NOT NULL AND farmer_id != '' GROUP BY 1, 2, 3"
+    ),
+}
+
+
+def _month_bounds(month: str) -> Tuple[str, str]:
+    """[start, end) scans.timestamp bounds of a 'YYYY-MM' month."""
+    year, number = int(month[:4]), int(month[5:7])
+    following = f'{year + 1:04d}-01' if number == 12 else f'{year:04d}-{number + 1:02d}'
+    return f'{month}-01 00:00:00', f'{following}-01 00:00:00'
+
+
+def _utc_timestamp() -> str:
+    """Current time in the scans.timestamp format (UTC, 'YYYY-MM-DD HH:MM:SS')."""
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _scan_filters(farmer_id: Optional[str], prediction: Optional[str],
+                  since: Optional[str], until: Optional[str],
+                  farm_id: Optional[int] = None) -> Tuple[List[str], List[Any]]:
+    """WHERE clauses and parameters for the common scan filters."""
+    clauses, params = [], []
+    if farm_id is not None:
+        clauses.append('farm_id = ?')
+        params.append(farm_id)
+    if farmer_id:
+        clauses.append('farmer_id = ?')
+        params.append(farmer_id)
+    if prediction:
+        clauses.append('prediction = ?')
+        params.append(prediction)
+    if since:
+        clauses.append('timestamp >= ?')
+        params.append(since)
+    if until:
+        clauses.append('timestamp < ?')
+        params.append(until)
+    return clauses, params
+
+
+def _encode_cursor(timestamp: str, row_id: int) -> str:
+    """Opaque history cursor for the last row of a page."""
+    return base64.urlsafe_b64encode(json.dumps([timestamp, row_id]).encode()).decode().rstrip('=')
+
+
+def _decode_cursor(cursor: str) -> Tuple[str, int]:
+    """Inverse of _encode_cursor; raises ValueError for a malformed cursor."""
+    try:
+        timestamp, row_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return str(timestamp), int(row_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+def _to_signed64(value: int) -> int:
+    """SQLite integers are signed 64-bit; reinterpret an unsigned hash to fit."""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
 # Singleton instance
-db = DatabaseManager()
+db = DatabaseManager(
+    db_path=settings.DATABASE_PATH,
+    pool_size=settings.DB_POOL_SIZE,
+    synchronous=settings.DB_SYNCHRONOUS,
+    mmap_size=settings.DB_MMAP_SIZE,
+    cache_size_kb=settings.DB_CACHE_SIZE_KB,
+    rollup_precision=settings.ROLLUP_GEOHASH_PRECISION,
+    farm_index_cell_size=settings.FARM_INDEX_CELL_SIZE,
+    farm_max_span_degrees=settings.FARM_MAX_SPAN_DEGREES,
+    archive_dir=settings.ARCHIVE_DIR,
+)
@@ -0,0 +1,99 @@
+"""
+Bounded thread-pool execution layer for blocking calls
+(Azure Custom Vision SDK, Open-Meteo/Nominatim requests, SQLite writes)
+so they never run on the event loop thread.
+"""
+
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ExecutorSaturatedError(RuntimeError):
+    """Raised when the executor's wait queue is full and a call is rejected."""
+
+
+class BlockingExecutor:
+    """
+    Runs synchronous callables on a fixed-size thread pool and tracks how many
+    calls are waiting for a worker (queue depth) and how many are running (in flight).
+    Calls beyond `max_queue` waiting jobs are rejected instead of piling up.
+    """
+
+    def __init__(self, max_workers: int, max_queue: int, name: str = "blocking"):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._in_flight = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run `func(*args, **kwargs)` on the pool and await its result."""
+        with self._lock:
+            if self._queued >= self.max_queue:
+                self._rejected += 1
+                raise ExecutorSaturatedError(
+                    f"{self.name} executor queue is full ({self.max_queue} waiting)"
+                )
+            self._queued += 1
+
+        def _call():
+            with self._lock:
+                self._queued -= 1
+                self._in_flight += 1
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                with self._lock:
+                    self._failed += 1
+                raise
+            finally:
+                with self._lock:
+                    self._in_flight -= 1
+                    self._completed += 1
+
+        future = self._pool.submit(_call)
+        future.add_done_callback(self._on_done)
+        return await asyncio.wrap_future(future)
+
+    def _on_done(self, future: Future):
+        # A job cancelled before a worker picked it up never ran _call
+        if future.cancelled():
+            with self._lock:
+                self._queued -= 1
+
+    def stats(self) -> Dict[str, int]:
+        """Snapshot of the executor's queue depth and in-flight counts."""
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "queued": self._queued,
+                "in_flight": self._in_flight,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+            }
+
+    def shutdown(self):
+        """Stop accepting work and wait for running jobs to finish."""
+        logger.info(f"Shutting down {self.name} executor...")
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+
+# Singleton instance
+blocking_executor = BlockingExecutor(
+    max_workers=settings.BLOCKING_MAX_WORKERS,
+    max_queue=settings.BLOCKING_MAX_QUEUE,
+)
@@ -0,0 +1,140 @@
+"""
+Incremental encoders for streaming scan history exports (NDJSON, CSV, Parquet).
+Each encoder turns one page of scans into bytes as it arrives, so an export
+never holds more than a page in memory.
+"""
+
+import csv
+import io
+from typing import Dict, List
+
+from app.utils.serialization import dumps, dumps_with_raw
+
+# Export columns, in order (all_predictions and weather_data are JSON text in CSV/Parquet)
+EXPORT_COLUMNS = (
+    "id", "timestamp", "farmer_id", "farm_id", "latitude", "longitude",
+    "prediction", "confidence", "all_predictions", "weather_data", "image_url",
+)
+
+
+class NDJSONEncoder:
+    """One JSON object per line; weather_data is spliced in as stored."""
+
+    media_type = "application/x-ndjson"
+    extension = "ndjson"
+
+    def header(self) -> bytes:
+        return b""
+
+    def encode(self, rows: List[Dict]) -> bytes:
+        return b"".join(dumps_with_raw(row, {"weather_data": row.pop("weather_data")}) + b"\n" for row in rows)
+
+    def close(self) -> bytes:
+        return b""
+
+
+class CSVEncoder:
+    """RFC 4180 CSV with a header row; nested values are JSON text."""
+
+    media_type = "text/csv"
+    extension = "csv"
+
+    def _lines(self, rows) -> bytes:
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        return buffer.getvalue().encode("utf-8")
+
+    def header(self) -> bytes:
+        return self._lines([EXPORT_COLUMNS])
+
+    def encode(self, rows: List[Dict]) -> bytes:
+        for row in rows:
+            row["all_predictions"] = dumps(row["all_predictions"]).decode("utf-8")
+        return self._lines([[row[column] for column in EXPORT_COLUMNS] for row in rows])
+
+    def close(self) -> bytes:
+        return b""
+
+
+class _DrainableSink:
+    """Write-only file object whose contents are handed out and dropped by drain()."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+
+class ParquetEncoder:
+    """
+    Parquet with one row group per page, written with pyarrow (optional
+    dependency). Row groups are drained to the response as soon as they are
+    written; the footer follows the last one.
+    """
+
+    media_type = "application/vnd.apache.parquet"
+    extension = "parquet"
+
+    def __init__(self):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise RuntimeError("Parquet export needs pyarrow. Run: pip install pyarrow") from e
+
+        self._pa = pa
+        self._schema = pa.schema([
+            ("id", pa.int64()),
+            ("timestamp", pa.string()),
+            ("farmer_id", pa.string()),
+            ("farm_id", pa.int64()),
+            ("latitude", pa.float64()),
+            ("longitude", pa.float64()),
+            ("prediction", pa.string()),
+            ("confidence", pa.float64()),
+            ("all_predictions", pa.string()),
+            ("weather_data", pa.string()),
+            ("image_url", pa.string()),
+        ])
+        self._sink = _DrainableSink()
+        self._writer = pq.ParquetWriter(self._sink, self._schema, compression="zstd")
+
+    def header(self) -> bytes:
+        return self._sink.drain()
+
+    def encode(self, rows: List[Dict]) -> bytes:
+        for row in rows:
+            row["all_predictions"] = dumps(row["all_predictions"]).decode("utf-8")
+        columns = {column: [row[column] for row in rows] for column in EXPORT_COLUMNS}
+        self._writer.write_table(self._pa.Table.from_pydict(columns, schema=self._schema))
+        return self._sink.drain()
+
+    def close(self) -> bytes:
+        self._writer.close()
+        return self._sink.drain()
+
+
+ENCODERS = {
+    "ndjson": NDJSONEncoder,
+    "csv": CSVEncoder,
+    "parquet": ParquetEncoder,
+}
@@ -0,0 +1,168 @@
+"""
+In-memory point-in-polygon lookup of the farm containing a scan location
+"""
+
+import logging
+import math
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.utils.geo import geojson_polygons
+
+logger = logging.getLogger(__name__)
+
+
+class PreparedBoundary:
+    """
+    A farm boundary parsed once into per-ring coordinate arrays, so a
+    containment test is a few vectorised comparisons (even-odd ray casting;
+    rings after the first of each polygon are holes).
+
+    Raises ValueError if the GeoJSON holds no polygon with at least three
+    in-range [longitude, latitude] points.
+    """
+
+    def __init__(self, geojson: Dict):
+        if not isinstance(geojson, dict):
+            raise ValueError("Farm boundary must be a GeoJSON object")
+        try:
+            polygons = geojson_polygons(geojson)
+            rings_per_polygon = [
+                [np.asarray(ring, dtype=np.float64).reshape(-1, 2) for ring in polygon if len(ring) >= 3]
+                for polygon in polygons
+            ]
+        except (AttributeError, TypeError, ValueError) as e:
+            raise ValueError(f"Malformed farm boundary GeoJSON: {e}") from e
+
+        self.polygons: List[List[Tuple[np.ndarray, np.ndarray]]] = [
+            [(ring[:, 0], ring[:, 1]) for ring in rings] for rings in rings_per_polygon if rings
+        ]
+        if not self.polygons:
+            raise ValueError("Farm boundary has no polygon with at least 3 points")
+        for polygon in self.polygons:
+            for xs, ys in polygon:
+                if not (np.all(np.abs(xs) <= 180) and np.all(np.abs(ys) <= 90)):
+                    raise ValueError("Farm boundary coordinates must be [longitude, latitude] pairs in range")
+
+        lons = np.concatenate([xs for polygon in self.polygons for xs, _ in polygon[:1]])
+        lats = np.concatenate([ys for polygon in self.polygons for _, ys in polygon[:1]])
+        self.bbox = (float(lats.min()), float(lons.min()), float(lats.max()), float(lons.max()))
+
+    @property
+    def area(self) -> float:
+        """Bounding-box area in square degrees (used to prefer the tighter of overlapping farms)."""
+        min_lat, min_lon, max_lat, max_lon = self.bbox
+        return (max_lat - min_lat) * (max_lon - min_lon)
+
+    @staticmethod
+    def _in_ring(xs: np.ndarray, ys: np.ndarray, lon: float, lat: float) -> bool:
+        next_xs, next_ys = np.roll(xs, -1), np.roll(ys, -1)
+        straddles = (ys > lat) != (next_ys > lat)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            crossing_x = xs + (lat - ys) * (next_xs - xs) / (next_ys - ys)
+        return bool(np.count_nonzero(straddles & (lon < crossing_x)) % 2)
+
+    def contains(self, latitude: float, longitude: float) -> bool:
+        min_lat, min_lon, max_lat, max_lon = self.bbox
+        if not (min_lat <= latitude <= max_lat and min_lon <= longitude <= max_lon):
+            return False
+        for polygon in self.polygons:
+            exterior, holes = polygon[0], polygon[1:]
+            if self._in_ring(*exterior, longitude, latitude) and not any(
+                self._in_ring(*hole, longitude, latitude) for hole in holes
+            ):
+                return True
+        return False
+
+
+class FarmIndex:
+    """
+    Farm boundaries bucketed by bounding box into a uniform lat/lon grid.
+    A lookup checks only the farms whose bbox overlaps the point's grid cell.
+
+    The index reloads itself whenever store.farms_version changes (bumped by
+    save_farm), so callers never see stale boundaries. Boundaries wider or
+    taller than max_span_degrees are rejected by prepare(), which bounds the
+    grid cells one farm can occupy.
+    """
+
+    def __init__(self, store, cell_size: float, max_span_degrees: float = 1.0):
+        self.store = store
+        self.cell_size = cell_size
+        self.max_span_degrees = max_span_degrees
+        self._grid: Dict[Tuple[int, int], List[Tuple[int, PreparedBoundary]]] = {}
+        self._farms = 0
+        self._version: Optional[int] = None
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.lookups = 0
+        self.hits = 0
+        self.skipped = 0
+
+    def _cell(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        return math.floor(latitude / self.cell_size), math.floor(longitude / self.cell_size)
+
+    def prepare(self, geojson: Dict) -> PreparedBoundary:
+        """Parse a boundary for this index; raises ValueError if it is malformed or too large."""
+        boundary = PreparedBoundary(geojson)
+        min_lat, min_lon, max_lat, max_lon = boundary.bbox
+        if max_lat - min_lat > self.max_span_degrees or max_lon - min_lon > self.max_span_degrees:
+            raise ValueError(f"Farm boundary spans more than {self.max_span_degrees} degrees")
+        return boundary
+
+    def _load(self, version: int):
+        started = time.perf_counter()
+        grid: Dict[Tuple[int, int], List[Tuple[int, PreparedBoundary]]] = {}
+        farms = skipped = 0
+        for farm in self.store.get_all_farms():
+            # Rows saved before boundaries were validated must not break every scan write
+            try:
+                boundary = self.prepare(farm["boundary_geojson"])
+            except ValueError as e:
+                skipped += 1
+                logger.warning(f"Farm {farm['id']} left out of the farm index: {e}")
+                continue
+            farms += 1
+            min_lat, min_lon, max_lat, max_lon = boundary.bbox
+            (row_lo, col_lo), (row_hi, col_hi) = self._cell(min_lat, min_lon), self._cell(max_lat, max_lon)
+            for row in range(row_lo, row_hi + 1):
+                for col in range(col_lo, col_hi + 1):
+                    grid.setdefault((row, col), []).append((farm["id"], boundary))
+
+        # Smallest first, so a farm nested inside a larger one wins
+        for entries in grid.values():
+            entries.sort(key=lambda entry: entry[1].area)
+        self._grid, self._farms, self._version = grid, farms, version
+        self.skipped = skipped
+        self.loads += 1
+        logger.info(f"Farm index loaded {farms} farms in {(time.perf_counter() - started) * 1000:.1f}ms")
+
+    def locate(self, latitude: Optional[float], longitude: Optional[float]) -> Optional[int]:
+        """Id of the farm whose boundary contains the point, or None."""
+        if latitude is None or longitude is None:
+            return None
+        version = self.store.farms_version
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._load(version)
+
+        self.lookups += 1
+        for farm_id, boundary in self._grid.get(self._cell(latitude, longitude), ()):
+            if boundary.contains(latitude, longitude):
+                self.hits += 1
+                return farm_id
+        return None
+
+    def stats(self) -> Dict:
+        return {
+            "farms": self._farms,
+            "grid_cells": len(self._grid),
+            "loads": self.loads,
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "skipped": self.skipped,
+        }
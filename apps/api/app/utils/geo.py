@@ -0,0 +1,163 @@
+"""
+Small geographic helpers shared by the weather, map and farm utilities
+"""
+
+import math
+from typing import Dict, List, Optional, Tuple
+
+
+def snap_to_grid(latitude: float, longitude: float, resolution: float) -> Tuple[float, float]:
+    """
+    Snap a coordinate to the centre of its grid cell (cells are `resolution`
+    degrees on a side), so nearby points share one cache key / upstream call.
+    """
+    lat = (math.floor(latitude / resolution) + 0.5) * resolution
+    lon = (math.floor(longitude / resolution) + 0.5) * resolution
+    # Round away float noise so equal cells produce identical keys and URLs
+    return round(lat, 6), round(lon, 6)
+
+
+_GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash_encode(latitude: float, longitude: float, precision: int) -> str:
+    """Standard base-32 geohash of a point; each extra character narrows the cell 32x."""
+    lat_lo, lat_hi = -90.0, 90.0
+    lon_lo, lon_hi = -180.0, 180.0
+    chars = []
+    bits = 0
+    value = 0
+    even = True  # bits alternate longitude, latitude, starting with longitude
+    while len(chars) < precision:
+        if even:
+            mid = (lon_lo + lon_hi) / 2
+            if longitude >= mid:
+                value = (value << 1) | 1
+                lon_lo = mid
+            else:
+                value <<= 1
+                lon_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if latitude >= mid:
+                value = (value << 1) | 1
+                lat_lo = mid
+            else:
+                value <<= 1
+                lat_hi = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_GEOHASH_ALPHABET[value])
+            bits = 0
+            value = 0
+    return "".join(chars)
+
+
+def geohash_bounds(geohash: str) -> Tuple[float, float, float, float]:
+    """(min_lat, min_lon, max_lat, max_lon) of a geohash cell."""
+    lat_lo, lat_hi = -90.0, 90.0
+    lon_lo, lon_hi = -180.0, 180.0
+    even = True
+    for char in geohash:
+        value = _GEOHASH_ALPHABET.index(char)
+        for shift in range(4, -1, -1):
+            bit = (value >> shift) & 1
+            if even:
+                mid = (lon_lo + lon_hi) / 2
+                lon_lo, lon_hi = (mid, lon_hi) if bit else (lon_lo, mid)
+            else:
+                mid = (lat_lo + lat_hi) / 2
+                lat_lo, lat_hi = (mid, lat_hi) if bit else (lat_lo, mid)
+            even = not even
+    return lat_lo, lon_lo, lat_hi, lon_hi
+
+
+def geohash_intersects(geohash: str, min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> bool:
+    """Whether a geohash cell overlaps a lat/lon bounding box (edges count)."""
+    cell_min_lat, cell_min_lon, cell_max_lat, cell_max_lon = geohash_bounds(geohash)
+    return cell_max_lat >= min_lat and cell_min_lat <= max_lat and cell_max_lon >= min_lon and cell_min_lon <= max_lon
+
+
+def geohash_cover(min_lat: float, min_lon: float, max_lat: float, max_lon: float, precision: int,
+                  max_cells: int = 32) -> List[str]:
+    """
+    Geohash prefixes whose cells together cover a bounding box, at most
+    `precision` characters long and at most max_cells of them; a large box is
+    covered by shorter (coarser) prefixes.
+    """
+    for length in range(precision, 0, -1):
+        lon_bits, lat_bits = (5 * length + 1) // 2, 5 * length // 2
+        width, height = 360.0 / (1 << lon_bits), 180.0 / (1 << lat_bits)
+        # Column/row indices of the cells holding each edge (the +90/+180 edges belong to the last cell)
+        rows = [min(int((lat + 90.0) // height), (1 << lat_bits) - 1) for lat in (min_lat, max_lat)]
+        cols = [min(int((lon + 180.0) // width), (1 << lon_bits) - 1) for lon in (min_lon, max_lon)]
+        if (rows[1] - rows[0] + 1) * (cols[1] - cols[0] + 1) <= max_cells or length == 1:
+            return sorted({
+                geohash_encode(-90.0 + (row + 0.5) * height, -180.0 + (col + 0.5) * width, length)
+                for row in range(rows[0], rows[1] + 1)
+                for col in range(cols[0], cols[1] + 1)
+            })
+    return []
+
+
+def geohash_centre(geohash: str) -> Tuple[float, float]:
+    """(latitude, longitude) of a geohash cell's centre."""
+    min_lat, min_lon, max_lat, max_lon = geohash_bounds(geohash)
+    return round((min_lat + max_lat) / 2, 6), round((min_lon + max_lon) / 2, 6)
+
+
+
+def geojson_polygons(geojson: Dict) -> List[List[List[Tuple[float, float]]]]:
+    """
+    Extract polygons from a GeoJSON Feature, FeatureCollection, Polygon or
+    MultiPolygon. Each polygon is a list of rings (exterior first), each ring
+    a list of (longitude, latitude) pairs.
+    """
+    if not geojson:
+        return []
+    kind = geojson.get("type")
+    if kind == "FeatureCollection":
+        return [polygon for feature in geojson.get("features", []) for polygon in geojson_polygons(feature)]
+    if kind == "Feature":
+        return geojson_polygons(geojson.get("geometry") or {})
+    if kind == "Polygon":
+        return [[[(float(x), float(y)) for x, y, *_ in ring] for ring in geojson.get("coordinates", [])]]
+    if kind == "MultiPolygon":
+        return [
+            [[(float(x), float(y)) for x, y, *_ in ring] for ring in polygon]
+            for polygon in geojson.get("coordinates", [])
+        ]
+    return []
+
+
+def geojson_centroid(geojson: Dict) -> Optional[Tuple[float, float]]:
+    """Area-weighted centroid (latitude, longitude) of a GeoJSON boundary's exterior rings."""
+    total_area = 0.0
+    cx = cy = 0.0
+    vertices = []
+    for polygon in geojson_polygons(geojson):
+        if polygon and len(polygon[0]) >= 3:
+            vertices.extend(polygon[0])
+    if not vertices:
+        return None
+
+    # Work relative to the first vertex; shoelace sums lose precision at large coordinates
+    x0, y0 = vertices[0]
+    for polygon in geojson_polygons(geojson):
+        if not polygon or len(polygon[0]) < 3:
+            continue
+        ring = [(x - x0, y - y0) for x, y in polygon[0]]
+        for (x1, y1), (x2, y2) in zip(ring, ring[1:] + ring[:1]):
+            cross = x1 * y2 - x2 * y1
+            total_area += cross
+            cx += (x1 + x2) * cross
+            cy += (y1 + y2) * cross
+
+    if abs(total_area) > 1e-18:
+        return y0 + cy / (3 * total_area), x0 + cx / (3 * total_area)
+    # Degenerate (zero-area) boundary: fall back to the vertex mean
+    return (
+        sum(y for _, y in vertices) / len(vertices),
+        sum(x for x, _ in vertices) / len(vertices),
+    )
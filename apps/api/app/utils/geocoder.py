@@ -0,0 +1,152 @@
+"""
+Offline reverse geocoding over a GeoNames cities dump
+(e.g. https://download.geonames.org/export/dump/cities500.zip)
+"""
+
+import logging
+import math
+import os
+import threading
+import time
+from array import array
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Column positions in the GeoNames tab-separated dump
+_NAME, _LATITUDE, _LONGITUDE, _COUNTRY = 1, 4, 5, 8
+
+
+def _to_unit_vectors(latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+    """Lat/lon (degrees) to 3-D points on the unit sphere; Euclidean order matches great-circle order."""
+    lat = np.radians(latitudes)
+    lon = np.radians(longitudes)
+    return np.column_stack((np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat))).astype(np.float64)
+
+
+class OfflineGeocoder:
+    """
+    Nearest-place lookup over an implicit KD-tree.
+
+    Places are stored as packed coordinate arrays (x, y, z on the unit sphere),
+    permuted so that every subrange [lo, hi) is a balanced subtree whose root
+    is its median element. No node objects are allocated, and a query visits
+    O(log n) points.
+    """
+
+    def __init__(self, path: str, max_distance_km: float):
+        self.path = path
+        self.max_distance_km = max_distance_km
+        # Chord length on the unit sphere equivalent to max_distance_km
+        self._max_chord = 2 * math.sin(min(max_distance_km / EARTH_RADIUS_KM, math.pi) / 2)
+        self._points: Optional[Tuple[array, array, array]] = None
+        self._names: List[str] = []
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.misses = 0
+
+    @property
+    def loaded(self) -> bool:
+        return self._points is not None
+
+    def load(self) -> bool:
+        """Parse the gazetteer and build the index. Returns False if the file is missing."""
+        if not os.path.exists(self.path):
+            logger.warning(f"GeoNames file not found at {self.path}; offline geocoding disabled")
+            return False
+
+        started = time.perf_counter()
+        names, latitudes, longitudes = [], [], []
+        with open(self.path, encoding="utf-8") as handle:
+            for line in handle:
+                columns = line.rstrip("\n").split("\t")
+                if len(columns) <= _COUNTRY:
+                    continue
+                names.append(columns[_NAME])
+                latitudes.append(float(columns[_LATITUDE]))
+                longitudes.append(float(columns[_LONGITUDE]))
+
+        points = _to_unit_vectors(np.array(latitudes), np.array(longitudes))
+        order = np.arange(len(points))
+        self._build(points, order)
+
+        with self._lock:
+            ordered = points[order]
+            # array('d') element access is much cheaper than numpy scalar indexing
+            self._points = tuple(array("d", ordered[:, axis].tobytes()) for axis in range(3))
+            self._names = [names[i] for i in order]
+        logger.info(f"Offline geocoder indexed {len(names)} places in {time.perf_counter() - started:.2f}s")
+        return True
+
+    def _build(self, points: np.ndarray, order: np.ndarray):
+        """Permute `order` so each subrange's median splits it on the current axis."""
+        stack = [(0, len(order), 0)]
+        while stack:
+            lo, hi, axis = stack.pop()
+            if hi - lo <= 1:
+                continue
+            mid = (lo + hi) // 2
+            segment = order[lo:hi]
+            partitioned = np.argpartition(points[segment, axis], mid - lo)
+            order[lo:hi] = segment[partitioned]
+            next_axis = (axis + 1) % 3
+            stack.append((lo, mid, next_axis))
+            stack.append((mid + 1, hi, next_axis))
+
+    def nearest(self, latitude: float, longitude: float) -> Optional[Tuple[str, float]]:
+        """Return (place name, distance km) of the closest place within max_distance_km."""
+        points = self._points
+        if points is None:
+            return None
+
+        lat, lon = math.radians(latitude), math.radians(longitude)
+        qx, qy, qz = math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat)
+        best_index = -1
+        best_sq = self._max_chord ** 2
+
+        # Entries are (lo, hi, axis, squared distance to the subtree's splitting plane)
+        xs, ys, zs = points
+        stack = [(0, len(xs), 0, 0.0)]
+        while stack:
+            lo, hi, axis, plane_sq = stack.pop()
+            if lo >= hi or plane_sq >= best_sq:
+                continue
+            mid = (lo + hi) // 2
+            dx, dy, dz = qx - xs[mid], qy - ys[mid], qz - zs[mid]
+            distance_sq = dx * dx + dy * dy + dz * dz
+            if distance_sq < best_sq:
+                best_sq = distance_sq
+                best_index = mid
+
+            delta = (dx, dy, dz)[axis]
+            next_axis = (axis + 1) % 3
+            if delta < 0:
+                near, far = (lo, mid), (mid + 1, hi)
+            else:
+                near, far = (mid + 1, hi), (lo, mid)
+            # Far side is pushed first so the near side is searched (and best_sq tightened) first
+            stack.append((far[0], far[1], next_axis, delta * delta))
+            stack.append((near[0], near[1], next_axis, 0.0))
+
+        with self._lock:
+            self.lookups += 1
+            if best_index < 0:
+                self.misses += 1
+                return None
+
+        chord = math.sqrt(best_sq)
+        distance_km = 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2))
+        return self._names[best_index], round(distance_km, 2)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "loaded": self.loaded,
+                "places": len(self._names),
+                "lookups": self.lookups,
+                "misses": self.misses,
+            }
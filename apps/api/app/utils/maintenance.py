@@ -0,0 +1,65 @@
+"""
+Offline maintenance commands for the scan database
+
+    python -m app.utils.maintenance rebuild-rollups
+    python -m app.utils.maintenance compact-predictions
+    python -m app.utils.maintenance assign-farms
+    python -m app.utils.maintenance archive-scans
+"""
+
+import argparse
+import logging
+import time
+
+from app.utils.archive import scan_archiver
+from app.utils.database import db
+
+logger = logging.getLogger(__name__)
+
+
+def rebuild_rollups(args):
+    started = time.perf_counter()
+    counts = db.rebuild_rollups()
+    print(f"Rebuilt rollups from scans in {time.perf_counter() - started:.1f}s: {counts}")
+
+
+def compact_predictions(args):
+    started = time.perf_counter()
+    converted = db.compact_scan_predictions()
+    print(f"Re-encoded all_predictions of {converted} scans in {time.perf_counter() - started:.1f}s")
+
+
+def assign_farms(args):
+    started = time.perf_counter()
+    tagged = db.assign_all_scan_farms()
+    print(f"Assigned {tagged} scans to farms in {time.perf_counter() - started:.1f}s")
+
+
+def archive_scans(args):
+    started = time.perf_counter()
+    result = scan_archiver.run()
+    print(f"Archived scans before {result['cutoff']} in {time.perf_counter() - started:.1f}s: {result['moved']}")
+    print(f"Hot database is now {result['size_bytes']} bytes")
+
+
+COMMANDS = {
+    "rebuild-rollups": (rebuild_rollups, "Recompute the disease-incidence rollups from the scans table"),
+    "compact-predictions": (compact_predictions, "Convert JSON all_predictions of older scans to the compact format"),
+    "assign-farms": (assign_farms, "Tag scans that lie inside a registered farm boundary with its farm id"),
+    "archive-scans": (archive_scans, "Move scans older than ARCHIVE_HOT_MONTHS to monthly archive files, then VACUUM/ANALYZE"),
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.utils.maintenance", description=__doc__.strip().splitlines()[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for name, (handler, help_text) in COMMANDS.items():
+        subparsers.add_parser(name, help=help_text).set_defaults(handler=handler)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""
+Lightweight in-process metrics used to tune batching, caching and write paths
+"""
+
+import bisect
+import threading
+from typing import Dict, List, Sequence
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram. Each bucket counts observations <= its upper bound;
+    the last bucket ("+Inf") catches everything larger.
+    """
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds: List[float] = sorted(bounds)
+        self._counts = [0] * (len(self.bounds) + 1)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        with self._lock:
+            self._counts[bisect.bisect_left(self.bounds, value)] += 1
+            self.count += 1
+            self.total += value
+            if value > self.max:
+                self.max = value
+
+    def stats(self) -> Dict:
+        with self._lock:
+            labels = [f"<={bound:g}" for bound in self.bounds] + ["+Inf"]
+            return {
+                "count": self.count,
+                "mean": round(self.total / self.count, 3) if self.count else 0.0,
+                "max": round(self.max, 3),
+                "buckets": dict(zip(labels, self._counts)),
+            }
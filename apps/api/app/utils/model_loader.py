@@ -1,10 +1,20 @@
 """
-Utility functions for Azure Custom Vision disease prediction
+Utility functions for disease prediction (Azure Custom Vision or a local CPU model)
 """
 
+import hashlib
 import logging
+import os
+import threading
+import time
 from io import BytesIO
-from PIL import Image
+from typing import Dict, List, Optional
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from app.utils.cache import LRUCache
+from app.utils.metrics import Histogram
 
 logger = logging.getLogger(__name__)
 
@@ -31,6 +41,11 @@ class AzurePredictor:
         self.iteration_name = iteration_name
         logger.info("Azure Custom Vision predictor initialised successfully.")
 
+    @property
+    def cache_namespace(self) -> str:
+        """Identifies the model that produced a result; changes with the iteration."""
+        return f"azure:{self.project_id}:{self.iteration_name}"
+
     def classify_image_bytes(self, image_bytes: bytes) -> dict:
         """
         Send raw image bytes to Azure Custom Vision and return a normalised result.
@@ -62,6 +77,359 @@ class AzurePredictor:
         }
 
 
+class LocalPredictor:
+    """
+    Runs a local Keras (.h5/.keras), TFLite (.tflite) or ONNX (.onnx) model on CPU.
+    Exposes the same classify_image_bytes() interface as AzurePredictor.
+    """
+
+    def __init__(self, model_path: str, class_names: List[str], input_size: int = 224,
+                 intra_op_threads: int = 0, inter_op_threads: int = 0, rescale: bool = True):
+        if not os.path.exists(model_path):
+            raise RuntimeError(f"Local model not found: {model_path}")
+
+        self.model_path = model_path
+        self.class_names = list(class_names)
+        self.input_size = input_size
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        self.rescale = rescale
+        # TFLite interpreters and Keras models are not safe to call concurrently
+        self._lock = threading.Lock()
+        # Set by the loaders when the model was exported with a static batch dimension
+        self.fixed_batch_size: Optional[int] = None
+
+        extension = os.path.splitext(model_path)[1].lower()
+        if extension in (".h5", ".keras"):
+            self._load_keras()
+        elif extension == ".tflite":
+            self._load_tflite()
+        elif extension == ".onnx":
+            self._load_onnx()
+        else:
+            raise RuntimeError(f"Unsupported local model format: {extension}")
+
+        self._model_version = f"{os.path.basename(model_path)}@{int(os.path.getmtime(model_path))}"
+        logger.info(f"Local {self.runtime} predictor loaded from {model_path}")
+
+    @property
+    def cache_namespace(self) -> str:
+        """Identifies the model that produced a result; changes when the file is replaced."""
+        return f"local:{self._model_version}"
+
+    def _load_keras(self):
+        try:
+            import tensorflow as tf
+        except ImportError as e:
+            raise RuntimeError("TensorFlow not installed. Run: pip install tensorflow-cpu") from e
+
+        # Thread pools must be sized before the TF runtime initialises
+        if self.intra_op_threads:
+            tf.config.threading.set_intra_op_parallelism_threads(self.intra_op_threads)
+        if self.inter_op_threads:
+            tf.config.threading.set_inter_op_parallelism_threads(self.inter_op_threads)
+
+        model = tf.keras.models.load_model(self.model_path, compile=False)
+        self.fixed_batch_size = _static_dim(model.inputs[0].shape[0])
+        self.runtime = "keras"
+        self._channels_first = False
+        self._run = lambda batch: model(batch, training=False).numpy()
+
+    def _load_tflite(self):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            try:
+                from tensorflow.lite import Interpreter
+            except ImportError as e:
+                raise RuntimeError("TFLite runtime not installed. Run: pip install tflite-runtime") from e
+
+        interpreter = Interpreter(model_path=self.model_path, num_threads=self.intra_op_threads or None)
+        input_details = interpreter.get_input_details()[0]
+        input_index = input_details["index"]
+        input_dtype = input_details["dtype"]
+        output_index = interpreter.get_output_details()[0]["index"]
+        interpreter.allocate_tensors()
+        # shape_signature has -1 for dynamic dims (older runtimes omit it: assume resizable)
+        signature = input_details.get("shape_signature")
+        if signature is not None and len(signature) and signature[0] > 0:
+            self.fixed_batch_size = int(input_details["shape"][0])
+        allocated_batch = [int(input_details["shape"][0])]
+
+        def _run(batch):
+            if batch.shape[0] != allocated_batch[0]:
+                interpreter.resize_tensor_input(input_index, batch.shape)
+                interpreter.allocate_tensors()
+                allocated_batch[0] = batch.shape[0]
+            interpreter.set_tensor(input_index, batch.astype(input_dtype, copy=False))
+            interpreter.invoke()
+            return interpreter.get_tensor(output_index)
+
+        self.runtime = "tflite"
+        self._channels_first = False
+        self._run = _run
+
+    def _load_onnx(self):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise RuntimeError("ONNX Runtime not installed. Run: pip install onnxruntime") from e
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = self.intra_op_threads
+        options.inter_op_num_threads = self.inter_op_threads
+        session = ort.InferenceSession(self.model_path, options, providers=["CPUExecutionProvider"])
+        model_input = session.get_inputs()[0]
+        self.fixed_batch_size = _static_dim(model_input.shape[0])
+        self._channels_first = len(model_input.shape) == 4 and model_input.shape[1] == 3
+        self.runtime = "onnx"
+        self._run = lambda batch: session.run(None, {model_input.name: batch})[0]
+
+    def to_array(self, image_bytes: bytes) -> np.ndarray:
+        """Decode and resize an image into the model's input layout."""
+        image = Image.open(BytesIO(image_bytes)).convert("RGB")
+        image = image.resize((self.input_size, self.input_size), Image.BILINEAR)
+        array = np.asarray(image, dtype=np.float32)
+        if self.rescale:
+            array /= 255.0
+        if self._channels_first:
+            array = array.transpose(2, 0, 1)
+        return array
+
+    def _to_result(self, scores: np.ndarray) -> dict:
+        if len(scores) != len(self.class_names):
+            raise ValueError(
+                f"Model returned {len(scores)} scores but {len(self.class_names)} class names are configured."
+            )
+        # Models exported without a final softmax return logits
+        if scores.min() < 0 or abs(float(scores.sum()) - 1.0) > 1e-3:
+            exp = np.exp(scores - scores.max())
+            scores = exp / exp.sum()
+
+        order = np.argsort(scores)[::-1]
+        top = int(order[0])
+        return {
+            "prediction": self.class_names[top],
+            "confidence": round(float(scores[top]), 4),
+            "all_predictions": {self.class_names[i]: round(float(scores[i]), 4) for i in order}
+        }
+
+    def classify_arrays(self, arrays: List[np.ndarray]) -> List[dict]:
+        """Classify several decoded images (see to_array) in one forward pass."""
+        batch = np.stack(arrays)
+        size = self.fixed_batch_size
+        with self._lock:
+            if size is None:
+                scores = np.asarray(self._run(batch), dtype=np.float32)
+            else:
+                # Static batch dimension: run slices of exactly `size`, padding the last one
+                parts = []
+                for start in range(0, len(batch), size):
+                    chunk = batch[start:start + size]
+                    rows = len(chunk)
+                    if rows < size:
+                        chunk = np.concatenate([chunk, np.repeat(chunk[-1:], size - rows, axis=0)])
+                    parts.append(np.asarray(self._run(chunk), dtype=np.float32)[:rows])
+                scores = np.concatenate(parts)
+        return [self._to_result(row) for row in scores]
+
+    def classify_batch(self, images: List[bytes]) -> List[dict]:
+        """Classify several images in one forward pass."""
+        return self.classify_arrays([self.to_array(image_bytes) for image_bytes in images])
+
+    def classify_image_bytes(self, image_bytes: bytes) -> dict:
+        """Classify a single image; same result shape as AzurePredictor."""
+        return self.classify_batch([image_bytes])[0]
+
+    def warmup(self):
+        """Run one dummy inference so the first real request doesn't pay graph/kernel setup."""
+        started = time.perf_counter()
+        image = Image.new("RGB", (self.input_size, self.input_size), (90, 140, 60))
+        buffer = BytesIO()
+        image.save(buffer, format="JPEG")
+        self.classify_image_bytes(buffer.getvalue())
+        logger.info(f"Local predictor warmed up in {(time.perf_counter() - started) * 1000:.0f}ms")
+
+
+class CascadePredictor:
+    """
+    Confidence-gated cascade: a cheap local model answers first and the remote
+    predictor (Azure) is only called when the local top-1 confidence is below
+    min_confidence or the top-1/top-2 margin is below min_margin.
+    Each result carries a "stage" field naming the model that answered.
+    """
+
+    def __init__(self, local, remote, min_confidence: float, min_margin: float):
+        self.local = local
+        self.remote = remote
+        self.min_confidence = min_confidence
+        self.min_margin = min_margin
+        self._lock = threading.Lock()
+        self.local_answers = 0
+        self.remote_answers = 0
+        self.remote_failures = 0
+        self.local_ms = Histogram([10, 25, 50, 100, 250, 500, 1000])
+        self.remote_ms = Histogram([100, 250, 500, 1000, 2500, 5000, 10000])
+
+    @property
+    def cache_namespace(self) -> str:
+        return (
+            f"cascade:{self.local.cache_namespace}+{self.remote.cache_namespace}"
+            f":{self.min_confidence}:{self.min_margin}"
+        )
+
+    def _is_confident(self, result: dict) -> bool:
+        scores = sorted(result["all_predictions"].values(), reverse=True)
+        margin = scores[0] - scores[1] if len(scores) > 1 else scores[0]
+        return result["confidence"] >= self.min_confidence and margin >= self.min_margin
+
+    def classify_image_bytes(self, image_bytes: bytes) -> dict:
+        started = time.perf_counter()
+        local_result = self.local.classify_image_bytes(image_bytes)
+        self.local_ms.observe((time.perf_counter() - started) * 1000)
+
+        if self._is_confident(local_result):
+            with self._lock:
+                self.local_answers += 1
+            return {**local_result, "stage": "local"}
+
+        started = time.perf_counter()
+        try:
+            remote_result = self.remote.classify_image_bytes(image_bytes)
+        except Exception as e:
+            # Azure is down or over quota: an unsure local answer beats a 502
+            logger.error(f"Cascade remote stage failed, answering from local model: {e}")
+            with self._lock:
+                self.remote_failures += 1
+            return {**local_result, "stage": "local_fallback"}
+        self.remote_ms.observe((time.perf_counter() - started) * 1000)
+
+        with self._lock:
+            self.remote_answers += 1
+        return {**remote_result, "stage": "remote"}
+
+    def close(self):
+        for stage in (self.local, self.remote):
+            if hasattr(stage, "close"):
+                stage.close()
+
+    def stats(self) -> dict:
+        local_latency = self.local_ms.stats()
+        remote_latency = self.remote_ms.stats()
+        with self._lock:
+            total = self.local_answers + self.remote_answers + self.remote_failures
+            return {
+                "min_confidence": self.min_confidence,
+                "min_margin": self.min_margin,
+                "local_answers": self.local_answers,
+                "remote_answers": self.remote_answers,
+                "remote_failures": self.remote_failures,
+                "local_answer_rate": round(self.local_answers / total, 4) if total else 0.0,
+                # Every local answer is one Azure call (and its round-trip) avoided
+                "remote_calls_saved": self.local_answers,
+                "estimated_remote_ms_saved": round(self.local_answers * remote_latency["mean"], 1),
+                "local_latency_ms": local_latency,
+                "remote_latency_ms": remote_latency,
+                "local": self.local.stats() if hasattr(self.local, "stats") else None,
+            }
+
+
+class CachedPredictor:
+    """
+    Content-addressed cache in front of a predictor's classify_image_bytes().
+
+    Results are keyed on the SHA-256 of the image bytes plus the predictor's
+    cache_namespace (project ID and iteration name), held in an in-memory LRU
+    tier and persisted in the database so they survive restarts. Entries from
+    any other namespace are purged on startup, so publishing a new iteration
+    invalidates the cache.
+    """
+
+    # Trim the persistent tier after this many inserts
+    PRUNE_EVERY = 100
+
+    def __init__(self, predictor, store, max_entries: int, ttl_seconds: float, max_rows: int):
+        self.predictor = predictor
+        self.store = store
+        self.namespace = predictor.cache_namespace
+        self.ttl_seconds = ttl_seconds
+        self.max_rows = max_rows
+        self._memory = LRUCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self._lock = threading.Lock()
+        self._inserts = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        deleted = self.store.prune_prediction_cache(self.namespace, ttl_seconds, max_rows)
+        logger.info(f"Prediction cache ready for {self.namespace} ({deleted} stale entries purged)")
+
+    def __getattr__(self, name):
+        # Expose the wrapped predictor's attributes (project_id, iteration_name, ...)
+        return getattr(self.predictor, name)
+
+    def cache_key(self, image_bytes: bytes) -> str:
+        return f"{self.namespace}:{hashlib.sha256(image_bytes).hexdigest()}"
+
+    def lookup(self, image_bytes: bytes) -> Optional[dict]:
+        """Return the cached result for these exact bytes, or None (without classifying)."""
+        key = self.cache_key(image_bytes)
+
+        result = self._memory.get(key)
+        if result is not None:
+            return {**result, "cached": True}
+
+        result = self.store.get_cached_prediction(key, self.ttl_seconds)
+        if result is not None:
+            with self._lock:
+                self.disk_hits += 1
+            self._memory.set(key, result)
+            return {**result, "cached": True}
+        return None
+
+    def classify_image_bytes(self, image_bytes: bytes) -> dict:
+        """Return a cached result when available, otherwise classify and cache it."""
+        result = self.lookup(image_bytes)
+        if result is not None:
+            return result
+        return self.classify_and_cache(image_bytes)
+
+    def classify_and_cache(self, image_bytes: bytes) -> dict:
+        """Classify after a lookup() miss and store the result in both tiers."""
+        key = self.cache_key(image_bytes)
+        with self._lock:
+            self.misses += 1
+        result = self.predictor.classify_image_bytes(image_bytes)
+        self._memory.set(key, result)
+        self.store.save_cached_prediction(key, self.namespace, result)
+
+        with self._lock:
+            self._inserts += 1
+            prune = self._inserts % self.PRUNE_EVERY == 0
+        if prune:
+            self.store.prune_prediction_cache(self.namespace, self.ttl_seconds, self.max_rows)
+
+        return {**result, "cached": False}
+
+    def stats(self) -> dict:
+        """Hit/miss counters for both cache tiers."""
+        memory = self._memory.stats()
+        with self._lock:
+            lookups = memory["hits"] + self.disk_hits + self.misses
+            return {
+                "namespace": self.namespace,
+                "memory": memory,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((memory["hits"] + self.disk_hits) / lookups, 4) if lookups else 0.0,
+                "backend": self.predictor.stats() if hasattr(self.predictor, "stats") else None,
+            }
+
+
+def _static_dim(dim) -> Optional[int]:
+    """A model input dimension as an int if it is fixed, None if dynamic ('N', None, -1)."""
+    return int(dim) if isinstance(dim, (int, np.integer)) and dim > 0 else None
+
+
 def create_azure_predictor(prediction_key: str, endpoint: str, project_id: str, iteration_name: str):
     """
     Factory function – creates and returns an AzurePredictor instance.
@@ -80,19 +448,157 @@ def create_azure_predictor(prediction_key: str, endpoint: str, project_id: str,
         return None
 
 
-def validate_image(file_bytes: bytes) -> bool:
+def create_local_predictor(model_path: str, class_names: List[str], input_size: int = 224,
+                           intra_op_threads: int = 0, inter_op_threads: int = 0, rescale: bool = True):
+    """
+    Factory function – creates a LocalPredictor and warms it up.
+    Returns None on failure so the API can start without crashing.
     """
-    Validate if file bytes represent a valid image.
+    try:
+        predictor = LocalPredictor(
+            model_path=model_path,
+            class_names=class_names,
+            input_size=input_size,
+            intra_op_threads=intra_op_threads,
+            inter_op_threads=inter_op_threads,
+            rescale=rescale
+        )
+        predictor.warmup()
+        return predictor
+    except Exception as e:
+        logger.error(f"Failed to create local predictor: {e}")
+        return None
+
+
+# 2-D DCT basis for the 32x32 pHash reduction (computed once)
+_PHASH_SIZE = 32
+_DCT_MATRIX = np.array([
+    [np.cos(np.pi * (2 * x + 1) * u / (2 * _PHASH_SIZE)) for x in range(_PHASH_SIZE)]
+    for u in range(_PHASH_SIZE)
+])
+
+
+def compute_phash(image: Image.Image) -> int:
+    """
+    64-bit DCT perceptual hash: robust to re-compression, resizing and small
+    exposure changes, so re-uploads of the same leaf land within a few bits.
+    """
+    gray = image.convert("L").resize((_PHASH_SIZE, _PHASH_SIZE), Image.LANCZOS)
+    pixels = np.asarray(gray, dtype=np.float64)
+    dct = _DCT_MATRIX @ pixels @ _DCT_MATRIX.T
+    low = dct[:8, :8].flatten()
+    # Skip the DC term when choosing the threshold; it only tracks overall brightness
+    bits = low > np.median(low[1:])
+    return int("".join("1" if bit else "0" for bit in bits), 2)
+
+
+def inspect_image(file_bytes: bytes, normalize_max_side: Optional[int] = None,
+                  jpeg_quality: int = 90) -> Optional[Dict]:
+    """
+    Validate image bytes and compute their perceptual hash in the same pass.
+
+    With normalize_max_side set, the same decode also produces the bytes to
+    send to the predictor: EXIF orientation applied, metadata stripped, the
+    longest side shrunk to normalize_max_side and re-encoded as JPEG.
 
     Args:
         file_bytes: Raw file bytes
+        normalize_max_side: Model input resolution to downscale to, or None
+        jpeg_quality: JPEG quality of the normalised image
 
     Returns:
-        True if valid image, False otherwise
+        {"format", "width", "height", "phash", "image_bytes", "preprocessing"}
+        if valid image, None otherwise. "image_bytes" is the original upload
+        and "preprocessing" is None when normalisation is off; the original is
+        also kept when it carries no metadata and the re-encoded JPEG would
+        not be smaller.
     """
+    started = time.perf_counter()
     try:
         image = Image.open(BytesIO(file_bytes))
         image.verify()
-        return True
+        # verify() leaves the image unusable; reopen to decode pixels
+        image = Image.open(BytesIO(file_bytes))
+        info = {"format": image.format, "width": image.width, "height": image.height}
+        metadata = _has_metadata(image)
+
+        if normalize_max_side is None:
+            # JPEG-only shortcut: let libjpeg decode at reduced scale
+            image.draft("L", (_PHASH_SIZE * 4, _PHASH_SIZE * 4))
+            # Hash the upright image in both branches, so stored hashes survive toggling normalisation
+            info["phash"] = compute_phash(ImageOps.exif_transpose(image))
+            info["image_bytes"] = file_bytes
+            info["preprocessing"] = None
+            return info
+
+        image.draft("RGB", (normalize_max_side, normalize_max_side))
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        image.thumbnail((normalize_max_side, normalize_max_side), Image.LANCZOS)
+        info["phash"] = compute_phash(image)
+
+        # convert()/thumbnail() copy Image.info, and the JPEG encoder re-emits its "comment";
+        # with info cleared the re-encode carries no EXIF/XMP/comments, so nothing leaks to Azure
+        image.info = {}
+        output = BytesIO()
+        image.save(output, format="JPEG", quality=jpeg_quality)
+        # Already-small uploads are sent as-is rather than grown, but only if there is
+        # nothing to strip (GPS EXIF, orientation, XMP, comments)
+        reencoded = metadata or output.tell() < len(file_bytes)
+        info["image_bytes"] = output.getvalue() if reencoded else file_bytes
+        info["preprocessing"] = {
+            "reencoded": reencoded,
+            "metadata_stripped": metadata,
+            "original_bytes": len(file_bytes),
+            "sent_bytes": len(info["image_bytes"]),
+            "bytes_saved": len(file_bytes) - len(info["image_bytes"]),
+            "width": image.width,
+            "height": image.height,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
+        preprocessing_stats.record(info["preprocessing"])
+        return info
     except Exception:
-        return False
+        return None
+
+
+# Image.info keys that only describe the encoding, so an upload carrying just these has nothing to strip
+_ENCODING_INFO_KEYS = {
+    "adobe", "adobe_transform", "aspect", "compression", "dpi", "gamma", "interlace", "jfif",
+    "jfif_density", "jfif_unit", "jfif_version", "progression", "progressive", "srgb", "transparency",
+}
+
+
+def _has_metadata(image: Image.Image) -> bool:
+    """Whether a freshly opened upload carries EXIF (incl. orientation/GPS), XMP, comments or text chunks."""
+    return bool(image.getexif()) or any(key not in _ENCODING_INFO_KEYS for key in image.info)
+
+
+class PreprocessingStats:
+    """Running totals for the image normalisation stage."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.images = 0
+        self.original_bytes = 0
+        self.sent_bytes = 0
+        self.elapsed_ms = 0.0
+
+    def record(self, preprocessing: Dict):
+        with self._lock:
+            self.images += 1
+            self.original_bytes += preprocessing["original_bytes"]
+            self.sent_bytes += preprocessing["sent_bytes"]
+            self.elapsed_ms += preprocessing["elapsed_ms"]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "images": self.images,
+                "original_bytes": self.original_bytes,
+                "sent_bytes": self.sent_bytes,
+                "bytes_saved": self.original_bytes - self.sent_bytes,
+                "avg_elapsed_ms": round(self.elapsed_ms / self.images, 2) if self.images else 0.0,
+            }
+
+
+preprocessing_stats = PreprocessingStats()
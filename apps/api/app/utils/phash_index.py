@@ -0,0 +1,159 @@
+"""
+Near-duplicate lookup for leaf images by perceptual-hash Hamming distance
+"""
+
+import logging
+import threading
+import time
+from array import array
+from itertools import combinations
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 64-bit hashes are split into 4 x 16-bit chunks for multi-index hashing
+_CHUNKS = 4
+_CHUNK_BITS = 16
+_CHUNK_MASK = (1 << _CHUNK_BITS) - 1
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def _chunk(phash: int, i: int) -> int:
+    return (phash >> (i * _CHUNK_BITS)) & _CHUNK_MASK
+
+
+def _chunk_variants(value: int, radius: int) -> List[int]:
+    """All 16-bit values within `radius` bit flips of `value`."""
+    variants = [value]
+    for flips in range(1, radius + 1):
+        for bits in combinations(range(_CHUNK_BITS), flips):
+            flipped = value
+            for bit in bits:
+                flipped ^= 1 << bit
+            variants.append(flipped)
+    return variants
+
+
+class PerceptualHashIndex:
+    """
+    Multi-index hash table over 64-bit perceptual hashes.
+
+    Each hash is bucketed under its four 16-bit chunks. By the pigeonhole
+    principle, two hashes within distance d share at least one chunk that
+    differs by at most d // 4 bits, so a lookup only probes those few bucket
+    variants and verifies the candidates - independent of index size.
+
+    Only (phash, row id) pairs live in memory; the prediction itself is read
+    from the image_hashes table when a match is found. Like the prediction
+    cache, the table is bounded by ttl_seconds and max_rows: it is pruned every
+    PRUNE_EVERY inserts and the index is rebuilt when rows were dropped.
+    """
+
+    # Trim the table (and rebuild the index) after this many inserts
+    PRUNE_EVERY = 1000
+
+    def __init__(self, store, namespace: str, max_distance: int, ttl_seconds: float, max_rows: int):
+        self.store = store
+        self.namespace = namespace
+        self.max_distance = max_distance
+        self.ttl_seconds = ttl_seconds
+        self.max_rows = max_rows
+        self._hashes = array("Q")
+        self._row_ids = array("q")
+        self._buckets: List[Dict[int, List[int]]] = [{} for _ in range(_CHUNKS)]
+        self._lock = threading.RLock()
+        self._inserts = 0
+        self.hits = 0
+        self.misses = 0
+        self.pruned = 0
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def load(self):
+        """(Re)build the index from the database, dropping hashes of other models and expired ones."""
+        started = time.perf_counter()
+        self.pruned += self.store.prune_image_hashes(self.namespace, self.ttl_seconds, self.max_rows)
+        hashes, row_ids = array("Q"), array("q")
+        buckets: List[Dict[int, List[int]]] = [{} for _ in range(_CHUNKS)]
+        for row_id, phash in self.store.iter_image_hashes(self.namespace):
+            self._insert(hashes, row_ids, buckets, phash, row_id)
+        with self._lock:
+            self._hashes, self._row_ids, self._buckets = hashes, row_ids, buckets
+        logger.info(
+            f"Perceptual hash index loaded {len(self)} entries "
+            f"in {time.perf_counter() - started:.2f}s"
+        )
+
+    @staticmethod
+    def _insert(hashes: array, row_ids: array, buckets: List[Dict[int, List[int]]], phash: int, row_id: int):
+        position = len(hashes)
+        hashes.append(phash)
+        row_ids.append(row_id)
+        for i in range(_CHUNKS):
+            buckets[i].setdefault(_chunk(phash, i), []).append(position)
+
+    def nearest(self, phash: int) -> Optional[Tuple[int, int]]:
+        """Return (row id, distance) of the closest hash within max_distance, if any."""
+        radius = self.max_distance // _CHUNKS
+        best: Optional[Tuple[int, int]] = None
+        seen = set()
+        with self._lock:
+            for i in range(_CHUNKS):
+                bucket = self._buckets[i]
+                for variant in _chunk_variants(_chunk(phash, i), radius):
+                    for position in bucket.get(variant, ()):
+                        if position in seen:
+                            continue
+                        seen.add(position)
+                        distance = hamming_distance(phash, self._hashes[position])
+                        if distance <= self.max_distance and (best is None or distance < best[1]):
+                            best = (self._row_ids[position], distance)
+                            if distance == 0:
+                                return best
+        return best
+
+    def find(self, phash: int) -> Optional[Dict]:
+        """Return the earlier prediction for a near-duplicate image, if any."""
+        match = self.nearest(phash)
+        # Rows pruned or expired since the index was built read back as None
+        result = self.store.get_image_hash_result(match[0], self.ttl_seconds) if match else None
+        with self._lock:
+            if result is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return {**result, "near_duplicate": True, "near_duplicate_distance": match[1]}
+
+    def add(self, phash: int, result: Dict):
+        """Remember the prediction for this hash."""
+        result = {key: result[key] for key in ("prediction", "confidence", "all_predictions")}
+        row_id = self.store.save_image_hash(self.namespace, phash, result)
+        if row_id < 0:
+            return
+        with self._lock:
+            self._insert(self._hashes, self._row_ids, self._buckets, phash, row_id)
+            self._inserts += 1
+            prune = self._inserts % self.PRUNE_EVERY == 0
+        if prune:
+            deleted = self.store.prune_image_hashes(self.namespace, self.ttl_seconds, self.max_rows)
+            if deleted:
+                self.pruned += deleted
+                self.load()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "namespace": self.namespace,
+                "size": len(self._hashes),
+                "max_distance": self.max_distance,
+                "max_rows": self.max_rows,
+                "pruned": self.pruned,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
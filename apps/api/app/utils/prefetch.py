@@ -0,0 +1,114 @@
+"""
+Background refresh of weather for registered farms, so the first scan of the
+day finds the farm's grid cell already in the weather cache
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.utils.database import db
+from app.utils.executor import blocking_executor
+from app.utils.geo import geojson_centroid, snap_to_grid
+from app.utils.weather_helper import fetch_current_weather_batch
+
+logger = logging.getLogger(__name__)
+
+
+class WeatherPrefetcher:
+    """
+    Periodically computes farm centroids from farms.boundary_geojson, snaps
+    them to weather grid cells and refreshes those cells in batched
+    multi-location Open-Meteo requests.
+    """
+
+    def __init__(self, interval_seconds: float, batch_size: int):
+        self.interval_seconds = interval_seconds
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.errors = 0
+        self.last_run_at: Optional[float] = None
+        self.last_duration_ms: Optional[float] = None
+        self.last_farms = 0
+        self.last_cells = 0
+
+    def farm_cells(self) -> Tuple[int, List[Tuple[float, float]]]:
+        """Unique weather grid cells covering every registered farm."""
+        farms = db.get_all_farms()
+        cells = set()
+        for farm in farms:
+            try:
+                centroid = geojson_centroid(farm["boundary_geojson"])
+            except (AttributeError, TypeError, ValueError) as e:
+                logger.warning(f"Farm {farm['id']} has an unreadable boundary, skipping: {e}")
+                continue
+            if centroid is not None:
+                cells.add(snap_to_grid(centroid[0], centroid[1], settings.WEATHER_GRID_RESOLUTION))
+        return len(farms), sorted(cells)
+
+    def refresh(self):
+        """Fetch weather for all farm cells (blocking; runs on the executor)."""
+        started = time.perf_counter()
+        farm_count, cells = self.farm_cells()
+        for start in range(0, len(cells), self.batch_size):
+            chunk = cells[start:start + self.batch_size]
+            try:
+                fetch_current_weather_batch(chunk)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Weather prefetch failed for {len(chunk)} cells: {e}")
+
+        self.runs += 1
+        self.last_run_at = time.time()
+        self.last_duration_ms = round((time.perf_counter() - started) * 1000, 1)
+        self.last_farms = farm_count
+        self.last_cells = len(cells)
+        logger.info(f"Prefetched weather for {len(cells)} cells ({farm_count} farms) in {self.last_duration_ms}ms")
+
+    async def _loop(self):
+        while True:
+            try:
+                await blocking_executor.run(self.refresh)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Weather prefetch run failed: {e}")
+            await asyncio.sleep(self.interval_seconds)
+
+    def start(self):
+        """Start the refresh loop on the running event loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+            logger.info(f"Weather prefetch scheduled every {self.interval_seconds}s")
+
+    async def stop(self):
+        """Cancel the refresh loop and wait for it to exit."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict:
+        return {
+            "interval_seconds": self.interval_seconds,
+            "runs": self.runs,
+            "errors": self.errors,
+            "last_run_at": self.last_run_at,
+            "last_duration_ms": self.last_duration_ms,
+            "farms": self.last_farms,
+            "cells": self.last_cells,
+        }
+
+
+# Singleton instance
+weather_prefetcher = WeatherPrefetcher(
+    interval_seconds=settings.WEATHER_PREFETCH_INTERVAL_SECONDS,
+    batch_size=settings.WEATHER_PREFETCH_BATCH_SIZE,
+)
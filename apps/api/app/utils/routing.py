@@ -0,0 +1,252 @@
+"""
+Latency-aware routing across several predictor backends, with hedged
+requests and per-backend circuit breakers
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects traffic
+    for `reset_seconds`. Afterwards a single trial request is let through
+    (half-open); its success closes the breaker, its failure re-opens it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def available(self) -> bool:
+        """Whether the backend could take a request now (does not reserve the trial)."""
+        with self._lock:
+            if self.state == self.OPEN:
+                return time.monotonic() - self._opened_at >= self.reset_seconds
+            return self.state == self.CLOSED or not self._trial_in_flight
+
+    def allow(self) -> bool:
+        """Reserve permission to send a request; in half-open state only one trial passes."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info("Circuit breaker closed: backend recovered")
+            self.state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"Circuit breaker opened after {self._failures} consecutive failures")
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+
+class LatencyTracker:
+    """Rolling window of recent successful call latencies (ms)."""
+
+    def __init__(self, window: int):
+        self._samples: deque = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, latency_ms: float):
+        with self._lock:
+            self._samples.append(latency_ms)
+
+    def percentile(self, p: float) -> Optional[float]:
+        with self._lock:
+            if not self._samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(p / 100.0 * len(ordered)))]
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+
+class _Backend:
+    def __init__(self, name: str, predictor, latency_window: int,
+                 failure_threshold: int, reset_seconds: float):
+        self.name = name
+        self.predictor = predictor
+        self.latency = LatencyTracker(latency_window)
+        self.breaker = CircuitBreaker(failure_threshold, reset_seconds)
+        self.requests = 0
+        self.failures = 0
+        self.wins = 0
+        self.hedges = 0
+        # Counters are bumped from router worker threads and request threads alike
+        self._lock = threading.Lock()
+
+    def count(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def call(self, image_bytes: bytes) -> dict:
+        started = time.perf_counter()
+        self.count("requests")
+        try:
+            result = self.predictor.classify_image_bytes(image_bytes)
+        except Exception:
+            self.count("failures")
+            self.breaker.record_failure()
+            raise
+        self.latency.observe((time.perf_counter() - started) * 1000)
+        self.breaker.record_success()
+        return result
+
+    def stats(self) -> Dict:
+        p50 = self.latency.percentile(50)
+        p95 = self.latency.percentile(95)
+        with self._lock:
+            counters = {"requests": self.requests, "failures": self.failures, "wins": self.wins, "hedges": self.hedges}
+        return {
+            "state": self.breaker.state,
+            **counters,
+            "p50_ms": round(p50, 1) if p50 is not None else None,
+            "p95_ms": round(p95, 1) if p95 is not None else None,
+            "samples": len(self.latency),
+        }
+
+
+class PredictorRouter:
+    """
+    Routes each classification to the healthy backend with the lowest rolling
+    p50 latency. If the primary hasn't answered by its own p95 (clamped to
+    [hedge_min_ms, hedge_max_ms]), a hedged duplicate is sent to the next
+    backend and the first successful answer wins. Backends that keep failing
+    are skipped by their circuit breaker until a trial request succeeds.
+    """
+
+    # Latency samples needed before a backend's p95 is trusted for hedging
+    MIN_SAMPLES = 10
+
+    def __init__(self, backends: List[Tuple[str, object]], hedge_min_ms: float, hedge_max_ms: float,
+                 latency_window: int, failure_threshold: int, reset_seconds: float, max_workers: int):
+        if not backends:
+            raise ValueError("PredictorRouter needs at least one backend")
+        self.backends = [
+            _Backend(name, predictor, latency_window, failure_threshold, reset_seconds)
+            for name, predictor in backends
+        ]
+        self.hedge_min_ms = hedge_min_ms
+        self.hedge_max_ms = hedge_max_ms
+        self.failovers = 0
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="router")
+        logger.info(f"Predictor router ready with backends: {', '.join(b.name for b in self.backends)}")
+
+    @property
+    def cache_namespace(self) -> str:
+        return "router:" + "+".join(b.predictor.cache_namespace for b in self.backends)
+
+    def _ranked(self) -> List[_Backend]:
+        """Backends whose breaker allows traffic, fastest p50 first (config order breaks ties)."""
+        allowed = [b for b in self.backends if b.breaker.available()]
+
+        def _key(item):
+            index, backend = item
+            p50 = backend.latency.percentile(50)
+            return (p50 if p50 is not None else 0.0, index)
+
+        return [b for _, b in sorted(enumerate(allowed), key=_key)]
+
+    def _hedge_delay(self, backend: _Backend) -> float:
+        p95 = backend.latency.percentile(95) if len(backend.latency) >= self.MIN_SAMPLES else None
+        delay_ms = self.hedge_max_ms if p95 is None else min(max(p95, self.hedge_min_ms), self.hedge_max_ms)
+        return delay_ms / 1000.0
+
+    def _submit(self, candidates: List[_Backend], in_flight: Dict[Future, _Backend],
+                image_bytes: bytes) -> Optional[_Backend]:
+        """Start a call on the next candidate whose breaker still admits it."""
+        while candidates:
+            backend = candidates.pop(0)
+            if backend.breaker.allow():
+                in_flight[self._pool.submit(backend.call, image_bytes)] = backend
+                return backend
+        return None
+
+    def classify_image_bytes(self, image_bytes: bytes) -> dict:
+        candidates = self._ranked()
+        in_flight: Dict[Future, _Backend] = {}
+        primary = self._submit(candidates, in_flight, image_bytes)
+        if primary is None:
+            raise RuntimeError("All predictor backends are unavailable (circuit breakers open)")
+
+        hedge_deadline = time.monotonic() + self._hedge_delay(primary)
+        hedged = False
+        last_error: Optional[Exception] = None
+
+        while in_flight:
+            can_hedge = bool(candidates) and not hedged
+            timeout = max(0.0, hedge_deadline - time.monotonic()) if can_hedge else None
+            done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                backend = in_flight.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.warning(f"Backend {backend.name} failed: {e}")
+                    last_error = e
+                    continue
+                backend.count("wins")
+                return {**result, "backend": backend.name, "hedged": hedged}
+
+            if not in_flight:
+                # Everything sent so far failed: fail over to the next backend
+                if self._submit(candidates, in_flight, image_bytes) is not None:
+                    with self._lock:
+                        self.failovers += 1
+            elif not done and can_hedge:
+                # Primary is slower than its own p95: race a duplicate on the next backend
+                secondary = self._submit(candidates, in_flight, image_bytes)
+                if secondary is not None:
+                    secondary.count("hedges")
+                    hedged = True
+
+        raise last_error or RuntimeError("No predictor backend returned a result")
+
+    def close(self):
+        for backend in self.backends:
+            if hasattr(backend.predictor, "close"):
+                backend.predictor.close()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict:
+        return {
+            "hedge_min_ms": self.hedge_min_ms,
+            "hedge_max_ms": self.hedge_max_ms,
+            "failovers": self.failovers,
+            "backends": {b.name: b.stats() for b in self.backends},
+        }
@@ -1,50 +1,199 @@
-import requests
+import asyncio
+import hashlib
+import httpx
 import logging
-from typing import Optional, Dict
+from typing import Awaitable, Callable, Dict, Hashable, Optional, Tuple
 from app.config import settings
+from app.utils.cache import DiskLRUCache, LRUCache
+from app.utils.executor import blocking_executor
+from app.utils.geo import snap_to_grid
 
 logger = logging.getLogger(__name__)
 
 class NASASatelliteClient:
-    """Wrapper for NASA Earth Observation and Imagery APIs."""
-    
-    BASE_URL = "https://api.nasa.gov/planetary/earth/assets"
-    
-    def __init__(self, api_key: str):
+    """
+    Async wrapper for NASA Earth Observation and Imagery APIs.
+
+    Requests go out for the centre of a tile_resolution-degree tile over one
+    pooled HTTP client. Asset metadata is cached in memory per (tile, date).
+    Images are downloaded once into a size-bounded disk cache (read and
+    written on the blocking executor) and served by our own proxy endpoint,
+    so the API key never reaches the browser.
+    Concurrent misses for the same key share one upstream request.
+    """
+
+    ASSETS_URL = "https://api.nasa.gov/planetary/earth/assets"
+    IMAGERY_URL = "https://api.nasa.gov/planetary/earth/imagery"
+    ASSETS_DIM = 0.1  # zoom level approx
+    IMAGERY_DIM = 0.15
+
+    def __init__(self, api_key: str, tile_resolution: float, timeout_seconds: float, max_connections: int,
+                 assets_cache: LRUCache, image_cache_dir: str, image_cache_max_bytes: int):
         self.api_key = api_key
-        
-    def get_asset_info(self, lat: float, lon: float, date: Optional[str] = None) -> Optional[Dict]:
+        self.tile_resolution = tile_resolution
+        self.timeout_seconds = timeout_seconds
+        self.max_connections = max_connections
+        self.assets_cache = assets_cache
+        self.image_cache_dir = image_cache_dir
+        self.image_cache_max_bytes = image_cache_max_bytes
+        self._image_cache: Optional[DiskLRUCache] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._pending: Dict[Hashable, asyncio.Task] = {}
+        self.upstream_requests = 0
+        self.upstream_errors = 0
+        self.coalesced = 0
+
+    def _http(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout_seconds,
+                limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+            )
+        return self._client
+
+    @property
+    def image_cache(self) -> DiskLRUCache:
+        # Created on first use so importing the client does not touch the filesystem
+        if self._image_cache is None:
+            self._image_cache = DiskLRUCache(self.image_cache_dir, self.image_cache_max_bytes)
+        return self._image_cache
+
+    async def close(self):
+        """Close the pooled HTTP client (on shutdown)."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _single_flight(self, key: Hashable, load: Callable[[], Awaitable]):
+        task = self._pending.get(key)
+        if task is None:
+            task = asyncio.ensure_future(load())
+            self._pending[key] = task
+            task.add_done_callback(lambda _: self._pending.pop(key, None))
+        else:
+            self.coalesced += 1
+        # Shielded: a client that disconnects must not cancel a download others are waiting for
+        return await asyncio.shield(task)
+
+    async def _get(self, url: str, params: Dict) -> Optional[httpx.Response]:
+        self.upstream_requests += 1
+        try:
+            response = await self._http().get(url, params={**params, "api_key": self.api_key})
+        except httpx.HTTPError as e:
+            # The exception text can include the request URL, and with it the API key
+            self.upstream_errors += 1
+            logger.error(f"Error calling NASA API {url}: {type(e).__name__}")
+            return None
+        if response.status_code != 200:
+            self.upstream_errors += 1
+            logger.warning(f"NASA API {url} returned {response.status_code}: {response.text[:200]}")
+            return None
+        return response
+
+    def tile(self, lat: float, lon: float) -> Tuple[float, float]:
+        return snap_to_grid(lat, lon, self.tile_resolution)
+
+    async def get_asset_info(self, lat: float, lon: float, date: Optional[str] = None) -> Optional[Dict]:
         """
-        Get the date and location of the most recent Landsat satellite image 
+        Get the date and location of the most recent Landsat satellite image
         captured for the given coordinates.
         """
-        params = {
-            "lat": lat,
-            "lon": lon,
-            "dim": 0.1,  # zoom level approx
-            "api_key": self.api_key
-        }
-        if date:
-            params["date"] = date
-            
-        try:
-            response = requests.get(self.BASE_URL, params=params, timeout=10)
-            if response.status_code == 200:
-                return response.json()
-            else:
-                logger.warning(f"NASA assets API returned {response.status_code}: {response.text}")
+        tile = self.tile(lat, lon)
+        key = ("assets", tile, date)
+        info = self.assets_cache.get(key)
+        if info is not None:
+            return info
+
+        async def _load():
+            params = {"lat": tile[0], "lon": tile[1], "dim": self.ASSETS_DIM}
+            if date:
+                params["date"] = date
+            response = await self._get(self.ASSETS_URL, params)
+            if response is None:
+                return None
+            try:
+                result = response.json()
+            except ValueError:
+                self.upstream_errors += 1
+                logger.warning(f"NASA assets returned a non-JSON body for tile {tile}")
                 return None
-        except Exception as e:
-            logger.error(f"Error fetching NASA asset info: {e}")
+            self.assets_cache.set(key, result)
+            return result
+
+        return await self._single_flight(key, _load)
+
+    async def image_date(self, lat: float, lon: float, date: Optional[str] = None) -> Optional[str]:
+        """Capture date of the image to serve: the given date, else the latest one per the asset metadata."""
+        if date:
+            return date
+        info = await self.get_asset_info(lat, lon)
+        if not info or not info.get("date"):
             return None
+        return info["date"][:10]
+
+    def image_name(self, lat: float, lon: float, date: str) -> str:
+        """Cache file name of the image for the coordinates' tile on a capture date."""
+        tile = self.tile(lat, lon)
+        return f"{tile[0]:.6f}_{tile[1]:.6f}_{date}.png"
 
-    def get_imagery_url(self, lat: float, lon: float, date: Optional[str] = None) -> Optional[str]:
+    async def get_image(self, lat: float, lon: float, date: Optional[str] = None) -> Optional[Tuple[bytes, str]]:
         """
-        Returns a URL to a satellite image for the given location using NASA's 
-        Earth Observatory (Landsat) repository.
+        PNG bytes of the satellite image covering the coordinates, downloading
+        it on a cache miss. Without a date the latest capture (per the asset
+        metadata) is used, so every cached file is for one fixed date and never
+        goes stale. Returns (image bytes, cache file name) or None.
         """
-        # Note: The 'earth/imagery' endpoint is similar but requires 'dim' and 'date'
-        return f"https://api.nasa.gov/planetary/earth/imagery?lat={lat}&lon={lon}&dim=0.15&api_key={self.api_key}"
+        tile = self.tile(lat, lon)
+        date = await self.image_date(lat, lon, date)
+        if date is None:
+            return None
+
+        name = self.image_name(lat, lon, date)
+        # Through a lambda so the cache's first-use directory scan also runs off the event loop
+        data = await blocking_executor.run(lambda: self.image_cache.get(name))
+        if data is not None:
+            return data, name
+
+        async def _load():
+            params = {"lat": tile[0], "lon": tile[1], "dim": self.IMAGERY_DIM, "date": date}
+            response = await self._get(self.IMAGERY_URL, params)
+            if response is None:
+                return None
+            if not response.headers.get("content-type", "").startswith("image/"):
+                self.upstream_errors += 1
+                logger.warning(f"NASA imagery returned {response.headers.get('content-type')} for {name}")
+                return None
+            await blocking_executor.run(lambda: self.image_cache.put(name, response.content))
+            return response.content, name
+
+        return await self._single_flight(("image", name), _load)
+
+    def stats(self) -> Dict:
+        return {
+            "tile_resolution": self.tile_resolution,
+            "upstream_requests": self.upstream_requests,
+            "upstream_errors": self.upstream_errors,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._pending),
+            "assets_cache": self.assets_cache.stats(),
+            "image_cache": self._image_cache.stats() if self._image_cache is not None else None,
+        }
+
+
+def image_etag(name: str) -> str:
+    """Strong ETag of a cached image; file names are immutable (tile + capture date)."""
+    return '"' + hashlib.sha1(name.encode()).hexdigest()[:20] + '"'
 
 # Singleton instance
-nasa_client = NASASatelliteClient(api_key=settings.NASA_API_KEY)
+nasa_client = NASASatelliteClient(
+    api_key=settings.NASA_API_KEY,
+    tile_resolution=settings.NASA_TILE_RESOLUTION,
+    timeout_seconds=settings.NASA_TIMEOUT_SECONDS,
+    max_connections=settings.NASA_MAX_CONNECTIONS,
+    assets_cache=LRUCache(
+        max_entries=settings.NASA_ASSETS_CACHE_MAX_ENTRIES,
+        ttl_seconds=settings.NASA_ASSETS_CACHE_TTL_SECONDS,
+    ),
+    image_cache_dir=settings.SATELLITE_IMAGE_CACHE_DIR,
+    image_cache_max_bytes=settings.SATELLITE_IMAGE_CACHE_MAX_BYTES,
+)
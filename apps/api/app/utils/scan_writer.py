@@ -0,0 +1,197 @@
+"""
+Write-behind persistence of scans: requests enqueue rows and a background
+thread commits them to SQLite in grouped transactions
+"""
+
+import logging
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from app.utils.executor import blocking_executor
+from app.utils.metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class ScanWriter:
+    """
+    Buffers save_scan() calls and flushes them with store.save_scans() once
+    max_rows are queued or the oldest row has waited max_delay_ms.
+
+    The queue holds at most max_pending rows. When it is full, enqueue() waits
+    (off the event loop) for up to enqueue_timeout_seconds before giving up,
+    so a stalled disk slows uploads down instead of growing memory. The scan
+    timestamp is taken at enqueue time, not at commit time.
+
+    A failed flush is retried once; if the group still fails, its rows are
+    written one at a time so a single bad row only loses itself.
+    """
+
+    RETRY_DELAY_SECONDS = 0.1
+
+    def __init__(self, store, max_rows: int, max_delay_ms: float, max_pending: int,
+                 enqueue_timeout_seconds: float):
+        self.store = store
+        self.max_rows = max_rows
+        self.max_delay_seconds = max_delay_ms / 1000.0
+        self.enqueue_timeout_seconds = enqueue_timeout_seconds
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_pending)
+        self.flush_sizes = Histogram([1, 2, 5, 10, 25, 50, 100, 250, 500])
+        self.lag_ms = Histogram([5, 10, 25, 50, 100, 250, 500, 1000, 5000])
+        self.flush_ms = Histogram([1, 2, 5, 10, 25, 50, 100, 250])
+        self.rows_written = 0
+        self.rows_failed = 0
+        self.rows_rejected = 0
+        self.backpressure_waits = 0
+        self.flush_retries = 0
+        self.row_fallbacks = 0
+        # Guards _closed and _enqueuing so close() knows when no more rows can arrive
+        self._lock = threading.Lock()
+        self._enqueuing = 0
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name="scan-writer", daemon=True)
+        self._worker.start()
+        logger.info(f"Scan write-behind started (max_rows={max_rows}, max_delay_ms={max_delay_ms}, max_pending={max_pending})")
+
+    async def enqueue(self, **scan) -> bool:
+        """Queue one scan (save_scan keyword arguments). Returns False if it was rejected."""
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Scan writer is closed")
+            self._enqueuing += 1
+        try:
+            return await self._enqueue(scan)
+        finally:
+            with self._lock:
+                self._enqueuing -= 1
+
+    async def _enqueue(self, scan: Dict) -> bool:
+        scan.setdefault("timestamp", datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"))
+        item = (scan, time.perf_counter())
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except queue.Full:
+            self.backpressure_waits += 1
+
+        try:
+            await blocking_executor.run(self._queue.put, item, timeout=self.enqueue_timeout_seconds)
+            return True
+        except queue.Full:
+            self.rows_rejected += 1
+            logger.error(f"Scan queue full for {self.enqueue_timeout_seconds}s; scan dropped")
+            return False
+
+    def _collect(self, first) -> Tuple[List, bool]:
+        """Gather a flush starting with `first`; returns (rows, stop requested)."""
+        rows = [first]
+        deadline = first[1] + self.max_delay_seconds
+        while len(rows) < self.max_rows:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return rows, True
+            rows.append(item)
+        return rows, False
+
+    def _save(self, scans: List[Dict]) -> int:
+        """Persist scans: whole group, then one retry, then row by row. Returns rows written."""
+        written = self.store.save_scans(scans)
+        if written == len(scans):
+            return written
+        # Transient failures (e.g. a locked database) usually clear on a second attempt
+        self.flush_retries += 1
+        time.sleep(self.RETRY_DELAY_SECONDS)
+        written = self.store.save_scans(scans)
+        if written == len(scans) or len(scans) == 1:
+            return written
+        self.row_fallbacks += 1
+        return sum(self.store.save_scans([scan]) for scan in scans)
+
+    def _flush(self, rows: List):
+        started = time.perf_counter()
+        written = self._save([scan for scan, _ in rows])
+        committed = time.perf_counter()
+
+        self.flush_sizes.observe(len(rows))
+        self.flush_ms.observe((committed - started) * 1000)
+        for _, enqueued in rows:
+            self.lag_ms.observe((committed - enqueued) * 1000)
+        self.rows_written += written
+        if written < len(rows):
+            self.rows_failed += len(rows) - written
+            logger.error(f"Failed to persist {len(rows) - written} of {len(rows)} queued scans")
+
+    def _drain(self):
+        """Flush everything left in the queue, max_rows at a time."""
+        rows = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                continue
+            rows.append(item)
+            if len(rows) >= self.max_rows:
+                self._flush(rows)
+                rows = []
+        if rows:
+            self._flush(rows)
+
+    def _run(self):
+        stop = False
+        while not stop:
+            first = self._queue.get()
+            if first is _STOP:
+                break
+            rows, stop = self._collect(first)
+            self._flush(rows)
+        # Rows can land behind _STOP (an enqueue that passed the closed check just before it)
+        self._drain()
+
+    def close(self, timeout: Optional[float] = 30):
+        """Stop accepting scans, flush everything queued and stop the writer thread."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        self._queue.put(_STOP)
+        self._worker.join(timeout=timeout)
+        if self._worker.is_alive():
+            logger.error(f"Scan writer did not finish flushing within {timeout}s; {self._queue.qsize()} scans pending")
+            return
+
+        # Enqueues already past the closed check (possibly waiting on a full queue) still land
+        while self._enqueuing and (deadline is None or time.monotonic() < deadline):
+            time.sleep(0.01)
+        self._drain()
+        if self._enqueuing:
+            logger.error(f"Scan writer closed with {self._enqueuing} scans still being enqueued")
+        logger.info(f"Scan writer flushed and stopped ({self.rows_written} scans written)")
+
+    def stats(self) -> Dict:
+        return {
+            "max_rows": self.max_rows,
+            "max_delay_ms": self.max_delay_seconds * 1000,
+            "pending": self._queue.qsize(),
+            "max_pending": self._queue.maxsize,
+            "rows_written": self.rows_written,
+            "rows_failed": self.rows_failed,
+            "rows_rejected": self.rows_rejected,
+            "backpressure_waits": self.backpressure_waits,
+            "flush_retries": self.flush_retries,
+            "row_fallbacks": self.row_fallbacks,
+            "flush_size": self.flush_sizes.stats(),
+            "flush_ms": self.flush_ms.stats(),
+            "lag_ms": self.lag_ms.stats(),
+        }
@@ -0,0 +1,50 @@
+"""
+Fast JSON encoding for large API responses, with passthrough of values that
+are already JSON text (e.g. weather_data as stored in SQLite)
+"""
+
+import json
+from typing import Dict, Iterable, Optional
+
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # optional speed-up; the stdlib encoder produces the same JSON
+    orjson = None
+
+
+def dumps(content) -> bytes:
+    """Encode to compact UTF-8 JSON, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(content, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def dumps_with_raw(content: Dict, raw: Dict[str, Optional[str]]) -> bytes:
+    """
+    Encode a dict, then append the `raw` keys with their values spliced in
+    verbatim (None becomes null). Raw values must be valid JSON text; they are
+    never parsed or re-encoded.
+    """
+    encoded = dumps(content)
+    if not raw:
+        return encoded
+    parts = [encoded[:-1]]
+    separator = b"," if len(encoded) > 2 else b""
+    for key, value in raw.items():
+        parts.append(separator + dumps(key) + b":" + (value.encode("utf-8") if value is not None else b"null"))
+        separator = b","
+    parts.append(b"}")
+    return b"".join(parts)
+
+
+def json_array(items: Iterable[bytes]) -> bytes:
+    """Join already-encoded JSON values into a JSON array."""
+    return b"[" + b",".join(items) + b"]"
+
+
+class PreEncodedJSONResponse(Response):
+    """JSON response whose body has already been encoded to bytes."""
+
+    media_type = "application/json"
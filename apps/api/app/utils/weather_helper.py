@@ -2,21 +2,54 @@
 Helpers for fetching weather from Open-Meteo and assessing disease risk
 Uses the official openmeteo_requests Python client
 """
-from typing import Optional, Dict
+from typing import Optional, Dict, List, Tuple
 import logging
-import requests_cache
+import numpy as np
+import requests
 from retry_requests import retry
 import openmeteo_requests
 
+from app.config import settings
+from app.utils.cache import LRUCache
+from app.utils.geo import snap_to_grid
+from app.utils.geocoder import OfflineGeocoder
+
 logger = logging.getLogger(__name__)
 
-# Setup the Open-Meteo API client with cache and retry on error
-_cache_session = requests_cache.CachedSession('.cache', expire_after=3600)
-_retry_session = retry(_cache_session, retries=5, backoff_factor=0.2)
+# Setup the Open-Meteo API client with retry on error
+_retry_session = retry(requests.Session(), retries=5, backoff_factor=0.2)
 _openmeteo = openmeteo_requests.Client(session=_retry_session)
 
+# Current weather per grid cell: bounded, expiring, and single-flight so a burst
+# of requests from one area makes a single upstream call
+weather_cache = LRUCache(
+    max_entries=settings.WEATHER_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.WEATHER_CACHE_TTL_SECONDS,
+)
+
+# Local gazetteer for place names; loaded at startup (see main.startup_event)
+offline_geocoder = OfflineGeocoder(
+    path=settings.GEONAMES_PATH,
+    max_distance_km=settings.GEOCODER_MAX_DISTANCE_KM,
+)
+
+# Nominatim answers per coordinate (grid cell centres); place names don't change, so no TTL
+nominatim_names = LRUCache(max_entries=settings.WEATHER_CACHE_MAX_ENTRIES)
+
 
 def get_location_name(latitude: float, longitude: float) -> Optional[str]:
+    """Get location name from the offline gazetteer, falling back to Nominatim if enabled"""
+    place = offline_geocoder.nearest(latitude, longitude)
+    if place is not None:
+        return place[0]
+    if not settings.NOMINATIM_FALLBACK:
+        return None
+    return nominatim_names.get_or_load(
+        (latitude, longitude), lambda: _nominatim_location_name(latitude, longitude)
+    )
+
+
+def _nominatim_location_name(latitude: float, longitude: float) -> Optional[str]:
     """Get location name from coordinates using Nominatim reverse geocoding"""
     try:
         url = f"https://nominatim.openstreetmap.org/reverse?format=json&lat={latitude}&lon={longitude}&zoom=10"
@@ -35,67 +68,269 @@ def get_location_name(latitude: float, longitude: float) -> Optional[str]:
 def fetch_current_weather(latitude: float, longitude: float) -> Optional[Dict]:
     """Fetch current weather from Open-Meteo and return simplified dict
 
+    Weather is looked up for the WEATHER_GRID_RESOLUTION grid cell containing
+    the point and cached per cell, so nearby farms share one upstream call.
+
     Returns keys: temperature, humidity, precipitation, wind_speed, disease_risk, location_name
     """
+    cell = snap_to_grid(latitude, longitude, settings.WEATHER_GRID_RESOLUTION)
+    try:
+        weather = weather_cache.get_or_load(("current", cell), lambda: _fetch_cell_weather(*cell))
+    except Exception as e:
+        logger.error(f"Error fetching current weather: {e}")
+        return None
+
+    if weather is None:
+        return None
+    return {**weather, "latitude": latitude, "longitude": longitude}
+
+
+_CURRENT_VARIABLES = ["temperature_2m", "relative_humidity_2m", "precipitation", "rain", "wind_speed_10m"]
+
+
+def _current_weather_from_response(response, latitude: float, longitude: float) -> Dict:
+    """Build the simplified current-weather dict from one Open-Meteo response."""
+    current = response.Current()
+    temp = current.Variables(0).Value()  # temperature_2m
+    humidity = current.Variables(1).Value()  # relative_humidity_2m
+    precipitation = current.Variables(2).Value()  # precipitation
+    wind_speed = current.Variables(4).Value()  # wind_speed_10m
+
+    disease_risk = assess_disease_risk(temp, humidity, precipitation)
+    location_name = get_location_name(latitude, longitude)
+
+    logger.info(f"Fetched weather for {location_name} (cell lat={latitude}, lon={longitude}): temp={temp}°C, humidity={humidity}%, risk={disease_risk}")
+
+    return {
+        "temperature": temp,
+        "humidity": humidity,
+        "precipitation": precipitation,
+        "wind_speed": wind_speed,
+        "disease_risk": disease_risk,
+        "location_name": location_name,
+    }
+
+
+def _fetch_cell_weather(latitude: float, longitude: float) -> Optional[Dict]:
+    """Query Open-Meteo (and reverse geocoding) for one grid cell centre."""
     try:
-        url = "https://api.open-meteo.com/v1/forecast"
         params = {
             "latitude": latitude,
             "longitude": longitude,
-            "current": ["temperature_2m", "relative_humidity_2m", "precipitation", "rain", "wind_speed_10m"],
+            "current": _CURRENT_VARIABLES,
             "timezone": "auto",
         }
 
-        responses = _openmeteo.weather_api(url, params=params)
-        response = responses[0]
+        responses = _openmeteo.weather_api(settings.WEATHER_API_URL, params=params)
+        return _current_weather_from_response(responses[0], latitude, longitude)
+
+    except Exception as e:
+        logger.error(f"Error fetching current weather: {e}")
+        return None
+
 
-        current = response.Current()
-        temp = current.Variables(0).Value()  # temperature_2m
-        humidity = current.Variables(1).Value()  # relative_humidity_2m
-        precipitation = current.Variables(2).Value()  # precipitation
-        wind_speed = current.Variables(4).Value()  # wind_speed_10m
+def fetch_current_weather_batch(cells: List[Tuple[float, float]]) -> List[Optional[Dict]]:
+    """
+    Fetch current weather for several grid cell centres in one multi-location
+    Open-Meteo request, score risk for all of them in one vectorised pass and
+    store each result in the weather cache. Results are returned in the order
+    of `cells`.
 
-        disease_risk = assess_disease_risk(temp, humidity, precipitation)
-        location_name = get_location_name(latitude, longitude)
+    Location names come from the offline gazetteer only, so a large batch never
+    turns into one Nominatim request per cell (its usage policy allows one per
+    second). Without a gazetteer match, a name found earlier for the cell is
+    reused rather than replaced with None.
+    """
+    if not cells:
+        return []
+    params = {
+        "latitude": [lat for lat, _ in cells],
+        "longitude": [lon for _, lon in cells],
+        "current": _CURRENT_VARIABLES,
+        "timezone": "auto",
+    }
+    responses = _openmeteo.weather_api(settings.WEATHER_API_URL, params=params)
 
-        logger.info(f"Fetched weather for {location_name} (lat={latitude}, lon={longitude}): temp={temp}°C, humidity={humidity}%, risk={disease_risk}")
+    # Rows of (temperature, humidity, precipitation, wind speed); NaN where a response is unreadable
+    readings = np.full((len(cells), 4), np.nan)
+    for row, response in enumerate(responses[:len(cells)]):
+        try:
+            current = response.Current()
+            readings[row] = [current.Variables(i).Value() for i in (0, 1, 2, 4)]
+        except Exception as e:
+            logger.error(f"Error parsing weather for cell {cells[row]}: {e}")
 
-        return {
+    bands = risk_bands(disease_risk_scores(readings[:, 0], readings[:, 1], readings[:, 2]))
+
+    results = []
+    for cell, (temp, humidity, precipitation, wind_speed), band in zip(cells, readings.tolist(), bands):
+        if np.isnan(temp):
+            results.append(None)
+            continue
+        weather = {
             "temperature": temp,
             "humidity": humidity,
             "precipitation": precipitation,
             "wind_speed": wind_speed,
-            "disease_risk": disease_risk,
-            "location_name": location_name,
+            "disease_risk": band,
+            "location_name": _batch_location_name(cell),
+        }
+        weather_cache.set(("current", cell), weather)
+        results.append(weather)
+
+    logger.info(f"Fetched weather for {len(cells)} cells in one request")
+    return results
+
+
+def _batch_location_name(cell: Tuple[float, float]) -> Optional[str]:
+    """Place name for a cell in a batch refresh (see fetch_current_weather_batch)."""
+    place = offline_geocoder.nearest(*cell)
+    if place is not None:
+        return place[0]
+    # Found by a single-cell request (get_location_name); never looked up from here
+    name = nominatim_names.get(cell)
+    if name is not None:
+        return name
+    previous = weather_cache.get(("current", cell))
+    return previous.get("location_name") if previous else None
+
+
+def fetch_weather_forecast(latitude: float, longitude: float, days: int) -> Optional[Dict]:
+    """Fetch an hourly forecast for `days` days and score disease risk per hour and per day
+
+    Like current weather, forecasts are fetched for the grid cell containing the
+    point and cached per (cell, horizon).
+    """
+    cell = snap_to_grid(latitude, longitude, settings.WEATHER_GRID_RESOLUTION)
+    try:
+        forecast = weather_cache.get_or_load(("forecast", cell, days), lambda: _fetch_cell_forecast(cell[0], cell[1], days))
+    except Exception as e:
+        logger.error(f"Error fetching weather forecast: {e}")
+        return None
+
+    if forecast is None:
+        return None
+    return {**forecast, "latitude": latitude, "longitude": longitude}
+
+
+_HOURLY_VARIABLES = ["temperature_2m", "relative_humidity_2m", "precipitation", "wind_speed_10m"]
+
+
+def _rounded(values: np.ndarray, decimals: int = 1) -> List[Optional[float]]:
+    """Round a float series for JSON, mapping NaN (missing hours) to None."""
+    rounded = np.round(values.astype(np.float64), decimals)
+    return [None if np.isnan(v) else v for v in rounded.tolist()]
+
+
+def _fetch_cell_forecast(latitude: float, longitude: float, days: int) -> Optional[Dict]:
+    """Query Open-Meteo for one grid cell's hourly forecast and score it."""
+    try:
+        params = {
             "latitude": latitude,
-            "longitude": longitude
+            "longitude": longitude,
+            "hourly": _HOURLY_VARIABLES,
+            "forecast_days": days,
+            "timezone": "auto",
+        }
+        response = _openmeteo.weather_api(settings.WEATHER_API_URL, params=params)[0]
+        hourly = response.Hourly()
+
+        temp = hourly.Variables(0).ValuesAsNumpy()  # temperature_2m
+        humidity = hourly.Variables(1).ValuesAsNumpy()  # relative_humidity_2m
+        precipitation = hourly.Variables(2).ValuesAsNumpy()  # precipitation
+        wind_speed = hourly.Variables(3).ValuesAsNumpy()  # wind_speed_10m
+
+        # Local wall-clock timestamps; the API reports UTC plus the cell's offset
+        local_times = np.arange(hourly.Time(), hourly.TimeEnd(), hourly.Interval()) + response.UtcOffsetSeconds()
+        local_times = local_times[:len(temp)].astype("datetime64[s]")
+
+        scores = disease_risk_scores(temp, humidity, precipitation)
+
+        # Hours are contiguous and ordered, so each day is one slice starting at day_starts[i]
+        dates = local_times.astype("datetime64[D]")
+        day_dates, day_starts = np.unique(dates, return_index=True)
+        daily_scores = np.maximum.reduceat(scores, day_starts)
+        daily = [
+            {
+                "date": str(date),
+                "temperature_min": t_min,
+                "temperature_max": t_max,
+                "humidity_max": h_max,
+                "precipitation": rain,
+                "risk_score": int(score),
+                "disease_risk": band,
+                "high_risk_hours": int(high),
+                "moderate_risk_hours": int(moderate),
+            }
+            for date, t_min, t_max, h_max, rain, score, band, high, moderate in zip(
+                day_dates,
+                _rounded(np.fmin.reduceat(temp, day_starts)),
+                _rounded(np.fmax.reduceat(temp, day_starts)),
+                _rounded(np.fmax.reduceat(humidity, day_starts)),
+                _rounded(np.add.reduceat(np.nan_to_num(precipitation), day_starts)),
+                daily_scores,
+                risk_bands(daily_scores),
+                np.add.reduceat(scores >= 4, day_starts),
+                np.add.reduceat((scores >= 2) & (scores < 4), day_starts),
+            )
+        ]
+
+        logger.info(f"Fetched {days}-day forecast for cell lat={latitude}, lon={longitude}: {len(temp)} hours")
+
+        return {
+            "days": days,
+            "location_name": get_location_name(latitude, longitude),
+            "hourly": {
+                "time": local_times.astype(str).tolist(),
+                "temperature": _rounded(temp),
+                "humidity": _rounded(humidity),
+                "precipitation": _rounded(precipitation),
+                "wind_speed": _rounded(wind_speed),
+                "risk_score": scores.tolist(),
+                "disease_risk": risk_bands(scores),
+            },
+            "daily": daily,
         }
 
     except Exception as e:
-        logger.error(f"Error fetching current weather: {e}")
+        logger.error(f"Error fetching weather forecast: {e}")
         return None
 
 
-def assess_disease_risk(temp: Optional[float], humidity: Optional[float], precipitation: Optional[float]) -> str:
-    if temp is None or humidity is None:
-        return "Unknown"
+_RISK_BANDS = np.array(["Unknown", "Low", "Moderate", "High"])
+
+
+def disease_risk_scores(temp, humidity, precipitation) -> np.ndarray:
+    """
+    Vectorised disease-risk score for aligned temperature (°C), relative
+    humidity (%) and precipitation (mm) series. Scores are 0-6; hours with a
+    missing temperature or humidity score -1.
+    """
+    temp = np.asarray(temp, dtype=np.float64)
+    humidity = np.asarray(humidity, dtype=np.float64)
+    precipitation = np.asarray(precipitation, dtype=np.float64)
 
-    risk_score = 0
+    # Comparisons with NaN are False, so missing readings add nothing here
+    scores = np.where((temp >= 20) & (temp <= 30) & (humidity > 85), 3,
+                      np.where((temp >= 18) & (temp <= 32) & (humidity > 75), 2, 0))
+    scores = scores + np.where((temp >= 15) & (temp <= 25) & (humidity > 90), 2, 0)
+    scores = scores + np.where(precipitation > 5, 1, 0)
 
-    if 20 <= temp <= 30 and humidity > 85:
-        risk_score += 3
-    elif 18 <= temp <= 32 and humidity > 75:
-        risk_score += 2
+    return np.where(np.isnan(temp) | np.isnan(humidity), -1, scores)
 
-    if 15 <= temp <= 25 and humidity > 90:
-        risk_score += 2
 
-    if precipitation and precipitation > 5:
-        risk_score += 1
+def risk_bands(scores: np.ndarray) -> List[str]:
+    """Map risk scores to "Unknown" / "Low" / "Moderate" / "High"."""
+    scores = np.asarray(scores)
+    index = np.select([scores < 0, scores >= 4, scores >= 2], [0, 3, 2], default=1)
+    return _RISK_BANDS[index].tolist()
 
-    if risk_score >= 4:
-        return "High"
-    elif risk_score >= 2:
-        return "Moderate"
-    else:
-        return "Low"
+
+def assess_disease_risk(temp: Optional[float], humidity: Optional[float], precipitation: Optional[float]) -> str:
+    nan = float("nan")
+    scores = disease_risk_scores(
+        [nan if temp is None else temp],
+        [nan if humidity is None else humidity],
+        [nan if precipitation is None else precipitation],
+    )
+    return risk_bands(scores)[0]
@@ -9,8 +9,21 @@ from fastapi.responses import JSONResponse
 import logging
 
 from app.config import settings
-from app.routers import disease, weather, history
-from app.utils.model_loader import create_azure_predictor
+from app.routers import disease, weather, history, analytics
+from app.utils.model_loader import (
+    create_azure_predictor, create_local_predictor, CachedPredictor, CascadePredictor,
+    preprocessing_stats
+)
+from app.utils.database import db
+from app.utils.executor import blocking_executor
+from app.utils.phash_index import PerceptualHashIndex
+from app.utils.batching import MicroBatcher
+from app.utils.routing import PredictorRouter
+from app.utils.weather_helper import weather_cache, offline_geocoder, nominatim_names
+from app.utils.prefetch import weather_prefetcher
+from app.utils.archive import scan_archiver
+from app.utils.satellite import nasa_client
+from app.utils.scan_writer import ScanWriter
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -32,30 +45,174 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialise Azure predictor on startup
-@app.on_event("startup")
-async def startup_event():
-    """Initialise Azure Custom Vision predictor when server starts"""
-    logger.info("Starting FastAPI server...")
-    logger.info(f"Environment: {settings.ENVIRONMENT}")
-    logger.info("Initialising Azure Custom Vision predictor...")
+def create_local_backend():
+    """Local CPU model, micro-batched when enabled (None on failure)."""
+    logger.info(f"Initialising local CPU predictor from {settings.LOCAL_MODEL_PATH}...")
+    predictor = create_local_predictor(
+        model_path=settings.LOCAL_MODEL_PATH,
+        class_names=settings.CLASS_NAMES,
+        input_size=settings.LOCAL_MODEL_INPUT_SIZE,
+        intra_op_threads=settings.LOCAL_INTRA_OP_THREADS,
+        inter_op_threads=settings.LOCAL_INTER_OP_THREADS,
+        rescale=settings.LOCAL_MODEL_RESCALE,
+    )
+    if predictor is not None and predictor.fixed_batch_size == 1:
+        # One image per forward pass: batching would only add queueing delay
+        logger.info("Local model has a fixed batch size of 1; micro-batching disabled")
+    elif predictor is not None and settings.MICROBATCH_ENABLED:
+        predictor = MicroBatcher(
+            predictor,
+            max_batch_size=settings.MICROBATCH_MAX_SIZE,
+            max_wait_ms=settings.MICROBATCH_MAX_WAIT_MS,
+        )
+    return predictor
 
-    app.predictor = create_azure_predictor(
+def create_azure_backend():
+    """Azure Custom Vision client (None on failure)."""
+    logger.info("Initialising Azure Custom Vision predictor...")
+    return create_azure_predictor(
         prediction_key=settings.AZURE_PREDICTION_KEY,
         endpoint=settings.AZURE_PREDICTION_ENDPOINT,
         project_id=settings.AZURE_PROJECT_ID,
         iteration_name=settings.AZURE_ITERATION_NAME,
     )
 
+def create_azure_secondary_backend():
+    """Second Azure deployment for the router; None when not configured."""
+    if not (settings.AZURE_SECONDARY_ENDPOINT and settings.AZURE_SECONDARY_PREDICTION_KEY):
+        return None
+    logger.info("Initialising secondary Azure Custom Vision predictor...")
+    return create_azure_predictor(
+        prediction_key=settings.AZURE_SECONDARY_PREDICTION_KEY,
+        endpoint=settings.AZURE_SECONDARY_ENDPOINT,
+        project_id=settings.AZURE_SECONDARY_PROJECT_ID or settings.AZURE_PROJECT_ID,
+        iteration_name=settings.AZURE_SECONDARY_ITERATION_NAME or settings.AZURE_ITERATION_NAME,
+    )
+
+ROUTER_BACKEND_FACTORIES = {
+    "azure": create_azure_backend,
+    "azure_secondary": create_azure_secondary_backend,
+    "local": create_local_backend,
+}
+
+def create_router():
+    """Route across every configured backend that initialised (None if none did)."""
+    backends = []
+    for name in settings.ROUTER_BACKENDS.split(","):
+        name = name.strip()
+        if not name:
+            continue
+        factory = ROUTER_BACKEND_FACTORIES.get(name)
+        if factory is None:
+            logger.warning(f"Unknown router backend '{name}' ignored")
+            continue
+        predictor = factory()
+        if predictor is not None:
+            backends.append((name, predictor))
+
+    if not backends:
+        return None
+    return PredictorRouter(
+        backends,
+        hedge_min_ms=settings.ROUTER_HEDGE_MIN_MS,
+        hedge_max_ms=settings.ROUTER_HEDGE_MAX_MS,
+        latency_window=settings.ROUTER_LATENCY_WINDOW,
+        failure_threshold=settings.ROUTER_BREAKER_FAILURES,
+        reset_seconds=settings.ROUTER_BREAKER_RESET_SECONDS,
+        max_workers=settings.BLOCKING_MAX_WORKERS * 2,
+    )
+
+def create_backend_predictor():
+    """Create the predictor selected by PREDICTOR_BACKEND (None on failure)."""
+    if settings.PREDICTOR_BACKEND == "local":
+        return create_local_backend()
+
+    if settings.PREDICTOR_BACKEND == "cascade":
+        local = create_local_backend()
+        remote = create_azure_backend()
+        if local is None or remote is None:
+            logger.warning("Cascade needs both a local model and Azure; using whichever is available")
+            return local or remote
+        return CascadePredictor(
+            local,
+            remote,
+            min_confidence=settings.CASCADE_MIN_CONFIDENCE,
+            min_margin=settings.CASCADE_MIN_MARGIN,
+        )
+
+    if settings.PREDICTOR_BACKEND == "router":
+        return create_router()
+
+    return create_azure_backend()
+
+# Initialise predictor on startup
+@app.on_event("startup")
+async def startup_event():
+    """Initialise the disease predictor when server starts"""
+    logger.info("Starting FastAPI server...")
+    logger.info(f"Environment: {settings.ENVIRONMENT}")
+
+    await blocking_executor.run(offline_geocoder.load)
+
+    if settings.WEATHER_PREFETCH_ENABLED:
+        weather_prefetcher.start()
+
+    if settings.ARCHIVE_ENABLED:
+        scan_archiver.start()
+
+    app.scan_writer = None
+    if settings.SCAN_WRITE_BEHIND_ENABLED:
+        app.scan_writer = ScanWriter(
+            store=db,
+            max_rows=settings.SCAN_FLUSH_MAX_ROWS,
+            max_delay_ms=settings.SCAN_FLUSH_MAX_DELAY_MS,
+            max_pending=settings.SCAN_QUEUE_MAX_PENDING,
+            enqueue_timeout_seconds=settings.SCAN_ENQUEUE_TIMEOUT_SECONDS,
+        )
+
+    # Loading and warming up a local model is slow; keep it off the event loop
+    app.predictor = await blocking_executor.run(create_backend_predictor)
+
+    if app.predictor is not None and settings.PREDICTION_CACHE_ENABLED:
+        app.predictor = CachedPredictor(
+            app.predictor,
+            store=db,
+            max_entries=settings.PREDICTION_CACHE_MAX_ENTRIES,
+            ttl_seconds=settings.PREDICTION_CACHE_TTL_SECONDS,
+            max_rows=settings.PREDICTION_CACHE_MAX_ROWS,
+        )
+
+    app.phash_index = None
+    if app.predictor is not None and settings.PHASH_DEDUP_ENABLED:
+        app.phash_index = PerceptualHashIndex(
+            store=db,
+            namespace=app.predictor.cache_namespace,
+            max_distance=settings.PHASH_MAX_DISTANCE,
+            ttl_seconds=settings.PHASH_TTL_SECONDS,
+            max_rows=settings.PHASH_MAX_ROWS,
+        )
+        await blocking_executor.run(app.phash_index.load)
+
     if app.predictor is not None:
-        logger.info("✅ Azure Custom Vision predictor ready!")
+        logger.info(f"✅ {settings.PREDICTOR_BACKEND} predictor ready!")
     else:
-        logger.error("❌ Failed to create Azure Custom Vision predictor. Check credentials in .env")
+        logger.error(f"❌ Failed to create {settings.PREDICTOR_BACKEND} predictor. Check configuration in .env")
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Cleanup when server shuts down"""
     logger.info("Shutting down FastAPI server...")
+    await weather_prefetcher.stop()
+    await scan_archiver.stop()
+    # Durably flush queued scans before the executor and connections go away
+    if getattr(app, "scan_writer", None) is not None:
+        await blocking_executor.run(app.scan_writer.close)
+    predictor = getattr(app, "predictor", None)
+    if hasattr(predictor, "close"):
+        predictor.close()
+    await nasa_client.close()
+    blocking_executor.shutdown()
+    db.close()
 
 @app.get("/")
 async def root():
@@ -66,10 +223,31 @@ async def root():
         "version": "2.0.0"
     }
 
+@app.get("/api/metrics")
+async def metrics():
+    """Runtime metrics for tuning concurrency and caches"""
+    predictor = getattr(app, "predictor", None)
+    return {
+        "status": "ok",
+        "executor": blocking_executor.stats(),
+        "database": db.stats(),
+        "scan_writer": app.scan_writer.stats() if getattr(app, "scan_writer", None) else None,
+        "preprocessing": preprocessing_stats.stats(),
+        "predictor": predictor.stats() if hasattr(predictor, "stats") else None,
+        "phash_index": app.phash_index.stats() if getattr(app, "phash_index", None) else None,
+        "weather_cache": weather_cache.stats(),
+        "geocoder": offline_geocoder.stats(),
+        "nominatim_names": nominatim_names.stats(),
+        "weather_prefetch": weather_prefetcher.stats(),
+        "scan_archive": scan_archiver.stats(),
+        "satellite": nasa_client.stats(),
+    }
+
 # Include routers
 app.include_router(disease.router, prefix="/api/disease", tags=["Disease Detection"])
 app.include_router(weather.router, prefix="/api/weather", tags=["Weather Data"])
 app.include_router(history.router, prefix="/api/history", tags=["History & Satellite"])
+app.include_router(analytics.router, prefix="/api/analytics", tags=["Analytics"])
 
 # Exception handlers
 @app.exception_handler(HTTPException)
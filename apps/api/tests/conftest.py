@@ -0,0 +1,45 @@
+"""
+Shared fixtures. The app's singletons (db, nasa_client, ...) are created at
+import time, so their files are pointed at a throwaway directory before any
+app module is imported.
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+_SCRATCH = tempfile.mkdtemp(prefix="maize-api-tests-")
+os.environ.setdefault("DATABASE_PATH", os.path.join(_SCRATCH, "singleton.db"))
+os.environ.setdefault("ARCHIVE_DIR", os.path.join(_SCRATCH, "archive"))
+os.environ.setdefault("SATELLITE_IMAGE_CACHE_DIR", os.path.join(_SCRATCH, "satellite"))
+os.environ.setdefault("GEONAMES_PATH", os.path.join(_SCRATCH, "missing-cities500.txt"))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.database import DatabaseManager  # noqa: E402
+
+
+@pytest.fixture
+def store(tmp_path):
+    """A fresh DatabaseManager on its own file (archives under tmp_path/archive)."""
+    manager = DatabaseManager(db_path=str(tmp_path / "test.db"), pool_size=2,
+                              archive_dir=str(tmp_path / "archive"))
+    yield manager
+    manager.close()
+
+
+def make_scan(**overrides):
+    """save_scan keyword arguments with sensible defaults."""
+    scan = dict(
+        farmer_id="farmer-1",
+        latitude=-15.4,
+        longitude=28.3,
+        prediction="Healthy",
+        confidence=0.9,
+        all_predictions={"Healthy": 0.9, "Common Rust": 0.1},
+        weather_data=None,
+    )
+    scan.update(overrides)
+    return scan
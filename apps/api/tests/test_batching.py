@@ -0,0 +1,106 @@
+import threading
+from concurrent.futures import Future
+
+import numpy as np
+import pytest
+
+from app.utils.batching import MicroBatcher
+from app.utils.model_loader import LocalPredictor
+
+CLASS_NAMES = ["Healthy", "Common Rust"]
+
+
+class FakeArrayPredictor:
+    """to_array/classify_arrays pair; the array is the image bytes' first byte."""
+
+    def __init__(self, gate=None):
+        self.gate = gate
+        self.batches = []
+
+    def to_array(self, image_bytes):
+        return np.array([image_bytes[0]], dtype=np.float32)
+
+    def classify_arrays(self, arrays):
+        if self.gate is not None:
+            self.gate.wait(1)
+        self.batches.append(len(arrays))
+        return [{"prediction": "Healthy", "value": int(array[0])} for array in arrays]
+
+
+def fixed_batch_predictor(size):
+    """A LocalPredictor with a model that only accepts batches of exactly `size`."""
+    predictor = LocalPredictor.__new__(LocalPredictor)
+    predictor.class_names = CLASS_NAMES
+    predictor._lock = threading.Lock()
+    predictor.fixed_batch_size = size
+    calls = []
+
+    def run(batch):
+        assert batch.shape[0] == size
+        calls.append(batch.shape[0])
+        # Score "Common Rust" higher for odd inputs so each row's result is identifiable
+        odd = batch.reshape(len(batch), -1)[:, 0] % 2
+        return np.stack([1 - odd, odd], axis=1) * 0.8 + 0.1
+
+    predictor._run = run
+    return predictor, calls
+
+
+def test_batches_concurrent_calls():
+    gate = threading.Event()
+    backend = FakeArrayPredictor(gate)
+    batcher = MicroBatcher(backend, max_batch_size=8, max_wait_ms=50)
+    results = []
+    threads = [threading.Thread(target=lambda i=i: results.append(batcher.classify_image_bytes(bytes([i]))))
+               for i in range(4)]
+    for thread in threads:
+        thread.start()
+    gate.set()
+    for thread in threads:
+        thread.join()
+    batcher.close()
+
+    assert sorted(result["value"] for result in results) == [0, 1, 2, 3]
+    assert sum(backend.batches) == 4
+
+
+def test_close_serves_queued_work_and_rejects_new_calls():
+    backend = FakeArrayPredictor()
+    batcher = MicroBatcher(backend, max_batch_size=8, max_wait_ms=1)
+    assert batcher.classify_image_bytes(b"\x05")["value"] == 5
+    batcher.close()
+
+    with pytest.raises(RuntimeError, match="closed"):
+        batcher.classify_image_bytes(b"\x06")
+    batcher.close()  # idempotent
+
+
+def test_close_fails_items_the_worker_never_reached():
+    backend = FakeArrayPredictor()
+    batcher = MicroBatcher(backend, max_batch_size=8, max_wait_ms=1)
+    batcher.close()
+
+    # An item left behind _STOP once the worker has exited
+    future = Future()
+    batcher._closed = False
+    batcher._queue.put((np.zeros(1), future, 0.0))
+    batcher.close()
+    with pytest.raises(RuntimeError, match="closed"):
+        future.result(timeout=1)
+
+
+def test_fixed_batch_model_runs_in_padded_slices():
+    predictor, calls = fixed_batch_predictor(4)
+    arrays = [np.full((2, 2, 3), index, dtype=np.float32) for index in range(6)]
+    results = predictor.classify_arrays(arrays)
+
+    assert calls == [4, 4]
+    assert len(results) == 6
+    assert [result["prediction"] for result in results] == [CLASS_NAMES[index % 2] for index in range(6)]
+
+
+def test_fixed_batch_of_one_runs_per_item():
+    predictor, calls = fixed_batch_predictor(1)
+    results = predictor.classify_arrays([np.full((2, 2, 3), index, dtype=np.float32) for index in range(3)])
+    assert calls == [1, 1, 1]
+    assert [result["prediction"] for result in results] == ["Healthy", "Common Rust", "Healthy"]
@@ -0,0 +1,42 @@
+import pytest
+
+from conftest import make_scan
+
+
+@pytest.fixture
+def edge_store(store):
+    assert store.rtree_enabled
+    store.save_scans([make_scan(timestamp="2024-05-01 10:00:00", latitude=10.1, longitude=20.1)])
+    return store
+
+
+@pytest.mark.parametrize("bbox", [
+    (10.1, 20.1, 10.2, 20.2),  # point on the min corner
+    (10.0, 20.0, 10.1, 20.1),  # point on the max corner
+    (10.1, 20.0, 10.1, 20.2),  # zero-height viewport through the point
+    (10.0, 20.0, 10.2, 20.2),  # strictly inside
+])
+def test_points_on_the_viewport_edge_are_included(edge_store, bbox):
+    points, _ = edge_store.get_scans_in_bbox(*bbox)
+    assert len(points) == 1
+    assert sum(cluster["count"] for cluster in edge_store.get_scan_clusters(*bbox, cell_size=0.05)) == 1
+
+
+@pytest.mark.parametrize("bbox", [
+    (10.100001, 20.0, 10.2, 20.2),
+    (10.0, 20.0, 10.099999, 20.2),
+    (10.0, 20.100001, 10.2, 20.2),
+])
+def test_points_just_outside_are_excluded_by_the_exact_recheck(edge_store, bbox):
+    points, _ = edge_store.get_scans_in_bbox(*bbox)
+    assert points == []
+
+
+def test_farm_on_the_boundary_of_a_scan_retags_it(edge_store):
+    farm = {
+        "type": "Polygon",
+        "coordinates": [[[20.05, 10.05], [20.15, 10.05], [20.15, 10.15], [20.05, 10.15], [20.05, 10.05]]],
+    }
+    assert edge_store.save_farm("farmer-1", "Edge field", farm)
+    farm_id = edge_store.get_farms("farmer-1")[0]["id"]
+    assert len(edge_store.get_history_page(farm_id=farm_id)[0]) == 1
@@ -0,0 +1,148 @@
+import asyncio
+import os
+import threading
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.routers import history
+from app.utils.cache import DiskLRUCache, LRUCache
+from app.utils.satellite import NASASatelliteClient, nasa_client
+
+
+def test_get_returns_contents_and_evicts_least_recently_read(tmp_path):
+    cache = DiskLRUCache(str(tmp_path), max_bytes=10)
+    cache.put("a.png", b"aaaa")
+    cache.put("b.png", b"bbbb")
+    assert cache.get("a.png") == b"aaaa"  # "b.png" is now the least recently read
+    cache.put("c.png", b"cccc")
+
+    assert cache.get("b.png") is None
+    assert not os.path.exists(cache.path("b.png"))
+    assert cache.get("a.png") == b"aaaa" and cache.get("c.png") == b"cccc"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_index_survives_restart_in_read_order(tmp_path):
+    cache = DiskLRUCache(str(tmp_path), max_bytes=100)
+    cache.put("a.png", b"aaaa")
+    cache.put("b.png", b"bbbb")
+    os.utime(cache.path("a.png"), (1, 1))
+    os.utime(cache.path("b.png"), (2, 2))
+
+    restarted = DiskLRUCache(str(tmp_path), max_bytes=8)
+    assert restarted.stats()["files"] == 2
+    restarted.put("c.png", b"cccc")
+    assert restarted.get("a.png") is None
+    assert restarted.get("b.png") == b"bbbb"
+
+
+def test_file_removed_behind_the_index_is_a_miss(tmp_path):
+    cache = DiskLRUCache(str(tmp_path), max_bytes=100)
+    cache.put("a.png", b"aaaa")
+    os.remove(cache.path("a.png"))
+
+    assert cache.get("a.png") is None
+    cache.put("a.png", b"AAAA")
+    assert cache.get("a.png") == b"AAAA"
+    assert cache.stats()["bytes"] == 4
+
+
+def test_reads_never_fail_under_concurrent_eviction(tmp_path):
+    cache = DiskLRUCache(str(tmp_path), max_bytes=64)
+    payload = {f"{index}.png": bytes([index]) * 16 for index in range(32)}
+    errors, stop = [], threading.Event()
+
+    def writer():
+        while not stop.is_set():
+            for name, data in payload.items():
+                cache.put(name, data)
+
+    def reader():
+        while not stop.is_set():
+            for name, data in payload.items():
+                try:
+                    found = cache.get(name)
+                except Exception as e:  # pragma: no cover - the regression being guarded
+                    errors.append(e)
+                    return
+                if found is not None and found != data:
+                    errors.append(AssertionError(f"{name} returned the wrong bytes"))
+
+    threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    threading.Event().wait(0.3)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+
+
+class _ImageResponse:
+    status_code = 200
+    headers = {"content-type": "image/png"}
+    content = b"\x89PNG-tile"
+
+
+def test_satellite_image_is_downloaded_once_and_served_as_bytes(tmp_path):
+    client = NASASatelliteClient(
+        api_key="key", tile_resolution=0.1, timeout_seconds=1, max_connections=1,
+        assets_cache=LRUCache(max_entries=8), image_cache_dir=str(tmp_path), image_cache_max_bytes=1024,
+    )
+    calls = []
+
+    async def fake_get(url, params):
+        calls.append(url)
+        return _ImageResponse()
+
+    client._get = fake_get
+
+    async def run():
+        first = await client.get_image(-15.4, 28.3, "2024-05-01")
+        second = await client.get_image(-15.4, 28.3, "2024-05-01")
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first == second
+    assert first[0] == b"\x89PNG-tile"
+    assert calls == [NASASatelliteClient.IMAGERY_URL]
+
+
+class _HtmlResponse:
+    status_code = 200
+    headers = {"content-type": "text/html"}
+
+    def json(self):
+        raise ValueError("Expecting value: line 1 column 1 (char 0)")
+
+
+def test_non_json_assets_response_is_no_asset(tmp_path):
+    client = NASASatelliteClient(
+        api_key="key", tile_resolution=0.1, timeout_seconds=1, max_connections=1,
+        assets_cache=LRUCache(max_entries=8), image_cache_dir=str(tmp_path), image_cache_max_bytes=1024,
+    )
+
+    async def fake_get(url, params):
+        return _HtmlResponse()
+
+    client._get = fake_get
+    assert asyncio.run(client.get_asset_info(-15.4, 28.3)) is None
+    assert asyncio.run(client.get_image(-15.4, 28.3)) is None
+    assert client.stats()["upstream_errors"] == 2
+    assert client.assets_cache.stats()["size"] == 0
+
+
+def test_matching_etag_is_answered_without_reading_the_image(monkeypatch):
+    app = FastAPI()
+    app.include_router(history.router)
+    http = TestClient(app)
+    reads = []
+    monkeypatch.setattr(nasa_client.image_cache, "get", lambda name: reads.append(name) or b"\x89PNG-tile")
+
+    query = "/satellite/image?lat=-15.4&lon=28.3&date=2024-05-01"
+    first = http.get(query)
+    assert first.status_code == 200 and first.content == b"\x89PNG-tile"
+    revalidated = http.get(query, headers={"If-None-Match": first.headers["etag"]})
+    assert revalidated.status_code == 304
+    assert len(reads) == 1
@@ -0,0 +1,77 @@
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.routers import history
+from conftest import make_scan
+
+
+def square(lon, lat, half):
+    """A closed square ring around (lon, lat); GeoJSON coordinates are [lon, lat]."""
+    return [[lon - half, lat - half], [lon + half, lat - half], [lon + half, lat + half],
+            [lon - half, lat + half], [lon - half, lat - half]]
+
+
+FIELD = {"type": "Polygon", "coordinates": [square(28.5, -15.5, 0.1)]}
+PLOT = {"type": "Polygon", "coordinates": [square(28.5, -15.5, 0.02)]}
+RING = {"type": "Polygon", "coordinates": [square(30.0, -14.0, 0.1), square(30.0, -14.0, 0.05)]}
+
+INVALID = [
+    ["not", "geojson"],
+    {"type": "Polygon"},
+    {"type": "Polygon", "coordinates": "nope"},
+    {"type": "Polygon", "coordinates": [[[28.0, -15.0], [28.1, -15.0]]]},
+    {"type": "Polygon", "coordinates": [square(28.5, -95.0, 0.1)]},
+    {"type": "Polygon", "coordinates": [square(28.5, -15.5, 2.0)]},
+]
+
+
+def farm_ids(store):
+    return {farm["farm_name"]: farm["id"] for farm in store.get_all_farms()}
+
+
+def test_locate_picks_the_smallest_containing_farm_and_honours_holes(store):
+    assert store.save_farm("farmer-1", "Field", FIELD)
+    assert store.save_farm("farmer-1", "Plot", PLOT)
+    assert store.save_farm("farmer-1", "Ring", RING)
+    ids = farm_ids(store)
+
+    index = store.farm_index
+    assert index.locate(-15.45, 28.45) == ids["Field"]
+    assert index.locate(-15.5, 28.5) == ids["Plot"]
+    assert index.locate(-14.08, 30.0) == ids["Ring"]
+    assert index.locate(-14.0, 30.0) is None  # inside the hole
+    assert index.locate(-10.0, 25.0) is None
+    assert index.stats()["farms"] == 3
+
+
+@pytest.mark.parametrize("boundary", INVALID)
+def test_invalid_boundary_is_rejected_before_it_is_stored(store, boundary):
+    with pytest.raises(ValueError):
+        store.save_farm("farmer-1", "Bad", boundary)
+    assert store.get_all_farms() == []
+
+
+def test_unparseable_stored_farm_is_skipped_and_scans_still_save(store):
+    assert store.save_farm("farmer-1", "Field", FIELD)
+    with store._get_connection(write=True) as conn:
+        conn.execute(
+            "INSERT INTO farms (farmer_id, farm_name, boundary_geojson) VALUES (?, ?, ?)",
+            ("farmer-1", "Legacy", json.dumps(["not", "geojson"])),
+        )
+    store.farms_version += 1
+
+    assert store.save_scan(**make_scan(latitude=-15.5, longitude=28.5)) > 0
+    assert store.save_scans([make_scan(latitude=-15.5, longitude=28.5)]) == 1
+    history_page, _ = store.get_history_page(farm_id=farm_ids(store)["Field"], limit=10)
+    assert len(history_page) == 2
+    assert store.farm_index.stats()["skipped"] == 1
+
+
+def test_farm_endpoint_returns_400_for_a_malformed_boundary():
+    app = FastAPI()
+    app.include_router(history.router)
+    response = TestClient(app).post("/farms", json={"farmer_id": "farmer-1", "boundary": ["not", "geojson"]})
+    assert response.status_code == 400
@@ -0,0 +1,121 @@
+import math
+import random
+
+import pytest
+
+from app.utils import weather_helper
+from app.utils.geocoder import EARTH_RADIUS_KM, OfflineGeocoder
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi, dlambda = phi2 - phi1, math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def write_gazetteer(path, places):
+    """GeoNames-style rows: id, name, asciiname, alternatenames, lat, lon, class, code, country."""
+    with open(path, "w", encoding="utf-8") as handle:
+        for index, (name, lat, lon) in enumerate(places):
+            handle.write("\t".join([str(index), name, name, "", str(lat), str(lon), "P", "PPL", "ZM"]) + "\n")
+
+
+@pytest.fixture
+def places():
+    rng = random.Random(7)
+    # Zambia-ish box plus a few points across the antimeridian and near a pole
+    points = [(f"place-{i}", rng.uniform(-18, -8), rng.uniform(22, 34)) for i in range(2000)]
+    points += [("east", 10.0, 179.9), ("west", 10.0, -179.9), ("north", 89.9, 0.0)]
+    return points
+
+
+def test_nearest_matches_brute_force(tmp_path, places):
+    path = tmp_path / "cities.txt"
+    write_gazetteer(path, places)
+    geocoder = OfflineGeocoder(str(path), max_distance_km=20000)
+    assert geocoder.load()
+
+    rng = random.Random(11)
+    queries = [(rng.uniform(-19, -7), rng.uniform(21, 35)) for _ in range(200)]
+    queries += [(10.0, -179.95), (10.0, 179.95), (89.0, 120.0)]
+    for lat, lon in queries:
+        name, distance = geocoder.nearest(lat, lon)
+        expected = min(places, key=lambda place: haversine_km(lat, lon, place[1], place[2]))
+        assert name == expected[0]
+        assert distance == pytest.approx(haversine_km(lat, lon, expected[1], expected[2]), abs=0.01)
+
+
+def test_nearest_respects_max_distance(tmp_path):
+    path = tmp_path / "cities.txt"
+    write_gazetteer(path, [("Lusaka", -15.4167, 28.2833)])
+    geocoder = OfflineGeocoder(str(path), max_distance_km=50)
+    geocoder.load()
+
+    assert geocoder.nearest(-15.5, 28.3)[0] == "Lusaka"
+    assert geocoder.nearest(-12.8, 28.2) is None  # ~290 km north
+    assert geocoder.stats()["misses"] == 1
+
+
+def test_missing_gazetteer_disables_lookups(tmp_path):
+    geocoder = OfflineGeocoder(str(tmp_path / "missing.txt"), max_distance_km=50)
+    assert geocoder.load() is False
+    assert geocoder.nearest(-15.4, 28.3) is None
+
+
+class _Value:
+    def __init__(self, value):
+        self._value = value
+
+    def Value(self):
+        return self._value
+
+
+class _Current:
+    def Variables(self, index):
+        return _Value([24.0, 80.0, 1.5, 0.0, 3.0][index])
+
+
+class _Response:
+    def Current(self):
+        return _Current()
+
+
+class _FakeOpenMeteo:
+    def weather_api(self, url, params):
+        return [_Response() for _ in params["latitude"]]
+
+
+def test_batch_refresh_without_gazetteer_keeps_cached_name(monkeypatch):
+    cell = (-15.4, 28.3)
+    monkeypatch.setattr(weather_helper, "_openmeteo", _FakeOpenMeteo())
+    monkeypatch.setattr(weather_helper, "_nominatim_location_name", lambda lat, lon: None)
+    weather_helper.weather_cache.clear()
+    weather_helper.nominatim_names.clear()
+    assert not weather_helper.offline_geocoder.loaded
+
+    weather_helper.weather_cache.set(("current", cell), {"location_name": "Lusaka"})
+    [weather] = weather_helper.fetch_current_weather_batch([cell])
+    assert weather["location_name"] == "Lusaka"
+    assert weather_helper.weather_cache.get(("current", cell))["location_name"] == "Lusaka"
+
+
+def test_batch_refresh_never_calls_nominatim(monkeypatch):
+    cells = [(-13.0, 28.6), (-14.0, 28.6)]
+    calls = []
+
+    def nominatim(lat, lon):
+        calls.append((lat, lon))
+        return "Ndola"
+
+    monkeypatch.setattr(weather_helper, "_openmeteo", _FakeOpenMeteo())
+    monkeypatch.setattr(weather_helper, "_nominatim_location_name", nominatim)
+    weather_helper.weather_cache.clear()
+    weather_helper.nominatim_names.clear()
+
+    # A single-cell lookup resolves the first cell; the batch reuses that name
+    assert weather_helper.get_location_name(*cells[0]) == "Ndola"
+    first, second = weather_helper.fetch_current_weather_batch(cells)
+    assert first["location_name"] == "Ndola"
+    assert second["location_name"] is None
+    assert calls == [cells[0]]
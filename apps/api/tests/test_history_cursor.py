@@ -0,0 +1,46 @@
+import pytest
+
+from app.utils.database import _decode_cursor, _encode_cursor
+from conftest import make_scan
+
+
+def test_cursor_round_trip():
+    cursor = _encode_cursor("2024-05-01 12:30:00", 123456)
+    assert "=" not in cursor
+    assert _decode_cursor(cursor) == ("2024-05-01 12:30:00", 123456)
+
+
+@pytest.mark.parametrize("cursor", ["not-base64!", "e30", "WyJhIl0", "WyJhIiwgIngiXQ"])
+def test_malformed_cursor_raises_value_error(cursor):
+    # e30 = {}, WyJhIl0 = ["a"], WyJhIiwgIngiXQ = ["a", "x"]
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        _decode_cursor(cursor)
+
+
+def test_pages_walk_every_scan_once_newest_first(store):
+    # Several scans share a timestamp, so ordering has to fall back to id
+    timestamps = ["2024-05-01 10:00:00"] * 4 + ["2024-05-02 09:00:00"] * 3 + ["2024-05-03 08:00:00"]
+    store.save_scans([make_scan(timestamp=ts, farmer_id=f"farmer-{i % 2}") for i, ts in enumerate(timestamps)])
+
+    seen, cursor = [], None
+    while True:
+        page, cursor = store.get_history_page(cursor=cursor, limit=3)
+        seen.extend(page)
+        if cursor is None:
+            break
+
+    assert len(seen) == len(timestamps)
+    assert len({scan["id"] for scan in seen}) == len(timestamps)
+    keys = [(scan["timestamp"], scan["id"]) for scan in seen]
+    assert keys == sorted(keys, reverse=True)
+
+
+def test_cursor_keeps_filters_and_ends_with_none(store):
+    store.save_scans([make_scan(timestamp=f"2024-05-0{day} 10:00:00", farmer_id="farmer-1") for day in range(1, 6)])
+    store.save_scans([make_scan(timestamp="2024-05-03 11:00:00", farmer_id="farmer-2")])
+
+    first, cursor = store.get_history_page(farmer_id="farmer-1", limit=4)
+    assert cursor is not None
+    rest, cursor = store.get_history_page(farmer_id="farmer-1", cursor=cursor, limit=4)
+    assert cursor is None
+    assert [scan["farmer_id"] for scan in first + rest] == ["farmer-1"] * 5
@@ -0,0 +1,106 @@
+import json
+
+from conftest import make_scan
+
+BBOX = (-16.0, 28.0, -15.0, 29.0)
+
+# A square farm around (-15.5, 28.5); GeoJSON coordinates are [lon, lat]
+FARM = {
+    "type": "Polygon",
+    "coordinates": [[[28.4, -15.6], [28.6, -15.6], [28.6, -15.4], [28.4, -15.4], [28.4, -15.6]]],
+}
+
+
+def seed_months(store):
+    """Three scans on each of four days, spread over three months; the older two get archived."""
+    scans = []
+    for day in ("2024-03-10", "2024-04-10", "2024-05-10", "2024-05-20"):
+        for hour in range(3):
+            scans.append(make_scan(timestamp=f"{day} 0{hour}:00:00", latitude=-15.5, longitude=28.5))
+    store.save_scans(scans)
+    store.archive_scans("2024-05-01 00:00:00")
+    assert store.archive_months == ["2024-04", "2024-03"]
+    return len(scans)
+
+
+def hot_count(store):
+    with store._get_connection() as conn:
+        return conn.execute("SELECT COUNT(*) FROM scans").fetchone()[0]
+
+
+def test_bbox_points_include_archives_newest_first(store):
+    total = seed_months(store)
+    assert hot_count(store) == 6
+
+    points, truncated = store.get_scans_in_bbox(*BBOX)
+    assert not truncated
+    assert len(points) == total
+    keys = [(point["timestamp"], point["id"]) for point in points]
+    assert keys == sorted(keys, reverse=True)
+    assert points[-1]["timestamp"].startswith("2024-03-10")
+
+
+def test_bbox_limit_spans_the_hot_archive_boundary(store):
+    seed_months(store)
+    points, truncated = store.get_scans_in_bbox(*BBOX, limit=8)
+    assert truncated
+    # 6 hot scans, then the newest 2 of April
+    assert [point["timestamp"][:10] for point in points] == ["2024-05-20"] * 3 + ["2024-05-10"] * 3 + ["2024-04-10"] * 2
+    assert points[6]["timestamp"] == "2024-04-10 02:00:00"
+
+
+def test_bbox_respects_time_filters_across_partitions(store):
+    seed_months(store)
+    points, _ = store.get_scans_in_bbox(*BBOX, since="2024-04-01 00:00:00", until="2024-05-15 00:00:00")
+    assert sorted({point["timestamp"][:10] for point in points}) == ["2024-04-10", "2024-05-10"]
+
+
+def test_clusters_count_archived_scans(store):
+    total = seed_months(store)
+    clusters = store.get_scan_clusters(*BBOX, cell_size=0.5)
+    assert len(clusters) == 1
+    assert clusters[0]["count"] == total
+    assert clusters[0]["predictions"] == {"Healthy": total}
+
+
+def test_history_cursor_crosses_the_archive_boundary(store):
+    total = seed_months(store)
+    seen, cursor, pages = [], None, 0
+    while True:
+        page, cursor = store.get_history_page(cursor=cursor, limit=5)
+        seen.extend(page)
+        pages += 1
+        if cursor is None:
+            break
+
+    assert pages == 3
+    assert len({scan["id"] for scan in seen}) == total
+    keys = [(scan["timestamp"], scan["id"]) for scan in seen]
+    assert keys == sorted(keys, reverse=True)
+
+
+def test_saving_a_farm_retags_archived_scans(store):
+    total = seed_months(store)
+    assert store.save_farm("farmer-1", "North field", FARM)
+    farm_id = store.get_farms("farmer-1")[0]["id"]
+
+    history, _ = store.get_history_page(farm_id=farm_id, limit=100)
+    assert len(history) == total
+
+    # Moving the boundary away untags them everywhere
+    moved = {"type": "Polygon", "coordinates": [[[30.0, -10.0], [30.1, -10.0], [30.1, -9.9], [30.0, -10.0]]]}
+    assert store.save_farm("farmer-1", "North field", moved)
+    assert store.get_history_page(farm_id=farm_id, limit=100)[0] == []
+
+
+def test_assign_all_scan_farms_tags_archived_scans(store):
+    total = seed_months(store)
+    with store._get_connection(write=True) as conn:
+        conn.execute(
+            "INSERT INTO farms (farmer_id, farm_name, boundary_geojson) VALUES (?, ?, ?)",
+            ("farmer-1", "North field", json.dumps(FARM)),
+        )
+    store.farms_version += 1
+
+    assert store.assign_all_scan_farms(batch_size=2) == total
+    assert store.assign_all_scan_farms() == 0
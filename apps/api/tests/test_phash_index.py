@@ -0,0 +1,129 @@
+import io
+import random
+
+from PIL import Image
+
+from app.routers.disease import _classify_or_reuse
+from app.utils.model_loader import CachedPredictor, inspect_image
+from app.utils.phash_index import PerceptualHashIndex, hamming_distance
+
+RESULT = {"prediction": "Common Rust", "confidence": 0.8, "all_predictions": {"Common Rust": 0.8, "Healthy": 0.2}}
+
+
+def _flip(phash, bits):
+    for bit in bits:
+        phash ^= 1 << bit
+    return phash
+
+
+class FakePredictor:
+    cache_namespace = "test-project:iteration-1"
+
+    def __init__(self):
+        self.calls = 0
+
+    def classify_image_bytes(self, image_bytes):
+        self.calls += 1
+        return dict(RESULT)
+
+
+def _index(store, max_distance=6, ttl_seconds=3600, max_rows=1000):
+    index = PerceptualHashIndex(store, "ns", max_distance=max_distance, ttl_seconds=ttl_seconds, max_rows=max_rows)
+    index.load()
+    return index
+
+
+def test_nearest_finds_hashes_within_max_distance_only(store):
+    index = _index(store)
+    rng = random.Random(7)
+    stored = [rng.getrandbits(64) for _ in range(500)]
+    for phash in stored:
+        index.add(phash, RESULT)
+
+    target = stored[123]
+    # Spread the flips over all four 16-bit chunks, the worst case for multi-index search
+    near = _flip(target, [1, 17, 33, 49, 50, 63])
+    far = _flip(target, [1, 2, 17, 18, 33, 34, 49])
+    assert hamming_distance(target, near) == 6
+
+    match = index.find(near)
+    assert match["near_duplicate"] is True
+    assert match["near_duplicate_distance"] == 6
+    assert match["prediction"] == RESULT["prediction"]
+    assert index.nearest(far) is None or index.nearest(far)[1] <= 6
+
+
+def test_nearest_agrees_with_brute_force(store):
+    index = _index(store, max_distance=8)
+    rng = random.Random(3)
+    stored = [rng.getrandbits(64) for _ in range(300)]
+    for phash in stored:
+        index.add(phash, RESULT)
+
+    for _ in range(200):
+        base = rng.choice(stored)
+        query = _flip(base, rng.sample(range(64), rng.randint(0, 10)))
+        expected = min(hamming_distance(query, phash) for phash in stored)
+        match = index.nearest(query)
+        if expected <= 8:
+            assert match is not None and match[1] == expected
+        else:
+            assert match is None
+
+
+def test_other_namespaces_and_expired_rows_are_pruned_on_load(store):
+    store.save_image_hash("old-iteration", 42, RESULT)
+    store.save_image_hash("ns", 43, RESULT)
+    index = _index(store)
+    assert len(index) == 1
+
+    # ttl 0: every stored row is already expired
+    expired = _index(store, ttl_seconds=0)
+    assert len(expired) == 0
+    assert expired.find(43) is None
+
+
+def test_row_cap_keeps_newest_hashes(store):
+    index = _index(store, max_rows=5)
+    index.PRUNE_EVERY = 10
+    rng = random.Random(11)
+    hashes = [rng.getrandbits(64) for _ in range(10)]
+    for phash in hashes:
+        index.add(phash, RESULT)
+
+    assert len(index) == 5
+    assert index.find(hashes[0]) is None
+    assert index.find(hashes[-1])["near_duplicate_distance"] == 0
+
+
+def test_exact_cache_is_checked_before_the_phash_index(store):
+    backend = FakePredictor()
+    predictor = CachedPredictor(backend, store, max_entries=16, ttl_seconds=3600, max_rows=100)
+    index = _index(store)
+
+    first = _classify_or_reuse(predictor, index, b"image-bytes", 1234)
+    again = _classify_or_reuse(predictor, index, b"image-bytes", 1234)
+    near = _classify_or_reuse(predictor, index, b"other-bytes", _flip(1234, [0]))
+
+    assert first["cached"] is False
+    assert again["cached"] is True and "near_duplicate" not in again
+    assert near["near_duplicate"] is True and near["near_duplicate_distance"] == 1
+    assert backend.calls == 1
+
+
+def _jpeg_with_orientation(orientation):
+    rng = random.Random(5)
+    image = Image.new("RGB", (96, 64))
+    image.putdata([(rng.randrange(256), rng.randrange(256), rng.randrange(256)) for _ in range(96 * 64)])
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=95, exif=exif)
+    return output.getvalue()
+
+
+def test_phash_ignores_whether_normalisation_is_enabled():
+    data = _jpeg_with_orientation(6)  # rotated 90 degrees
+    raw = inspect_image(data)
+    normalised = inspect_image(data, normalize_max_side=512)
+    assert hamming_distance(raw["phash"], normalised["phash"]) <= 4
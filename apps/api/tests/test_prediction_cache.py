@@ -0,0 +1,123 @@
+import threading
+import time
+
+import pytest
+
+from app.utils.cache import LRUCache
+from app.utils.model_loader import CachedPredictor
+
+
+class FakePredictor:
+    def __init__(self, namespace="project:iteration-1", delay=0.0):
+        self.cache_namespace = namespace
+        self.delay = delay
+        self.calls = 0
+
+    def classify_image_bytes(self, image_bytes):
+        self.calls += 1
+        time.sleep(self.delay)
+        return {"prediction": "Healthy", "confidence": 0.9, "all_predictions": {"Healthy": 0.9}}
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "b" is now the least recently used
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_lru_entries_expire_after_ttl():
+    cache = LRUCache(max_entries=10, ttl_seconds=0.05)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl_seconds=60)
+    assert cache.get("a") == 1
+    time.sleep(0.08)
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+
+
+def test_get_or_load_runs_one_loader_for_concurrent_misses():
+    cache = LRUCache(max_entries=10)
+    calls = []
+    release = threading.Event()
+
+    def loader():
+        calls.append(1)
+        release.wait(1)
+        return "value"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_load("key", loader))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == ["value"] * 8
+    assert len(calls) == 1
+    assert cache.stats()["coalesced"] == 7
+
+
+def test_get_or_load_does_not_cache_failures_or_none():
+    cache = LRUCache(max_entries=10)
+
+    def failing():
+        raise RuntimeError("upstream down")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_load("key", failing)
+    assert cache.get_or_load("key", lambda: None) is None
+    assert cache.get_or_load("key", lambda: "value") == "value"
+
+
+def test_cached_predictor_serves_memory_then_database_tier(store):
+    backend = FakePredictor()
+    predictor = CachedPredictor(backend, store, max_entries=16, ttl_seconds=3600, max_rows=100)
+
+    assert predictor.classify_image_bytes(b"leaf")["cached"] is False
+    assert predictor.classify_image_bytes(b"leaf")["cached"] is True
+    assert backend.calls == 1
+
+    # A new process: empty memory tier, same database
+    restarted = CachedPredictor(backend, store, max_entries=16, ttl_seconds=3600, max_rows=100)
+    assert restarted.classify_image_bytes(b"leaf")["cached"] is True
+    assert restarted.stats()["disk_hits"] == 1
+    assert backend.calls == 1
+
+
+def test_new_namespace_purges_old_predictions(store):
+    old = CachedPredictor(FakePredictor("project:iteration-1"), store, max_entries=16, ttl_seconds=3600, max_rows=100)
+    old.classify_image_bytes(b"leaf")
+
+    backend = FakePredictor("project:iteration-2")
+    new = CachedPredictor(backend, store, max_entries=16, ttl_seconds=3600, max_rows=100)
+    assert new.classify_image_bytes(b"leaf")["cached"] is False
+    assert backend.calls == 1
+    with store._get_connection() as conn:
+        namespaces = {row[0] for row in conn.execute("SELECT namespace FROM prediction_cache")}
+    assert namespaces == {"project:iteration-2"}
+
+
+def test_expired_database_entries_are_reclassified(store):
+    backend = FakePredictor()
+    CachedPredictor(backend, store, max_entries=16, ttl_seconds=3600, max_rows=100).classify_image_bytes(b"leaf")
+
+    expired = CachedPredictor(backend, store, max_entries=16, ttl_seconds=0, max_rows=100)
+    assert expired.classify_image_bytes(b"leaf")["cached"] is False
+    assert backend.calls == 2
+
+
+def test_prediction_cache_row_cap(store):
+    backend = FakePredictor()
+    predictor = CachedPredictor(backend, store, max_entries=16, ttl_seconds=3600, max_rows=3)
+    for index in range(6):
+        predictor.classify_image_bytes(f"leaf-{index}".encode())
+    assert store.prune_prediction_cache(backend.cache_namespace, 3600, 3) == 3
+    with store._get_connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM prediction_cache").fetchone()[0] == 3
@@ -0,0 +1,65 @@
+import io
+import random
+
+from PIL import Image
+
+from app.utils.model_loader import inspect_image
+
+
+def _encode(size, fmt, **options):
+    rng = random.Random(1)
+    image = Image.new("RGB", size)
+    image.putdata([(rng.randrange(256), rng.randrange(256), rng.randrange(256)) for _ in range(size[0] * size[1])])
+    output = io.BytesIO()
+    image.save(output, format=fmt, **options)
+    return output.getvalue()
+
+
+def test_large_upload_is_downscaled_and_reencoded():
+    data = _encode((1200, 900), "PNG")
+    info = inspect_image(data, normalize_max_side=512, jpeg_quality=90)
+    assert info["preprocessing"]["reencoded"] is True
+    assert info["preprocessing"]["bytes_saved"] > 0
+    assert max(Image.open(io.BytesIO(info["image_bytes"])).size) == 512
+
+
+def test_upload_is_kept_when_reencoding_would_grow_it():
+    data = _encode((200, 150), "JPEG", quality=30)
+    info = inspect_image(data, normalize_max_side=512, jpeg_quality=95)
+    assert info["preprocessing"]["reencoded"] is False
+    assert info["image_bytes"] == data
+    assert info["preprocessing"]["bytes_saved"] == 0
+
+
+def test_invalid_bytes_are_rejected():
+    assert inspect_image(b"not an image") is None
+
+
+def _with_exif(data, **tags):
+    image = Image.open(io.BytesIO(data))
+    exif = Image.Exif()
+    for tag, value in tags.items():
+        exif[int(tag[1:])] = value
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=30, exif=exif.tobytes())
+    return output.getvalue()
+
+
+def test_small_upload_with_exif_is_still_reencoded():
+    # 0x0112 Orientation (rotate 90), 0x010F camera Make
+    data = _with_exif(_encode((200, 150), "JPEG", quality=30), t274=6, t271="PhoneMaker")
+    info = inspect_image(data, normalize_max_side=512, jpeg_quality=95)
+    assert info["preprocessing"]["reencoded"] is True
+    assert info["preprocessing"]["metadata_stripped"] is True
+    sent = Image.open(io.BytesIO(info["image_bytes"]))
+    assert not sent.getexif()
+    assert sent.size == (150, 200)  # orientation applied
+
+
+def test_small_upload_with_comment_is_reencoded():
+    image = Image.open(io.BytesIO(_encode((200, 150), "JPEG", quality=30)))
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=30, comment=b"farm 12, -15.41 28.28")
+    info = inspect_image(output.getvalue(), normalize_max_side=512, jpeg_quality=95)
+    assert info["preprocessing"]["reencoded"] is True
+    assert b"farm 12" not in info["image_bytes"]
@@ -0,0 +1,123 @@
+import random
+import threading
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.routers import analytics
+from app.utils.geo import geohash_cover, geohash_encode, geohash_intersects
+from conftest import make_scan
+
+ROLLUP_TABLES = ("scan_rollup_days", "scan_rollup_cells", "scan_rollup_farmers")
+
+
+def rollup_snapshot(store):
+    with store._get_connection() as conn:
+        return {
+            table: sorted((*row[:-1], round(row[-1], 6)) for row in conn.execute(f"SELECT * FROM {table}"))
+            for table in ROLLUP_TABLES
+        }
+
+
+def seed(store):
+    scans = []
+    for month in ("2024-03", "2024-04", "2024-05"):
+        for day in (1, 15):
+            for index, prediction in enumerate(("Healthy", "Common Rust", "Healthy")):
+                scans.append(make_scan(
+                    timestamp=f"{month}-{day:02d} 0{index}:00:00",
+                    farmer_id=f"farmer-{index}",
+                    latitude=-15.4 + index * 0.3,
+                    longitude=28.3 + day * 0.01,
+                    prediction=prediction,
+                    confidence=0.5 + index * 0.1,
+                ))
+    store.save_scans(scans)
+
+
+def test_rebuild_matches_incremental_rollups_across_archives(store):
+    seed(store)
+    incremental = rollup_snapshot(store)
+    moved = store.archive_scans("2024-05-01 00:00:00")
+    assert sum(moved.values()) == 12
+
+    counts = store.rebuild_rollups()
+    assert rollup_snapshot(store) == incremental
+    assert counts["cell_rows"] == len(incremental["scan_rollup_cells"])
+    assert counts["farmer_rows"] == len(incremental["scan_rollup_farmers"])
+
+
+def test_rebuild_repairs_drifted_rollups(store):
+    seed(store)
+    store.archive_scans("2024-04-01 00:00:00")
+    expected = rollup_snapshot(store)
+    with store._get_connection(write=True) as conn:
+        conn.execute("UPDATE scan_rollup_days SET scans = scans + 7")
+        conn.execute("DELETE FROM scan_rollup_cells")
+
+    store.rebuild_rollups()
+    assert rollup_snapshot(store) == expected
+    # Staging tables do not outlive the rebuild, and archives were detached
+    with store._get_connection(write=True) as conn:
+        assert not conn.execute("SELECT name FROM temp.sqlite_master WHERE type = 'table'").fetchall()
+        assert "archive" not in {row[1] for row in conn.execute("PRAGMA database_list")}
+
+
+def test_rebuild_is_consistent_with_concurrent_writes(store):
+    seed(store)
+    store.archive_scans("2024-04-01 00:00:00")
+    stop = threading.Event()
+
+    def writer():
+        while not stop.is_set():
+            store.save_scans([make_scan(timestamp="2024-05-20 12:00:00")])
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        for _ in range(5):
+            store.rebuild_rollups()
+    finally:
+        stop.set()
+        thread.join()
+
+    after_writes = rollup_snapshot(store)
+    store.rebuild_rollups()
+    assert rollup_snapshot(store) == after_writes
+
+
+def test_geohash_cover_contains_every_point_of_the_bbox():
+    rng = random.Random(3)
+    for _ in range(200):
+        lat, lon = rng.uniform(-89, 89), rng.uniform(-179, 179)
+        bbox = (lat, lon, min(90.0, lat + rng.uniform(0, 2)), min(180.0, lon + rng.uniform(0, 2)))
+        precision = rng.randint(1, 6)
+        prefixes = geohash_cover(*bbox, precision)
+        assert 0 < len(prefixes) <= 32
+        for _ in range(20):
+            point = (rng.uniform(bbox[0], bbox[2]), rng.uniform(bbox[1], bbox[3]))
+            assert any(geohash_encode(*point, precision).startswith(prefix) for prefix in prefixes)
+
+
+def test_heatmap_bbox_is_filtered_in_sql(store):
+    seed(store)
+    everything = store.get_incidence_heatmap("2024-01-01", "2024-12-31", precision=4)
+    bbox = (-15.5, 28.0, -15.0, 29.0)
+    expected = sorted(cell["geohash"] for cell in everything if geohash_intersects(cell["geohash"], *bbox))
+    assert 0 < len(expected) < len(everything)
+
+    cells = store.get_incidence_heatmap("2024-01-01", "2024-12-31", precision=4, bbox=bbox)
+    assert sorted(cell["geohash"] for cell in cells) == expected
+
+
+@pytest.mark.parametrize("query", [
+    "min_lat=-16",
+    "min_lat=-16&min_lon=28&max_lat=-15",
+    "min_lat=-15&min_lon=28&max_lat=-16&max_lon=29",
+])
+def test_heatmap_rejects_partial_or_inverted_bbox(query):
+    app = FastAPI()
+    app.include_router(analytics.router)
+    response = TestClient(app).get(f"/heatmap?{query}")
+    assert response.status_code == 400
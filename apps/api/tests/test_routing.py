@@ -0,0 +1,129 @@
+import threading
+import time
+
+import pytest
+
+from app.utils.routing import CircuitBreaker, PredictorRouter
+
+
+class FakeBackend:
+    def __init__(self, name, delay=0.0, fail=False):
+        self.cache_namespace = name
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def classify_image_bytes(self, image_bytes):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError(f"{self.cache_namespace} down")
+        return {"prediction": "Healthy", "confidence": 0.9, "all_predictions": {"Healthy": 0.9}}
+
+
+def make_router(*backends, hedge_min_ms=50, hedge_max_ms=100, failure_threshold=3, reset_seconds=60):
+    return PredictorRouter(
+        [(backend.cache_namespace, backend) for backend in backends],
+        hedge_min_ms=hedge_min_ms, hedge_max_ms=hedge_max_ms, latency_window=50,
+        failure_threshold=failure_threshold, reset_seconds=reset_seconds, max_workers=4,
+    )
+
+
+def test_breaker_opens_half_opens_and_closes():
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=0.05)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.available()
+    assert breaker.allow()  # the single half-open trial
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+
+def test_failed_half_open_trial_reopens_breaker():
+    breaker = CircuitBreaker(failure_threshold=5, reset_seconds=0.05)
+    for _ in range(5):
+        breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+
+def test_failover_to_next_backend():
+    broken = FakeBackend("primary", fail=True)
+    healthy = FakeBackend("secondary")
+    router = make_router(broken, healthy)
+    try:
+        result = router.classify_image_bytes(b"leaf")
+        assert result["backend"] == "secondary"
+        assert result["hedged"] is False
+        stats = router.stats()
+        assert stats["failovers"] == 1
+        assert stats["backends"]["primary"]["failures"] == 1
+        assert stats["backends"]["secondary"]["wins"] == 1
+    finally:
+        router.close()
+
+
+def test_open_breaker_skips_backend():
+    broken = FakeBackend("primary", fail=True)
+    healthy = FakeBackend("secondary")
+    router = make_router(broken, healthy, failure_threshold=2)
+    try:
+        for _ in range(3):
+            router.classify_image_bytes(b"leaf")
+        assert broken.calls == 2
+        assert router.stats()["backends"]["primary"]["state"] == CircuitBreaker.OPEN
+    finally:
+        router.close()
+
+
+def test_all_backends_failing_raises_last_error():
+    router = make_router(FakeBackend("a", fail=True), FakeBackend("b", fail=True))
+    try:
+        with pytest.raises(RuntimeError, match="b down"):
+            router.classify_image_bytes(b"leaf")
+    finally:
+        router.close()
+
+
+def test_slow_primary_is_hedged_after_hedge_max():
+    slow = FakeBackend("primary", delay=1.0)
+    fast = FakeBackend("secondary")
+    router = make_router(slow, fast, hedge_min_ms=50, hedge_max_ms=100)
+    try:
+        started = time.monotonic()
+        result = router.classify_image_bytes(b"leaf")
+        elapsed = time.monotonic() - started
+        assert result["backend"] == "secondary"
+        assert result["hedged"] is True
+        # Without enough latency samples the hedge fires at hedge_max_ms
+        assert 0.09 <= elapsed < 0.5
+        assert router.stats()["backends"]["secondary"]["hedges"] == 1
+    finally:
+        router.close()
+
+
+def test_fast_primary_is_not_hedged():
+    primary = FakeBackend("primary")
+    secondary = FakeBackend("secondary")
+    router = make_router(primary, secondary)
+    try:
+        result = router.classify_image_bytes(b"leaf")
+        assert result["backend"] == "primary"
+        assert result["hedged"] is False
+        assert secondary.calls == 0
+    finally:
+        router.close()
@@ -0,0 +1,113 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.utils.scan_writer import ScanWriter, _STOP
+from conftest import make_scan
+
+
+class FakeStore:
+    """save_scans() that fails the first `fail_first` calls and any group containing a bad row."""
+
+    def __init__(self, fail_first=0, gate=None):
+        self.fail_first = fail_first
+        self.gate = gate
+        self.calls = []
+        self.saved = []
+        self._lock = threading.Lock()
+
+    def save_scans(self, scans):
+        if self.gate is not None:
+            self.gate.wait(1)
+        with self._lock:
+            self.calls.append(len(scans))
+            if self.fail_first > 0:
+                self.fail_first -= 1
+                return 0
+            if any(scan["farmer_id"] == "bad" for scan in scans):
+                return 0
+            self.saved.extend(scan["farmer_id"] for scan in scans)
+            return len(scans)
+
+
+def make_writer(store, max_rows=10, max_delay_ms=20):
+    writer = ScanWriter(store, max_rows=max_rows, max_delay_ms=max_delay_ms, max_pending=100,
+                        enqueue_timeout_seconds=1)
+    writer.RETRY_DELAY_SECONDS = 0
+    return writer
+
+
+def enqueue_all(writer, farmer_ids):
+    async def _run():
+        for farmer_id in farmer_ids:
+            assert await writer.enqueue(**make_scan(farmer_id=farmer_id))
+    asyncio.run(_run())
+
+
+def test_failed_flush_is_retried_once():
+    store = FakeStore(fail_first=1)
+    writer = make_writer(store)
+    enqueue_all(writer, ["a", "b", "c"])
+    writer.close()
+
+    assert sorted(store.saved) == ["a", "b", "c"]
+    stats = writer.stats()
+    assert stats["flush_retries"] == 1
+    assert stats["row_fallbacks"] == 0
+    assert stats["rows_written"] == 3 and stats["rows_failed"] == 0
+
+
+def test_bad_row_falls_back_to_row_by_row():
+    store = FakeStore()
+    writer = make_writer(store)
+    enqueue_all(writer, ["a", "bad", "c"])
+    writer.close()
+
+    assert sorted(store.saved) == ["a", "c"]
+    stats = writer.stats()
+    assert stats["row_fallbacks"] == 1
+    assert stats["rows_written"] == 2 and stats["rows_failed"] == 1
+
+
+def test_close_flushes_rows_queued_behind_stop():
+    gate = threading.Event()
+    store = FakeStore(gate=gate)
+    writer = make_writer(store, max_delay_ms=1)
+    enqueue_all(writer, ["a"])
+    time.sleep(0.05)  # the worker is now blocked flushing "a"
+
+    # A late enqueue that landed after the stop marker
+    writer._queue.put(_STOP)
+    writer._queue.put((make_scan(farmer_id="late"), time.perf_counter()))
+    gate.set()
+    writer.close()
+
+    assert sorted(store.saved) == ["a", "late"]
+    assert writer.stats()["pending"] == 0
+
+
+def test_close_waits_for_in_flight_enqueues():
+    store = FakeStore()
+    writer = make_writer(store)
+    writer._enqueuing = 1  # an enqueue past the closed check, not yet queued
+
+    def late_put():
+        time.sleep(0.1)
+        writer._queue.put((make_scan(farmer_id="late"), time.perf_counter()))
+        with writer._lock:
+            writer._enqueuing -= 1
+
+    thread = threading.Thread(target=late_put)
+    thread.start()
+    writer.close()
+    thread.join()
+    assert store.saved == ["late"]
+
+
+def test_enqueue_after_close_raises():
+    writer = make_writer(FakeStore())
+    writer.close()
+    with pytest.raises(RuntimeError, match="closed"):
+        enqueue_all(writer, ["a"])